@@ -2,223 +2,566 @@
 Script to look up a person's birth and death on Wikipedia
 """
 
+import os
 import math
-from datetime import datetime
+import asyncio
 import urllib.parse
-import hashlib
+import pandas as pd
 from prefect import task, flow, get_run_logger
+from prefect.cache_policies import NONE
+from prefect.task_runners import ThreadPoolTaskRunner
 # from prefect.docker import DockerImage
-from utilities.util_slack import death_notification
+from utilities.util_slack import send_death_notification
 from utilities.util_slack import bad_wiki_page
 from utilities.util_snowflake import get_existing_values
-from utilities.util_snowflake import update_rows
+from utilities.util_snowflake import get_reference_values
+from utilities.util_snowflake import invalidate_reference_values
+from utilities.util_snowflake import bulk_update_rows
+from utilities.util_snowflake import add_columns
 from utilities.util_snowflake import get_snowflake_connection
-from utilities.util_twilio import send_sms_via_api
-from utilities.util_wiki import get_wiki_id_from_page
-from utilities.util_wiki import get_birth_death_date
+from utilities.util_twilio import send_sms
+from utilities.util_wiki import get_wiki_ids
+from utilities.util_wiki import get_latest_revids
+from utilities.util_wiki import is_wiki_id, query_birth_death_dates
+from utilities.util_wiki import SPARQL_CHUNK_SIZE
+from utilities.util_dates import calculate_ages
+from utilities.util_hash import fingerprint_rows
+from utilities.util_batch import map_chunks
+from utilities.util_schedule import assign_tiers, checked_at, due_predicate
+from utilities.util_events import NotificationDispatcher
+from utilities.util_pipeline import Checkpoint
+from utilities.util_checkpoint import FileCheckpoint, SnowflakeCheckpoint
+from utilities.util_checkpoint import SnowflakeNotificationJournal
+from utilities.util_blocks import log_block_loads
+from utilities.util_metrics import metrics, publish_metrics
+from utilities.util_profile import profiled_flow
+
+# Degree of parallelism for the roster sweep, set per deployment
+MAX_WORKERS = int(os.getenv("DEADPOOL_MAX_WORKERS", "8"))
+
+# Columns that make up a pick's ROW_HASH fingerprint
+ROW_HASH_COLUMNS = ["NAME", "WIKI_PAGE", "WIKI_ID", "AGE"]
+
+# Columns the sweep keeps on PEOPLE, added once by migrate_people_columns
+PEOPLE_COLUMNS = {
+    "ROW_HASH": "VARCHAR(16)",
+    "LAST_REVID": "NUMBER",
+    "LAST_CHECKED_AT": "TIMESTAMP_NTZ",
+    "WATCH": "BOOLEAN",
+}
+
+
+def normalize_roster(names_to_check):
+    """Clean up the roster columns in one go instead of row by row
 
+    Args:
+        names_to_check (Dataframe): ID, NAME, WIKI_PAGE, WIKI_ID, AGE
+
+    Returns:
+        Dataframe: Copy with stripped names, unquoted pages and empty ids as None
+    """
+    roster = names_to_check.copy()
+
+    # Strip leading and trailing spaces just in case there are in the DB
+    roster["NAME"] = roster["NAME"].str.strip()
+    roster["WIKI_PAGE"] = (
+        roster["WIKI_PAGE"].str.strip().map(urllib.parse.unquote, na_action="ignore")
+    )
+    wiki_ids = roster["WIKI_ID"].str.strip()
+    roster["WIKI_ID"] = wiki_ids.where(wiki_ids.notna() & (wiki_ids != ""), None)
+    roster["LAST_REVID"] = pd.to_numeric(roster["LAST_REVID"], errors="coerce")
 
-# Function to create a hash from given variables
-@task(name="Create Hash")
-def create_hash(name, wiki_page, wiki_id, age):
-    """Creat a hash digest from a given set of strings
+    return roster
+
+
+def edited_picks(roster):
+    """Keep the picks whose Wikipedia page changed since their last check
+
+    Picks without a page, or never checked this way, are always kept.
 
     Args:
-        name (str): Person's name
-        wiki_page (str): Wiki Page Identifier
-        wiki_id (str): Wiki Data Identifier 'Q' number
-        age (int): Age of the person
+        roster (Dataframe): Normalized roster with LAST_REVID
 
     Returns:
-        string: sha256 hash digest value
+        Dataframe: Edited picks, with the page's latest revision in NEW_REVID
     """
-    # Check if 'age' is NaN before converting and using it in the f-string
-    if math.isnan(age):
-        age = 0
-    else:
-        age = int(age)
+    pages = roster["WIKI_PAGE"]
+    revids = get_latest_revids(list(pages.dropna().unique()))
+    latest = pd.to_numeric(pages.map(revids), errors="coerce")
+
+    last = roster["LAST_REVID"]
+    edited = latest.isna() | last.isna() | (latest != last)
+    return roster[edited].assign(NEW_REVID=latest[edited])
 
-    combined_string = f"{name}{wiki_page}{wiki_id}{age}"
-    return hashlib.md5(combined_string.encode()).hexdigest()
 
+def resolve_wiki_ids(roster):
+    """Look up the Wiki ID for every row that doesn't have one yet
 
-@task(name="Calculate Age")
-def get_age(b_date, d_date):
-    """Get the age of the person based on two datetime objects
+    Each distinct page is only resolved once, in batches of 50 titles.
 
     Args:
-        b_date (datetime): Birth Date
-        d_date (datetime): Date of death if exists
+        roster (Dataframe): Normalized roster
 
     Returns:
-        int: The person's age
+        Series: WIKI_ID column with the missing ids filled in
     """
-    if d_date:
-        age = d_date.year - b_date.year
-        if (d_date.month, d_date.day) < (b_date.month, b_date.day):
-            age -= 1
-    else:
-        current_date = datetime.now()
-        age = current_date.year - b_date.year
-        if (current_date.month, current_date.day) < (b_date.month, b_date.day):
-            age -= 1
-    return age
+    missing = roster["WIKI_ID"].isna() & roster["WIKI_PAGE"].notna()
+    pages = list(roster.loc[missing, "WIKI_PAGE"].unique())
+    resolved = get_wiki_ids(pages)
+    filled = roster.loc[missing, "WIKI_PAGE"].map(resolved)
+    return roster["WIKI_ID"].where(~missing, filled)
 
 
-@flow(name="Verify Deadpool Alive or Dead and Age", retries=3, retry_delay_seconds=30)
-def dead_pool_status_check():
-    """Main Flow Logic"""
+def backfill_wiki_ids(connection, roster):
+    """Resolve every missing Wiki ID up front and store them by ID
+
+    One batched resolution for the whole roster and one UPDATE keyed on
+    the primary key, so later runs never resolve the same page again.
+
+    Args:
+        connection (connection): Snowflake Connection
+        roster (Dataframe): Normalized roster
+
+    Returns:
+        Dataframe: Copy of the roster with the resolved ids filled in
+    """
     logger = get_run_logger()
+    missing = roster["WIKI_ID"].isna() & roster["WIKI_PAGE"].notna()
+    if not missing.any():
+        return roster
 
-    connection = get_snowflake_connection("snowflake-dka")
+    wiki_ids = resolve_wiki_ids(roster)
+    found = missing & wiki_ids.notna()
+    logger.info("Resolved %s of %s missing Wiki IDs", found.sum(), missing.sum())
 
-    # Get the full list of people to check
-    # This will skip any person that doesn't have either wiki page or id
-    # and skip anyone who's already dead to avoid processing unknown people
-    names_to_check = get_existing_values(
-        connection,
+    bulk_update_rows(
+        connection=connection,
         database_name="DEADPOOL",
         schema_name="PROD",
-        table_name="PICKS_CURRENT_YEAR",
-        column_name="ID, NAME, WIKI_PAGE, WIKI_ID, AGE",
-        conditionals="WHERE DEATH_DATE IS NULL AND (WIKI_PAGE IS NOT NULL OR WIKI_ID IS NOT NULL)",
-        return_list=False,
+        table_name="PEOPLE",
+        df=pd.DataFrame({"ID": roster.loc[found, "ID"], "WIKI_ID": wiki_ids[found]}),
+        key_column="ID",
     )
+    return roster.assign(WIKI_ID=wiki_ids)
 
-    # Iterate over the list of links to update and build the final DF
-    for index, row in names_to_check.iterrows():
-        people_id = row["ID"]
-        name = row["NAME"]
-        wiki_page = row["WIKI_PAGE"]
-        wiki_id = row["WIKI_ID"]
-        age = row["AGE"]
-
-        # Strip leading and trailing spaces just in case there are in the DB
-        name = name.strip()
-        if wiki_page:
-            wiki_page = wiki_page.strip()
-            wiki_page = urllib.parse.unquote(wiki_page)
-        if wiki_id:
-            wiki_id = wiki_id.strip()
-
-        hash1 = create_hash(name, wiki_page, wiki_id, age)
-
-        # Initialize variables to hold birth and death dates
-        birth_date = None
-        death_date = None
-
-        # Fetch the Wiki ID from Wiki Data if we don't already have it
-        if not wiki_id:
-            wiki_id = get_wiki_id_from_page(wiki_page)
-        logger.info(str(wiki_page) + " : " + str(wiki_id))
-        if wiki_id != "-1":
-            # Get bith and death dates
-            try:
-                birth_date = get_birth_death_date("P569", wiki_id)
-                logger.info("Birth Date: %s", birth_date)
-            except KeyError:
-                logger.info("No Birth Date for: %s", wiki_page)
-                None
-
-            try:
-                death_date = get_birth_death_date("P570", wiki_id)
-                logger.info("Death Date: %s", death_date)
-            except KeyError:
-                logger.info("No Death Date for: %s", wiki_page)
-                None
-
-            if birth_date:
-                # Calculate the person's age
-                age = get_age(birth_date, death_date)
-                logger.info("Age: %s", age)
-
-            # Now conditionally do death dates
-            if death_date:
-                logger.info("Death Date (datetime object): %s", death_date)
-
-                name = name.replace("'", "''")
-                set_string = f"""SET BIRTH_DATE = '{birth_date}', DEATH_DATE = '{death_date}', AGE = {age}, WIKI_ID = '{wiki_id}'"""
-                conditionals = f"""WHERE id = '{people_id}'"""
-                update_rows(
-                    connection=connection,
-                    database_name="DEADPOOL",
-                    schema_name="PROD",
-                    table_name="PEOPLE",
-                    set_string=set_string,
-                    conditionals=conditionals,
-                )
 
-                death_notification(
-                    person=name,
-                    birth_date=birth_date,
-                    death_date=death_date,
-                    age=age,
-                    emoji=":skull_and_crossbones:",
-                )
+DATE_COLUMNS = ["BIRTH_DATE", "BIRTH_PRECISION", "DEATH_DATE", "DEATH_PRECISION"]
 
-                # Send out SMS messages to all Opted in Users
-                sms_to_list = get_existing_values(
-                    connection=connection,
-                    database_name="DEADPOOL",
-                    schema_name="PROD",
-                    table_name="DRAFT_OPTED_IN",
-                    column_name="SMS",
-                )
 
-                sms_message = f"{name} has died at the age {age}."
-                send_sms_via_api(sms_message, sms_to_list)
+def lookup_dates(wiki_ids):
+    """Fetch birth and death dates for every distinct Wiki ID in one SPARQL batch
+
+    Args:
+        wiki_ids (Series): Wiki Data Identifiers, None, "-1" or malformed
+            ones are skipped
+
+    Returns:
+        Dataframe: BIRTH_DATE, BIRTH_PRECISION, DEATH_DATE and DEATH_PRECISION
+        aligned with wiki_ids
+    """
+    unique_ids = [
+        wiki_id for wiki_id in wiki_ids.dropna().unique() if is_wiki_id(wiki_id)
+    ]
+    dates = query_birth_death_dates(unique_ids).set_index("WIKI_ID")
 
-            hash2 = create_hash(name, wiki_page, wiki_id, age)
+    aligned = dates.reindex(wiki_ids.where(wiki_ids.isin(unique_ids)))
+    aligned.index = wiki_ids.index
+    return aligned[DATE_COLUMNS].astype(object).where(aligned.notna(), None)
 
-            # If they're not dead yet, log that
-            if birth_date and not death_date and hash1 != hash2:
-                wiki_page = wiki_page.replace("'", "''")
-                set_string = f"SET BIRTH_DATE = '{birth_date}', AGE = {age}, WIKI_ID = '{wiki_id}'"
-                conditionals = f"WHERE WIKI_PAGE = '{wiki_page}'"
 
-                update_rows(
-                    connection=connection,
-                    database_name="DEADPOOL",
-                    schema_name="PROD",
-                    table_name="PEOPLE",
-                    set_string=set_string,
-                    conditionals=conditionals,
-                )
-            else:
-                logger.info("Skipping DB Write, No values changed.")
+def diff_roster(roster):
+    """Reduce the enriched roster down to the rows that need a write
+
+    Args:
+        roster (Dataframe): Roster with ROW_HASH, NEW_HASH, BIRTH_DATE and DEATH_DATE
+
+    Returns:
+        Dataframe: Everyone who died plus the living whose values changed
+    """
+    dead = roster["DEATH_DATE"].notna()
+    changed = roster["BIRTH_DATE"].notna() & (
+        roster["ROW_HASH"].isna() | (roster["ROW_HASH"] != roster["NEW_HASH"])
+    )
+    return roster[dead | changed]
+
+
+def sweep_chunk_size(picks, workers=None):
+    """One chunk per worker, but no bigger than one SPARQL request
+
+    Args:
+        picks (int): Picks to check
+        workers (int, optional): Defaults to MAX_WORKERS.
+
+    Returns:
+        int: Picks per chunk
+    """
+    workers = workers or MAX_WORKERS
+    return max(1, min(SPARQL_CHUNK_SIZE, math.ceil(picks / workers)))
+
+
+def death_notifiers():
+    """Async Slack and SMS notifiers for death events
+
+    Returns:
+        dict: Notifier name to async callable taking a death event, and the
+        phone number for SMS
+    """
+
+    async def notify_slack(event):
+        await send_death_notification(emoji=":skull_and_crossbones:", **event)
 
-        else:
-            bad_wiki_page(name, wiki_page, ":memo:")
-            logger.info("No valid wiki page for %s", name)
+    async def notify_sms(event, number):
+        sms_message = f"{event['person']} has died at the age {event['age']}."
+        await asyncio.to_thread(send_sms, sms_message, [number])
 
+    return {"slack": notify_slack, "sms": notify_sms}
+
+
+def death_recipients(connection):
+    """Who each list notifier sends a death event to
+
+    Args:
+        connection (connection): Snowflake Connection for the SMS opt in list
+
+    Returns:
+        dict: Notifier name to a callable taking the event
+    """
+
+    def sms_recipients(event):
+        # Send out SMS messages to all Opted in Users, read once per run
+        return get_reference_values(
+            connection=connection,
+            database_name="DEADPOOL",
+            schema_name="PROD",
+            table_name="DRAFT_OPTED_IN",
+            column_name="SMS",
+        )
+
+    return {"sms": sms_recipients}
+
+
+def sweep_checkpoint(kind, connection):
+    """Where checked chunks are recorded so a retry only checks the rest
+
+    Args:
+        kind (str): "file", "snowflake" or "none"
+        connection (connection): Snowflake Connection for the staging table
+
+    Returns:
+        Checkpoint: Keyed on the current flow run id
+    """
+    if kind == "file":
+        return FileCheckpoint("roster-sweep")
+    if kind == "snowflake":
+        return SnowflakeCheckpoint(
+            connection, "roster-sweep", date_columns=["BIRTH_DATE", "DEATH_DATE"]
+        )
+    return Checkpoint()
+
+
+def emit_deaths(dispatcher, chunk):
+    """Queue a notification for everyone in the chunk who has died
+
+    The idempotency key is the pick and their death date, so neither a
+    retried flow nor a later run notifies twice for the same death.
+    """
+    for row in chunk[chunk["DEATH_DATE"].notna()].itertuples(index=False):
+        dispatcher.emit(
+            f"death:{row.ID}:{row.DEATH_DATE:%Y-%m-%d}",
+            {
+                "person": row.NAME,
+                "birth_date": row.BIRTH_DATE,
+                "death_date": row.DEATH_DATE,
+                "age": int(row.AGE) if pd.notna(row.AGE) else None,
+            },
+        )
+
+
+@task(name="Check Roster Chunk", cache_policy=NONE)
+def check_roster_chunk(chunk, dispatcher=None, checkpoint=None):
+    """Look up dates and ages for one chunk of the roster
+
+    Deaths are handed to the notification dispatcher as soon as they're
+    found so the sweep never waits on Slack or Twilio.
+
+    Args:
+        chunk (Dataframe): Roster rows with their Wiki IDs and stored ROW_HASH
+        dispatcher (NotificationDispatcher, optional): Where to emit deaths
+        checkpoint (Checkpoint, optional): Where to record the checked chunk
+
+    Returns:
+        Dataframe: The chunk with BIRTH_DATE, DEATH_DATE, AGE and NEW_HASH
+        filled in
+    """
+    logger = get_run_logger()
+    chunk = chunk.copy()
+
+    # Get bith and death dates and calculate everyone's age
+    chunk[DATE_COLUMNS] = lookup_dates(chunk["WIKI_ID"])
+    new_ages = calculate_ages(
+        chunk["BIRTH_DATE"],
+        chunk["DEATH_DATE"],
+        chunk["BIRTH_PRECISION"],
+        chunk["DEATH_PRECISION"],
+    )
+    chunk["AGE"] = new_ages.where(new_ages.notna(), chunk["AGE"])
+    chunk["NEW_HASH"] = fingerprint_rows(chunk, ROW_HASH_COLUMNS)
+
+    if dispatcher:
+        emit_deaths(dispatcher, chunk)
+    if checkpoint:
+        checkpoint.save(chunk)
+
+    logger.info("Checked %s picks", len(chunk))
+    return chunk
+
+
+@flow(
+    name="Verify Deadpool Alive or Dead and Age",
+    retries=3,
+    retry_delay_seconds=30,
+    task_runner=ThreadPoolTaskRunner(max_workers=MAX_WORKERS),
+)
+@profiled_flow
+def dead_pool_status_check(
+    chunk_size: int | None = None,
+    cadence: str = "daily",
+    checkpoint: str = "file",
+    profile: bool = False,
+):
+    """Main Flow Logic
+
+    Picks are checked as often as their risk tier asks for (see
+    utilities.util_schedule). The due picks are split into chunks that
+    are checked concurrently on the thread pool (DEADPOOL_MAX_WORKERS),
+    then joined for a single write-back. Checked chunks are checkpointed,
+    so a retry of the run only checks the chunks that hadn't finished.
+
+    Args:
+        chunk_size (int, optional): Picks per task run. Defaults to the
+            roster split evenly over the workers, at most one SPARQL
+            request (200 picks) per chunk.
+        cadence (str, optional): "daily" checks every pick due today,
+            "hourly" only the high risk picks whose page was edited and
+            "all" everyone. Defaults to "daily".
+        checkpoint (str, optional): "file", "snowflake" (survives a retry on
+            another worker) or "none". Defaults to "file".
+        profile (bool, optional): Attach a profile of the run as artifacts.
+            Defaults to False.
+    """
+    logger = get_run_logger()
+    metrics.reset()
+
+    # Published however the run ends, early returns and failures included
+    try:
+        connection = get_snowflake_connection("snowflake-dka")
+
+        # Get the people due a check, the tier schedule is evaluated in SQL
+        # This will skip any person that doesn't have either wiki page or id
+        # and skip anyone who's already dead to avoid processing unknown people
+        # The columns come from PEOPLE, the PICKS_CURRENT_YEAR view only picks
+        # who's in this year and doesn't have the migrated columns
+        run_started = checked_at()
+        names_to_check = get_existing_values(
+            connection,
+            database_name="DEADPOOL",
+            schema_name="PROD",
+            table_name="PEOPLE",
+            column_name=(
+                "ID, NAME, WIKI_PAGE, WIKI_ID, AGE, ROW_HASH, LAST_REVID, WATCH"
+            ),
+            conditionals=(
+                "WHERE ID IN (SELECT ID FROM DEADPOOL.PROD.PICKS_CURRENT_YEAR)"
+                " AND DEATH_DATE IS NULL"
+                " AND (WIKI_PAGE IS NOT NULL OR WIKI_ID IS NOT NULL)"
+                f" AND {due_predicate(cadence)}"
+            ),
+            return_list=False,
+        )
+
+        if names_to_check.empty:
+            logger.info("No picks to check.")
+            return
+
+        roster = assign_tiers(normalize_roster(names_to_check))
+        logger.info(
+            "%s picks due by tier: %s", cadence, roster["TIER"].value_counts().to_dict()
+        )
+
+        # Hourly runs only pay for a full check when the page has been edited
+        if cadence == "hourly":
+            roster = edited_picks(roster)
+
+        if roster.empty:
+            logger.info("No picks due.")
+            return
+
+        # Fetch the Wiki IDs from Wiki Data if we don't already have them
+        roster = backfill_wiki_ids(connection, roster)
+
+        # Picks checked by an earlier attempt of this run aren't looked up again
+        store = sweep_checkpoint(checkpoint, connection)
+        done = store.load()
+        checked = []
+        if done is not None:
+            checked.append(done[done["ID"].isin(roster["ID"])])
+            roster = roster[~roster["ID"].isin(done["ID"])]
+            logger.info("Resuming, %s picks already checked", len(checked[0]))
+
+        # Sent keys are also journaled in Snowflake, deaths are notified before
+        # the write-back and a later run would find them again if it failed
+        dispatcher = NotificationDispatcher(
+            death_notifiers(),
+            logger,
+            recipients=death_recipients(connection),
+            journal=SnowflakeNotificationJournal(connection),
+        )
+        dispatcher.start()
+
+        try:
+            # Resend whatever failed in an earlier attempt, per recipient, even
+            # when the write-back has already taken the pick off the roster
+            resent = dispatcher.resend_pending()
+            if resent:
+                logger.info("Resending %s failed notifications", resent)
+
+            # Fan out over the thread pool and join the checked chunks back together
+            if len(roster):
+                checked.extend(
+                    map_chunks(
+                        check_roster_chunk,
+                        roster,
+                        chunk_size or sweep_chunk_size(len(roster)),
+                        dispatcher=dispatcher,
+                        checkpoint=store,
+                    )
+                )
+            roster = pd.concat(checked)
+        finally:
+            # Let any queued notifications finish even if a chunk failed
+            dispatcher.close()
+            # The recipient list is only needed while notifications go out
+            invalidate_reference_values("DEADPOOL", "PROD", "DRAFT_OPTED_IN")
+
+        # Report anyone we couldn't find a valid wiki page for
+        bad_pages = ~roster["WIKI_ID"].map(is_wiki_id).astype(bool)
+        for row in roster[bad_pages].itertuples(index=False):
+            bad_wiki_page(row.NAME, row.WIKI_PAGE, ":memo:")
+            logger.info("No valid wiki page for %s", row.NAME)
+
+        changes = diff_roster(roster[~bad_pages])
+        deaths = changes[changes["DEATH_DATE"].notna()]
+        logger.info(
+            "%s of %s picks changed, %s deaths", len(changes), len(roster), len(deaths)
+        )
+
+        # Single write-back for everything that changed, keyed on ID
+        write_back = changes[
+            ["ID", "BIRTH_DATE", "DEATH_DATE", "AGE", "WIKI_ID"]
+        ].copy()
+        write_back["ROW_HASH"] = changes["NEW_HASH"]
+        bulk_update_rows(
+            connection=connection,
+            database_name="DEADPOOL",
+            schema_name="PROD",
+            table_name="PEOPLE",
+            df=write_back,
+            key_column="ID",
+            column_types={"BIRTH_DATE": "DATE", "DEATH_DATE": "DATE", "AGE": "NUMBER"},
+        )
+
+        # Record when everyone was checked, and at which page revision on
+        # hourly runs, so the next runs only select who's due
+        checked = roster[["ID"]].assign(LAST_CHECKED_AT=run_started)
+        if "NEW_REVID" in roster:
+            checked["LAST_REVID"] = roster["NEW_REVID"]
+        bulk_update_rows(
+            connection=connection,
+            database_name="DEADPOOL",
+            schema_name="PROD",
+            table_name="PEOPLE",
+            df=checked,
+            key_column="ID",
+            column_types={"LAST_CHECKED_AT": "TIMESTAMP_NTZ", "LAST_REVID": "NUMBER"},
+        )
+
+        # Failed notifications are kept in the ledger, not the checkpoint
+        store.clear()
+
+        # Fail the run so its retry resends only what didn't go out
+        if dispatcher.failed:
+            raise RuntimeError(f"Notifications failed: {', '.join(dispatcher.failed)}")
+    finally:
+        log_block_loads()
+        publish_metrics()
+
+
+@flow(name="Add Deadpool Roster Columns")
+def migrate_people_columns():
+    """One-off migration adding PEOPLE_COLUMNS to PEOPLE
+
+    Run it once, with a role that may ALTER PEOPLE, before the first sweep
+    that needs the columns. The sweep itself never changes the schema.
+    """
+    logger = get_run_logger()
+    connection = get_snowflake_connection("snowflake-dka")
+    add_columns(
+        connection,
+        database_name="DEADPOOL",
+        schema_name="PROD",
+        table_name="PEOPLE",
+        columns=PEOPLE_COLUMNS,
+    )
+    logger.info("PEOPLE has %s", ", ".join(PEOPLE_COLUMNS))
+
+
+# Packages the managed pool installs on every run when there's no image
+PIP_PACKAGES = [
+    "prefect[docker]",
+    "prefect-snowflake",
+    "prefect-shell",
+    "prefect-slack",
+    "prefect-github",
+    "prefect-aws",
+    "asyncpg",
+    "twilio",
+    "sendgrid",
+    "SPARQLWrapper",
+    "snowflake-connector-python[pandas]",
+]
 
 # Prefect Managed Work Pool
+# Set DEADPOOL_IMAGE to an image built from the repo Dockerfile to skip the
+# per-run pip install, e.g. DEADPOOL_IMAGE=<registry>/prefect-dka:<git sha>
 if __name__ == "__main__":
-    dead_pool_status_check.from_source(
+    job_variables = {
+        "env": {"PREFECT_LOGGING_LEVEL": "ERROR", "DEADPOOL_MAX_WORKERS": "8"},
+    }
+    if os.getenv("DEADPOOL_IMAGE"):
+        job_variables["image"] = os.getenv("DEADPOOL_IMAGE")
+    else:
+        job_variables["pip_packages"] = PIP_PACKAGES
+
+    remote_flow = dead_pool_status_check.from_source(
         source="https://github.com/broepke/prefect-dka.git",
         entrypoint="deadpool/deadpool.py:dead_pool_status_check",
-    ).deploy(
+    )
+    remote_flow.deploy(
         name="deadpool-managed-deployment",
         work_pool_name="dka-managed-pool",
         work_queue_name="dka-managed-queue",
-        job_variables={
-            "pip_packages": [
-                "prefect[docker]",
-                "prefect-snowflake",
-                "prefect-shell",
-                "prefect-slack",
-                "prefect-github",
-                "prefect-aws",
-                "asyncpg",
-                "twilio",
-                "sendgrid",
-                "SPARQLWrapper",
-                "snowflake-connector-python[pandas]",
-            ],
-            "env": {"PREFECT_LOGGING_LEVEL": "ERROR"},
-        },
+        job_variables=job_variables,
         cron="0 17 * * *",
     )
+    # Revision check of the high risk tier
+    remote_flow.deploy(
+        name="deadpool-hourly-deployment",
+        work_pool_name="dka-managed-pool",
+        work_queue_name="dka-managed-queue",
+        job_variables=job_variables,
+        parameters={"cadence": "hourly"},
+        cron="30 * * * *",
+    )
 
 # ECS Workplool - Currently broken
 # if __name__ == "__main__":
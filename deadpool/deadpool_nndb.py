@@ -1,48 +1,31 @@
 """
 Script to look up a person's birth and death on Wikipedia
 """
-from datetime import datetime
 import urllib.parse
 # import logging
 from prefect import flow, get_run_logger
 from utilities.util_snowflake import get_existing_values
-from utilities.util_snowflake import update_rows
+from utilities.util_snowflake import bulk_update_rows
 from utilities.util_snowflake import get_snowflake_connection
-from utilities.util_wiki import get_birth_death_date
+from utilities.util_wiki import is_wiki_id, query_birth_death_dates
+from utilities.util_dates import calculate_ages
+from utilities.util_cache import LRUCache
+from utilities.util_pipeline import Pipeline
+from utilities.util_checkpoint import FileCheckpoint
+from utilities.util_blocks import log_block_loads
+from utilities.util_metrics import metrics, publish_metrics
+from utilities.util_profile import profiled_flow
 
+DATE_COLUMNS = ["BIRTH_DATE", "BIRTH_PRECISION", "DEATH_DATE", "DEATH_PRECISION"]
 
-def get_age(b_date, d_date):
-    """Get the age of the person based on two datetime objects
-
-    Args:
-        b_date (datetime): Birth Date
-        d_date (datetime): Date of death if exists
-
-    Returns:
-        int: The person's age
-    """
-    if d_date:
-        age = d_date.year - b_date.year
-        if (d_date.month, d_date.day) < (b_date.month, b_date.day):
-            age -= 1
-    else:
-        current_date = datetime.now()
-        age = current_date.year - b_date.year
-        if (current_date.month, current_date.day) < (b_date.month, b_date.day):
-            age -= 1
-    return age
+# Dates by WIKI_ID, shared by every run in the process
+date_cache = LRUCache(maxsize=4096, ttl=3600)
+metrics.track_cache("nndb dates", date_cache)
 
 
-@flow(name="Add Dates to NNDB", retries=3, retry_delay_seconds=30)
-def deadpool_nndb_date_updates():
-    """Main Flow Logic"""
-    logger = get_run_logger()
-    # logger.setLevel(logging.DEBUG)
-
-    connection = get_snowflake_connection("snowflake-dka")
-
-    # Get the full list of people to check
-    names_to_check = get_existing_values(
+def read_people(connection):
+    """Everyone in NNDB_DATES still missing a birth date"""
+    people = get_existing_values(
         connection,
         database_name="DEADPOOL",
         schema_name="PROD",
@@ -52,77 +35,99 @@ def deadpool_nndb_date_updates():
         return_list=False,
     )
 
-    # Iterate over the list of links to update and build the final DF
-    for index, row in names_to_check.iterrows():
-        id = row["ID"]
-        wiki_id = row["WIKI_ID"]
-
-        # Strip leading and trailing spaces just in case there are in the DB
-        id = id.strip()
-        wiki_id = wiki_id.strip()
-        wiki_id = urllib.parse.unquote(wiki_id)
-
-        # Initialize variables to hold birth and death dates
-        birth_date = None
-        death_date = None
-
-        logger.info(str(wiki_id))
-        if wiki_id != "-1":
-            try:
-                # Get bith and death dates
-                birth_date = get_birth_death_date("P569", wiki_id)
-                logger.info("Birth Date: %s", birth_date)
-
-                try:
-                    death_date = get_birth_death_date("P570", wiki_id)
-                    logger.info("Death Date: %s", death_date)
-                except Exception as e:
-                    logger.info("No Death Date for: %s code: %s", wiki_id, e)
-                    None
-
-                if birth_date:
-                    # Calculate the person's age
-                    age = get_age(birth_date, death_date)
-                    logger.info("Age: %s", age)
-
-                # Now conditionally do death dates
-                if death_date:
-                    logger.info("Death Date (datetime object): %s", death_date)
-
-                    set_string = f"""SET BIRTH_DATE = '{birth_date}',
-                    DEATH_DATE = '{death_date}', \
-                    AGE = {age}, WIKI_ID = '{wiki_id}'"""
-                    conditionals = f"""WHERE id = '{id}'
-                    """
-                    update_rows(
-                        connection=connection,
-                        database_name="DEADPOOL",
-                        schema_name="PROD",
-                        table_name="NNDB_DATES",
-                        set_string=set_string,
-                        conditionals=conditionals,
-                    )
-
-                # If they're not dead yet, log that
-                if birth_date and not death_date:
-                    set_string = f"SET BIRTH_DATE = '{birth_date}', \
-                        AGE = {age}, WIKI_ID = '{wiki_id}'"
-                    conditionals = f"WHERE id = '{id}'"
-
-                    update_rows(
-                        connection=connection,
-                        database_name="DEADPOOL",
-                        schema_name="PROD",
-                        table_name="NNDB_DATES",
-                        set_string=set_string,
-                        conditionals=conditionals,
-                    )
-            except Exception as e:
-                logger.info("No Birth Date Found %s with error: %s",
-                            wiki_id, e
-                            )
-        else:
-            logger.info("No valid wiki page for %s", wiki_id)
+    # Strip leading and trailing spaces just in case there are in the DB
+    people["ID"] = people["ID"].str.strip()
+    people["WIKI_ID"] = (
+        people["WIKI_ID"].str.strip().map(urllib.parse.unquote, na_action="ignore")
+    )
+    return people
+
+
+def lookup_dates(batch):
+    """Birth and death dates and ages for a batch, one SPARQL request"""
+    batch = batch.copy()
+    valid = [wiki_id for wiki_id in batch["WIKI_ID"].unique() if is_wiki_id(wiki_id)]
+
+    dates = query_birth_death_dates(valid).set_index("WIKI_ID")
+    aligned = dates.reindex(batch["WIKI_ID"])
+    for column in DATE_COLUMNS:
+        batch[column] = aligned[column].to_numpy()
+
+    batch["AGE"] = calculate_ages(
+        batch["BIRTH_DATE"],
+        batch["DEATH_DATE"],
+        batch["BIRTH_PRECISION"],
+        batch["DEATH_PRECISION"],
+    )
+    return batch
+
+
+def write_dates(connection, dates):
+    """Write back dates, never clearing a death date for the living"""
+    update = {
+        "connection": connection,
+        "database_name": "DEADPOOL",
+        "schema_name": "PROD",
+        "table_name": "NNDB_DATES",
+        "key_column": "ID",
+        "column_types": {"BIRTH_DATE": "DATE", "DEATH_DATE": "DATE", "AGE": "NUMBER"},
+    }
+    dead = dates["DEATH_DATE"].notna()
+
+    written = bulk_update_rows(
+        df=dates.loc[dead, ["ID", "BIRTH_DATE", "DEATH_DATE", "AGE", "WIKI_ID"]],
+        **update,
+    )
+    written += bulk_update_rows(
+        df=dates.loc[~dead, ["ID", "BIRTH_DATE", "AGE", "WIKI_ID"]],
+        **update,
+    )
+    return written
+
+
+@flow(name="Add Dates to NNDB", retries=3, retry_delay_seconds=30)
+@profiled_flow
+def deadpool_nndb_date_updates(
+    batch_size: int = 200, max_workers: int = 4, profile: bool = False
+):
+    """Main Flow Logic
+
+    Args:
+        batch_size (int, optional): People per SPARQL request. Defaults to 200.
+        max_workers (int, optional): Concurrent requests. Defaults to 4.
+        profile (bool, optional): Attach a profile of the run as artifacts.
+            Defaults to False.
+    """
+    logger = get_run_logger()
+    # logger.setLevel(logging.DEBUG)
+    metrics.reset()
+
+    # Published however the run ends, early returns and failures included
+    try:
+        connection = get_snowflake_connection("snowflake-dka")
+
+        pipeline = Pipeline(
+            name="NNDB dates",
+            source=lambda: read_people(connection),
+            enrich=lookup_dates,
+            # Only people we found a birth date for are written back
+            diff=lambda df: df[df["BIRTH_DATE"].notna()],
+            sink=lambda df: write_dates(connection, df),
+            key_column="ID",
+            batch_size=batch_size,
+            max_workers=max_workers,
+            cache=date_cache,
+            cache_column="WIKI_ID",
+            # A retry of the run only looks up the batches that hadn't finished
+            checkpoint=FileCheckpoint("nndb-dates"),
+        )
+        stats = pipeline.run()
+
+        if not stats["changed"]:
+            logger.info("No new dates found.")
+    finally:
+        log_block_loads()
+        publish_metrics(key="nndb-dependency-metrics")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,76 @@
+"""
+Exercise the async arbiter client against a local stub endpoint: a fast
+answer, a memoized repeat, and a slow answer that blows the budget.
+"""
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from prefect.blocks.system import Secret
+from utilities import util_apify
+from utilities.util_blocks import block_cache
+
+SLOW_SECONDS = 3
+requests_seen = []
+
+
+class StubArbiter(BaseHTTPRequestHandler):
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        requests_seen.append(body["question"])
+
+        if "slow" in body["question"]:
+            time.sleep(SLOW_SECONDS)
+
+        payload = json.dumps({"text": f"The Arbiter says: {body['question']}"})
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.end_headers()
+        self.wfile.write(payload.encode())
+
+    def log_message(self, *args):
+        pass
+
+
+server = ThreadingHTTPServer(("127.0.0.1", 0), StubArbiter)
+threading.Thread(target=server.serve_forever, daemon=True).start()
+
+# Seed the block cache so no Prefect API is needed
+block_cache.set(
+    ("Secret", "apify-base-api"),
+    Secret(value=f"http://127.0.0.1:{server.server_port}/arbiter"),
+)
+block_cache.set(("Secret", "apify-base-bearer"), Secret(value="Bearer stub"))
+
+answer = util_apify.the_arbiter("Tina Turner has died", budget=2)
+print(answer)
+assert answer == "The Arbiter says: Tina Turner has died"
+
+# Same prompt again is served from memory
+assert util_apify.the_arbiter("Tina Turner has died", budget=2) == answer
+assert requests_seen == ["Tina Turner has died"], "Prompt was not memoized"
+
+# A slow answer falls back within the budget
+start = time.perf_counter()
+answer = util_apify.the_arbiter("slow news", budget=0.5, fallback="slow news")
+elapsed = time.perf_counter() - start
+print(f"Fell back after {elapsed:.2f}s: {answer}")
+assert answer == "slow news"
+assert elapsed < 1, "Budget was not enforced"
+assert util_apify.arbiter_cache.get("slow news") is None, "Fallback was cached"
+
+
+# Several prompts at once share the budget instead of queueing behind it
+async def many():
+    return await asyncio.gather(
+        *(util_apify.ask_the_arbiter(f"pick {i}", budget=2) for i in range(10))
+    )
+
+start = time.perf_counter()
+answers = asyncio.run(many())
+assert answers == [f"The Arbiter says: pick {i}" for i in range(10)]
+print(f"10 concurrent prompts in {time.perf_counter() - start:.2f}s")
+
+server.shutdown()
+print("All arbiter checks passed")
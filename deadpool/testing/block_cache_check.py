@@ -0,0 +1,54 @@
+"""
+Check the process block cache: one API load per block, TTL expiry,
+explicit refresh and the per-run load counter. Uses a fake block type
+so no Prefect API is needed.
+"""
+import time
+from utilities import util_blocks
+from utilities.util_cache import LRUCache
+
+api_calls = []
+
+
+class FakeBlock:
+    def __init__(self, name):
+        self.name = name
+
+    @classmethod
+    def load(cls, name, **kwargs):
+        api_calls.append(name)
+        return cls(name)
+
+    def get(self):
+        return f"secret for {self.name}"
+
+
+util_blocks.Secret = FakeBlock
+
+# Several deaths' worth of notifications in one run
+for _ in range(5):
+    util_blocks.load_block(FakeBlock, "slack-notifications")
+    util_blocks.get_secret("twilio-sid")
+    util_blocks.get_secret("twilio-token")
+
+assert api_calls == ["slack-notifications", "twilio-sid", "twilio-token"]
+assert util_blocks.block_load_count() == 3
+print(f"15 loads, {util_blocks.block_load_count()} API calls")
+
+# Explicit refresh of one block, then of everything
+util_blocks.get_secret("twilio-sid", refresh=True)
+assert api_calls[-1] == "twilio-sid" and len(api_calls) == 4
+util_blocks.refresh_blocks()
+util_blocks.load_block(FakeBlock, "slack-notifications")
+assert len(api_calls) == 5
+
+# Expired entries are loaded again
+util_blocks.block_cache = LRUCache(maxsize=8, ttl=0.1)
+util_blocks.get_secret("twilio-from")
+util_blocks.get_secret("twilio-from")
+time.sleep(0.15)
+util_blocks.get_secret("twilio-from")
+assert api_calls[-2:] == ["twilio-from", "twilio-from"] and len(api_calls) == 7
+
+print(f"Block loads this process: {util_blocks.block_load_count()}")
+print("All block cache checks passed")
@@ -0,0 +1,94 @@
+"""
+Check the retry loop and the half-open circuit breaker in util_http
+
+- An exhausted request_json doesn't sleep after its last attempt.
+- Once the reset timeout has passed, only one of many concurrent callers
+  gets through as the probe. A failed probe opens the circuit again and
+  a successful one closes it.
+
+    python -m deadpool.testing.circuit_breaker_check
+"""
+import threading
+import time
+from prefect import flow
+from deadpool.testing.replay import Traffic, intercept
+from utilities.util_http import (
+    CircuitBreaker,
+    CircuitOpenError,
+    ServiceUnavailableError,
+    request_json,
+)
+
+RETRY_AFTER = 0.5
+
+
+class Unavailable:
+    def respond(self, method, url, body, send):
+        return 503, {"Retry-After": str(RETRY_AFTER)}, "{}"
+
+
+@flow(name="Retry Loop Check")
+def check_no_final_sleep():
+    traffic = Traffic(Unavailable())
+    start = time.perf_counter()
+    with intercept(traffic):
+        try:
+            request_json("https://unavailable.example/api", retries=3)
+        except ServiceUnavailableError:
+            pass
+        else:
+            raise AssertionError("Expected ServiceUnavailableError")
+    elapsed = time.perf_counter() - start
+
+    assert traffic.requests["unavailable.example"] == 3, traffic.requests
+    # Two waits between three attempts, none after the last
+    assert 2 * RETRY_AFTER <= elapsed < 3 * RETRY_AFTER, elapsed
+    print(f"Retry loop OK: 3 attempts in {elapsed:.2f}s")
+
+
+def probes(breaker, callers=8):
+    """How many of the concurrent callers the breaker lets through"""
+    passed = []
+    barrier = threading.Barrier(callers)
+
+    def call():
+        barrier.wait()
+        try:
+            breaker.check("host")
+            passed.append(True)
+        except CircuitOpenError:
+            pass
+
+    threads = [threading.Thread(target=call) for _ in range(callers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return len(passed)
+
+
+def check_half_open():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.05)
+    breaker.record_failure()
+    breaker.record_failure()
+    assert probes(breaker) == 0, "Open circuit let a call through"
+
+    time.sleep(0.06)
+    assert probes(breaker) == 1, "Half open circuit let more than one probe through"
+    assert probes(breaker) == 0, "Second probe while the first is in flight"
+
+    # A failed probe opens the circuit again straight away
+    breaker.record_failure()
+    assert probes(breaker) == 0
+    time.sleep(0.06)
+    assert probes(breaker) == 1
+
+    # A successful probe closes it
+    breaker.record_success()
+    assert probes(breaker) == 8
+    print("Circuit breaker OK: one probe at a time")
+
+
+if __name__ == "__main__":
+    check_no_final_sleep()
+    check_half_open()
@@ -0,0 +1,108 @@
+"""
+Check dedupe_dataframe with a membership index against the fake Snowflake
+
+The first load builds the index from a full read of the column and
+stores it in the table's stage. Deduping a batch then only reads the
+probable hits back for exact verification, matches plain isin, and
+after the new rows are written and added to the index, a reload is a
+COUNT(*) and HASH_AGG plus a GET instead of a full read. Rows written
+behind the index's back trigger a rebuild, even when they leave the row
+count unchanged. NULLs count as rows but are never members.
+
+    python -m deadpool.testing.dedupe_check
+"""
+import numpy as np
+import pandas as pd
+from prefect import flow
+from deadpool.testing.fake_snowflake import FakeSnowflakeConnection
+from utilities.util_data import dedupe_dataframe
+from utilities.util_membership import MembershipIndex
+from utilities.util_snowflake import (
+    get_matching_values,
+    load_membership_index,
+    save_membership_index,
+)
+
+TABLE = ("FX", "SCRAPES", "COMPANIES", "COMPANY_NAME")
+HISTORY = 50_000
+
+
+def full_reads(connection):
+    return sum(
+        statement.startswith("SELECT COMPANY_NAME FROM")
+        for statement in connection.statements
+    )
+
+
+@flow(name="Dedupe Check")
+def dedupe_check():
+    connection = FakeSnowflakeConnection()
+    history = [f"Company {i}" for i in range(HISTORY)]
+    connection.seed("COMPANIES", pd.DataFrame({"COMPANY_NAME": history}))
+
+    verified = []
+
+    def verify(values):
+        verified.extend(values)
+        return get_matching_values.fn(connection, *TABLE, values)
+
+    index = load_membership_index(connection, *TABLE)
+    assert full_reads(connection) == 1 and len(index) == HISTORY
+
+    scrape = pd.DataFrame(
+        {"COMPANY_NAME": [f"Company {i}" for i in range(HISTORY - 1000, HISTORY + 1000)]}
+    )
+    new = dedupe_dataframe(None, scrape, "COMPANY_NAME", index=index, verify=verify)
+    expected = dedupe_dataframe(history, scrape, "COMPANY_NAME")
+    assert new.equals(expected), "Index dedupe differs from isin"
+    assert len(verified) == 1000, f"{len(verified)} values verified, expected the 1000 hits"
+    first_verify = len(verified)
+
+    # Write the new rows, keep the index in step and store it
+    new.to_sql("COMPANIES", connection.db, if_exists="append", index=False)
+    index.add(new["COMPANY_NAME"])
+    save_membership_index(connection, *TABLE, index)
+
+    index = load_membership_index(connection, *TABLE)
+    assert full_reads(connection) == 1, "Reloading a current index read the column"
+    again = dedupe_dataframe(None, scrape, "COMPANY_NAME", index=index, verify=verify)
+    assert again.empty, f"{len(again)} rows not deduped after the upload"
+
+    # Rows written without updating the index make it stale
+    pd.DataFrame({"COMPANY_NAME": ["Sneaky Co"]}).to_sql(
+        "COMPANIES", connection.db, if_exists="append", index=False
+    )
+    index = load_membership_index(connection, *TABLE)
+    assert full_reads(connection) == 2 and index.contains(["Sneaky Co"]).all()
+
+    # So does swapping a row for another, though the row count is the same
+    with connection.lock:
+        connection.db.execute("DELETE FROM COMPANIES WHERE COMPANY_NAME = 'Company 0'")
+        connection.db.execute("INSERT INTO COMPANIES VALUES ('Swapped Co')")
+        connection.db.commit()
+    index = load_membership_index(connection, *TABLE)
+    assert full_reads(connection) == 3, "Swapped row not noticed"
+    assert index.contains(["Swapped Co"]).all()
+    assert not index.contains(["Company 0"]).any()
+
+    print(
+        f"Dedupe OK: {len(new)} new of {len(scrape)}, {first_verify} values verified "
+        f"instead of reading {HISTORY} titles, index "
+        f"{len(connection.stages[next(iter(connection.stages))]) / 1024:.0f} KiB"
+    )
+
+
+def check_nulls():
+    index = MembershipIndex.from_values(["Company 0", None, np.nan])
+    assert index.rows == 3 and len(index) == 1, (index.rows, len(index))
+    found = index.contains(["None", "nan", None, np.nan, pd.NA, "Company 0"])
+    assert found.tolist() == [False] * 5 + [True], found
+    index.add([None, "Company 1"])
+    assert index.rows == 5 and len(index) == 2
+    assert not index.contains(["None"]).any()
+    print("Nulls OK: counted as rows, never members")
+
+
+if __name__ == "__main__":
+    dedupe_check()
+    check_nulls()
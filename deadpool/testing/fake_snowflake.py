@@ -0,0 +1,178 @@
+"""
+Fake Snowflake connection backed by SQLite
+
+Speaks just enough of the SQL the utilities send (DEADPOOL.PROD names,
+%s parameters, ::TYPE casts, UPDATE ... FROM VALUES, ADD COLUMN IF
+NOT EXISTS, HASH, HASH_AGG and PUT/GET to stages) for the flows to run offline,
+and counts every statement.
+
+PICKS_CURRENT_YEAR is a view over PEOPLE, so write-backs show up in the
+next read. Like the Snowflake view it has a fixed column list and
+doesn't gain the columns added to PEOPLE later.
+"""
+import os
+import re
+import sqlite3
+import threading
+import zlib
+from collections import Counter
+import numpy as np
+import pandas as pd
+
+# View name to the table it reads and the columns it was created with
+VIEWS = {
+    "PICKS_CURRENT_YEAR": (
+        "PEOPLE",
+        ["ID", "NAME", "WIKI_PAGE", "WIKI_ID", "AGE", "BIRTH_DATE", "DEATH_DATE"],
+    ),
+}
+
+for numpy_type in (np.int64, np.int32):
+    sqlite3.register_adapter(numpy_type, int)
+sqlite3.register_adapter(np.float64, float)
+sqlite3.register_adapter(pd.Timestamp, lambda value: value.isoformat())
+
+ADD_COLUMN = re.compile(
+    r"ALTER TABLE (\w+) ADD COLUMN IF NOT EXISTS (\w+) (.+)", re.IGNORECASE
+)
+PUT = re.compile(r"PUT '?file://([^' ]+)'? (@\S+)", re.IGNORECASE)
+GET = re.compile(r"GET (@\S+) '?file://([^' ]+)'?", re.IGNORECASE)
+
+
+def translate(statement):
+    """Rewrite a Snowflake statement into SQLite"""
+    statement = re.sub(r"\b\w+\.\w+\.(\w+)\b", r"\1", statement)
+    statement = re.sub(r"::\w+(\(\d+(,\s*\d+)?\))?", "", statement)
+    statement = statement.replace("%s", "?")
+
+    # Snowflake takes FROM VALUES bare, SQLite wants it as a subquery
+    if "FROM VALUES" in statement:
+        statement = statement.replace("FROM VALUES ", "FROM (VALUES ")
+        statement = statement.replace(") AS source", ")) AS source")
+
+    return statement
+
+
+class HashAgg:
+    """Snowflake's HASH_AGG, any order independent hash of the values will do"""
+
+    def __init__(self):
+        self.total = 0
+
+    def step(self, value):
+        self.total = (self.total + zlib.crc32(str(value).encode())) % 2**63
+
+    def finalize(self):
+        return self.total
+
+
+class FakeCursor:
+    def __init__(self, connection):
+        self.connection = connection
+        self.result = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def execute(self, statement, params=None):
+        self.connection.record(statement)
+        if self.connection.transfer(statement):
+            return
+        statement = translate(statement)
+
+        with self.connection.lock:
+            add_column = ADD_COLUMN.match(statement.strip())
+            if add_column:
+                self.connection.add_column(*add_column.groups())
+                return
+
+            cursor = self.connection.db.execute(statement, params or [])
+            if cursor.description:
+                columns = [column[0] for column in cursor.description]
+                self.result = pd.DataFrame(cursor.fetchall(), columns=columns)
+            self.connection.db.commit()
+
+    def fetch_pandas_all(self):
+        return self.result
+
+
+class FakeSnowflakeConnection:
+    """SQLite stand-in for a Snowflake connection
+
+    Args:
+        path (str, optional): SQLite file. Defaults to an in-memory database.
+    """
+
+    def __init__(self, path=":memory:"):
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        # Snowflake's HASH, any stable integer hash will do here
+        self.db.create_function(
+            "HASH", 1, lambda value: zlib.crc32(str(value).encode()), deterministic=True
+        )
+        self.db.create_aggregate("HASH_AGG", 1, HashAgg)
+        self.lock = threading.Lock()
+        self.statements = []
+        # Stage files, "@stage/folder/name" to their bytes
+        self.stages = {}
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def close(self):
+        self.db.close()
+
+    def is_closed(self):
+        return False
+
+    def record(self, statement):
+        with self.lock:
+            self.statements.append(statement)
+
+    def transfer(self, statement):
+        """Handle a PUT or GET against the in-memory stages"""
+        put, get = PUT.match(statement), GET.match(statement)
+        if put:
+            path, stage = put.groups()
+            with open(path, "rb") as f:
+                self.stages[f"{stage.rstrip('/')}/{os.path.basename(path)}"] = f.read()
+        elif get and get.group(1) in self.stages:
+            stage_path, directory = get.groups()
+            with open(os.path.join(directory, os.path.basename(stage_path)), "wb") as f:
+                f.write(self.stages[stage_path])
+        return bool(put or get)
+
+    def statement_counts(self):
+        """Statements run so far by leading keyword, e.g. SELECT or UPDATE"""
+        return Counter(statement.split(None, 1)[0].upper() for statement in self.statements)
+
+    def add_column(self, table_name, column_name, column_type):
+        columns = [row[1] for row in self.db.execute(f"PRAGMA table_info({table_name})")]
+        if column_name not in columns:
+            self.db.execute(
+                f"ALTER TABLE {table_name} ADD COLUMN {column_name} {column_type}"
+            )
+
+    def seed(self, table_name, df):
+        """Replace a table with the rows of a DataFrame, and create its views"""
+        with self.lock:
+            df.to_sql(table_name, self.db, if_exists="replace", index=False)
+            for view_name, (view_table, columns) in VIEWS.items():
+                if view_table == table_name:
+                    self.db.execute(f"DROP VIEW IF EXISTS {view_name}")
+                    self.db.execute(
+                        f"CREATE VIEW {view_name} AS SELECT "
+                        f"{', '.join(c for c in columns if c in df)} FROM {table_name}"
+                    )
+
+
+class FakeSnowflakeConnector:
+    """Stands in for the SnowflakeConnector block in the block cache"""
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def get_connection(self):
+        return self.connection
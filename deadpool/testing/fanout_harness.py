@@ -0,0 +1,191 @@
+"""
+Deterministic harness for the fanned-out deadpool sweep
+
+Runs dead_pool_status_check against a fake Snowflake connection and a
+fake Wikidata layer with a fixed per-call latency, once with a single
+worker and once with several. Both runs must write back the same rows
+and send the same notifications, and with several workers the date
+lookups, from the first one starting to the last one finishing, must
+take at most 1 / MIN_SPEEDUP of the serial time per worker.
+
+    python -m deadpool.testing.fanout_harness 200 8
+"""
+import asyncio
+import sys
+import threading
+import time
+from datetime import datetime
+import pandas as pd
+from prefect.task_runners import ThreadPoolTaskRunner
+import deadpool.deadpool as deadpool
+import utilities.util_events as util_events
+
+PICKS = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+WORKERS = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+LATENCY = 0.2  # Seconds per fake lookup, well above the task overhead
+# Seconds per fake notification, kept small so draining the notification
+# queue at the end doesn't drown out the lookup fan-out being measured
+NOTIFY_LATENCY = 0.01
+# Share of the ideal WORKERS-fold speedup the lookups must reach
+MIN_SPEEDUP = 0.6
+
+# Chunk the roster for WORKERS, the way the flow does for its pool size
+deadpool.MAX_WORKERS = WORKERS
+
+
+def build_roster(picks):
+    """Every 50th pick is dead, every 10th is missing its WIKI_ID"""
+    return pd.DataFrame(
+        {
+            "ID": [str(i) for i in range(picks)],
+            "NAME": [f"Person {i} " for i in range(picks)],
+            "WIKI_PAGE": [f"Person_{i}" for i in range(picks)],
+            "WIKI_ID": [None if i % 10 == 0 else f"Q{i}" for i in range(picks)],
+            "AGE": [float(60 + i % 40) for i in range(picks)],
+            "ROW_HASH": [None] * picks,
+            "LAST_REVID": [None] * picks,
+            "WATCH": [None] * picks,
+        }
+    )
+
+
+class FakeCursor:
+    def __init__(self, connection):
+        self.connection = connection
+        self.result = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def execute(self, statement, params=None):
+        with self.connection.lock:
+            self.connection.statements.append((statement, params))
+        if "PICKS_CURRENT_YEAR" in statement:
+            self.result = self.connection.roster
+        elif "DRAFT_OPTED_IN" in statement:
+            self.result = pd.DataFrame({"SMS": ["+10000000000"]})
+
+    def fetch_pandas_all(self):
+        return self.result
+
+
+class FakeConnection:
+    def __init__(self, roster):
+        self.roster = roster
+        self.statements = []
+        self.lock = threading.Lock()
+
+    def cursor(self):
+        return FakeCursor(self)
+
+
+class FakeWiki:
+    def __init__(self):
+        self.calls = 0
+        self.lookups = []
+        self.lock = threading.Lock()
+
+    def lookup_span(self):
+        """Seconds from the first date lookup starting to the last finishing"""
+        return max(end for _, end in self.lookups) - min(start for start, _ in self.lookups)
+
+    def _call(self):
+        with self.lock:
+            self.calls += 1
+        time.sleep(LATENCY)
+
+    def get_wiki_ids(self, page_titles):
+        self._call()
+        return {title: "Q" + title.split("_")[-1] for title in page_titles}
+
+    def query_birth_death_dates(self, entity_ids, chunk_size=200):
+        start = time.perf_counter()
+        self._call()
+        with self.lock:
+            self.lookups.append((start, time.perf_counter()))
+        rows = []
+        for entity_id in entity_ids:
+            number = int(entity_id[1:])
+            rows.append(
+                {
+                    "WIKI_ID": entity_id,
+                    "BIRTH_DATE": datetime(1930 + number % 50, 1 + number % 12, 1 + number % 28),
+                    "BIRTH_PRECISION": 11,
+                    "DEATH_DATE": datetime(2026, 1, 1) if number % 50 == 0 else None,
+                    "DEATH_PRECISION": 11 if number % 50 == 0 else None,
+                }
+            )
+        return pd.DataFrame(rows, columns=["WIKI_ID"] + deadpool.DATE_COLUMNS, dtype=object)
+
+
+def run_sweep(workers):
+    connection = FakeConnection(build_roster(PICKS))
+    wiki = FakeWiki()
+    notifications = []
+
+    deadpool.get_snowflake_connection = lambda block_name: connection
+    deadpool.get_wiki_ids = wiki.get_wiki_ids
+    deadpool.query_birth_death_dates = wiki.query_birth_death_dates
+
+    async def send_death_notification(person, **kwargs):
+        await asyncio.sleep(NOTIFY_LATENCY)
+        notifications.append(person)
+
+    def send_sms(message, to_list):
+        time.sleep(NOTIFY_LATENCY)
+        notifications.append(message)
+
+    # Fresh ledger so each run sends its own notifications
+    util_events.process_ledger = util_events.NotificationLedger()
+    deadpool.send_death_notification = send_death_notification
+    deadpool.send_sms = send_sms
+    deadpool.bad_wiki_page = lambda *args: notifications.append(args[0])
+
+    sweep = deadpool.dead_pool_status_check.with_options(
+        retries=0, task_runner=ThreadPoolTaskRunner(max_workers=workers)
+    )
+
+    start = time.perf_counter()
+    sweep(cadence="all")
+    elapsed = time.perf_counter() - start
+
+    # The LAST_CHECKED_AT update carries the run's time, leave it out
+    updates = [
+        params
+        for statement, params in connection.statements
+        if "UPDATE" in statement and "LAST_CHECKED_AT" not in statement
+    ]
+    recipient_reads = [s for s, params in connection.statements if "DRAFT_OPTED_IN" in s]
+    assert len(recipient_reads) <= 1, "Recipient list read more than once in a run"
+    return elapsed, wiki, updates, sorted(notifications)
+
+
+# Warm up so the first timed run doesn't carry Prefect start-up cost
+run_sweep(WORKERS)
+
+serial_time, serial_wiki, serial_updates, serial_notes = run_sweep(1)
+fanout_time, fanout_wiki, fanout_updates, fanout_notes = run_sweep(WORKERS)
+lookup_speedup = serial_wiki.lookup_span() / fanout_wiki.lookup_span()
+
+assert serial_wiki.calls == fanout_wiki.calls, "Different number of network calls"
+assert serial_updates == fanout_updates, "Different write-back"
+assert serial_notes == fanout_notes, "Different notifications"
+# One Wiki ID backfill for the roster, then one write-back of the changes
+assert len(serial_updates) == 2, "Expected a backfill and a single write-back"
+# The flow sizes one chunk per worker, so the lookups should all overlap
+expected = MIN_SPEEDUP * min(WORKERS, len(fanout_wiki.lookups))
+assert lookup_speedup >= expected, (
+    f"Lookups only {lookup_speedup:.1f}x faster with {WORKERS} workers, "
+    f"expected {expected:.1f}x"
+)
+
+print()
+print(f"Picks: {PICKS}, fake network calls: {serial_wiki.calls}")
+print(f"1 worker:  {serial_time:.2f}s")
+print(f"{WORKERS} workers: {fanout_time:.2f}s ({serial_time / fanout_time:.1f}x)")
+print(f"Date lookups: {lookup_speedup:.1f}x faster over {len(fanout_wiki.lookups)} chunks")
+print(f"Notifications: {len(serial_notes)}, update statements: {len(serial_updates)}")
+print()
@@ -0,0 +1,63 @@
+"""
+Import-time check for the deadpool flows
+
+Imports each flow module in a fresh interpreter under python -X importtime,
+prints the slowest top-level imports and peak memory, and fails if any of
+the heavy client libraries that should only load on first use are pulled
+in at import time.
+
+    python -m deadpool.testing.import_time_check
+"""
+import subprocess
+import sys
+
+MODULES = ["deadpool.deadpool", "deadpool.deadpool_nndb"]
+
+# Only needed once a connection is made or a notification is sent
+LAZY = [
+    "twilio",
+    "prefect_slack",
+    "prefect_snowflake",
+    "snowflake.connector",
+    "SPARQLWrapper",
+    "fuzzywuzzy",
+    "tldextract",
+    "whois",
+]
+
+PEAK_RSS = "import resource; print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)"
+
+
+def import_times(module):
+    """Return {module: cumulative microseconds} and peak RSS in KiB"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}; {PEAK_RSS}"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        times[name.strip()] = int(cumulative)
+
+    return times, int(result.stdout.strip().splitlines()[-1])
+
+
+failures = []
+for module in MODULES:
+    times, peak_rss = import_times(module)
+    print(f"{module}: {times[module] / 1e6:.2f}s, peak RSS {peak_rss / 1024:.0f} MiB")
+
+    for name, micros in sorted(times.items(), key=lambda item: -item[1])[:8]:
+        print(f"  {micros / 1e6:6.2f}s  {name}")
+
+    loaded = [name for name in LAZY if name in times]
+    if loaded:
+        failures.append(f"{module} imports {', '.join(loaded)} eagerly")
+
+assert not failures, "; ".join(failures)
+print("No heavy client libraries imported eagerly")
@@ -0,0 +1,93 @@
+"""
+Check that a retried sweep resends only the notifications that failed
+
+Twilio rejects one recipient's texts on the first attempt. The flow
+fails, its retry resends just those texts (the other recipient and
+Slack aren't notified twice) even though the write-back has already
+taken the dead picks off the roster and there's no checkpoint.
+
+Then a run whose write-back fails on every attempt is followed by a new
+run, with a fresh process ledger, that finds the same deaths again: the
+notification journal in Snowflake keeps it from sending them twice.
+
+    python -m deadpool.testing.notify_retry_check
+"""
+from collections import Counter
+from urllib.parse import parse_qs
+import deadpool.deadpool as deadpool
+from deadpool.testing.replay import SINKS, Traffic, fake_snowflake, run_sweep, service_for
+from deadpool.testing.sweep_benchmark import SyntheticWiki, people_table, synthetic_tables
+
+PICKS = 100
+FLAKY_NUMBER = "+15550000002"
+
+
+class FlakyTwilio(SyntheticWiki):
+    """Answers like SyntheticWiki, Twilio fails each first text to FLAKY_NUMBER"""
+
+    def __init__(self):
+        self.attempts = Counter()
+        self.texts = Counter()
+
+    def respond(self, method, url, body, send):
+        if service_for(url) != "twilio":
+            return super().respond(method, url, body, send)
+
+        form = parse_qs(body if isinstance(body, str) else body.decode())
+        number, text = form["To"][0], form["Body"][0]
+        self.attempts[number, text] += 1
+        if number == FLAKY_NUMBER and self.attempts[number, text] == 1:
+            return 500, {}, "{}"
+        self.texts[number] += 1
+        return SINKS["twilio"]
+
+
+def check():
+    connection = fake_snowflake(synthetic_tables(PICKS))
+    responder = FlakyTwilio()
+    traffic = Traffic(responder)
+    run_sweep(traffic, connection, retries=1, checkpoint="none")
+
+    deaths = int(people_table(connection)["DEATH_DATE"].notna().sum())
+    assert deaths, "No deaths to notify"
+    assert responder.texts == {"+15550000001": deaths, FLAKY_NUMBER: deaths}, responder.texts
+    assert traffic.requests["slack"] == deaths, traffic.requests
+    print(f"Retry OK: {deaths} deaths, texts {dict(responder.texts)}")
+
+
+def check_failed_write_back():
+    connection = fake_snowflake(synthetic_tables(PICKS))
+    responder = FlakyTwilio()
+    traffic = Traffic(responder)
+    bulk_update_rows = deadpool.bulk_update_rows
+
+    def failing_write_back(df, **kwargs):
+        if "DEATH_DATE" in df:
+            raise RuntimeError("Write-back failed")
+        return bulk_update_rows(df=df, **kwargs)
+
+    deadpool.bulk_update_rows = failing_write_back
+    try:
+        run_sweep(traffic, connection, retries=1, checkpoint="none")
+    except RuntimeError as e:
+        assert "Write-back failed" in str(e), e
+    else:
+        raise AssertionError("The write-back didn't fail")
+    finally:
+        deadpool.bulk_update_rows = bulk_update_rows
+
+    first = dict(traffic.requests)
+    assert not people_table(connection)["DEATH_DATE"].notna().any(), "Deaths written"
+    run_sweep(traffic, connection, checkpoint="none")
+
+    deaths = int(people_table(connection)["DEATH_DATE"].notna().sum())
+    assert deaths, "No deaths to notify"
+    assert responder.texts == {"+15550000001": deaths, FLAKY_NUMBER: deaths}, responder.texts
+    assert traffic.requests["slack"] == deaths, traffic.requests
+    slack = traffic.requests["slack"]
+    print(f"Journal OK: {deaths} deaths, slack {first['slack']} then {slack}")
+
+
+if __name__ == "__main__":
+    check()
+    check_failed_write_back()
@@ -0,0 +1,138 @@
+"""
+Check the pipeline engine: batching, bounded concurrency, caching,
+incremental flushes and resuming from a checkpoint, then run the NNDB
+flow on it against the fake Snowflake and synthetic Wikidata.
+
+    python -m deadpool.testing.pipeline_check
+"""
+import threading
+import time
+import pandas as pd
+from prefect import flow
+from utilities.util_cache import LRUCache
+from utilities.util_pipeline import Checkpoint, Pipeline
+from deadpool.testing.replay import Traffic, fake_snowflake, intercept, offline_blocks
+from deadpool.testing.sweep_benchmark import SyntheticWiki
+
+
+class MemoryCheckpoint(Checkpoint):
+    def __init__(self):
+        self.saved = []
+
+    def load(self):
+        return pd.concat(self.saved) if self.saved else None
+
+    def save(self, enriched):
+        self.saved.append(enriched)
+
+    def clear(self):
+        self.saved = []
+
+
+class FakeService:
+    """Doubles a number, slowly, and remembers how busy it got"""
+
+    def __init__(self, fail_after=None):
+        self.calls = 0
+        self.rows = 0
+        self.active = 0
+        self.peak = 0
+        self.fail_after = fail_after
+        self.lock = threading.Lock()
+
+    def enrich(self, batch):
+        with self.lock:
+            if self.fail_after is not None and self.calls >= self.fail_after:
+                raise RuntimeError("service went away")
+            self.calls += 1
+            self.rows += len(batch)
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        time.sleep(0.02)
+        with self.lock:
+            self.active -= 1
+        return batch.assign(DOUBLE=batch["VALUE"] * 2)
+
+
+def source():
+    return pd.DataFrame({"ID": [str(i) for i in range(100)], "VALUE": range(100)})
+
+
+@flow(name="Pipeline Check")
+def run_pipeline(service, written, **kwargs):
+    return Pipeline(
+        name="check",
+        source=source,
+        enrich=service.enrich,
+        diff=lambda df: df[df["VALUE"] % 2 == 0],
+        sink=lambda df: written.append(df) or len(df),
+        batch_size=10,
+        max_workers=2,
+        **kwargs,
+    ).run()
+
+
+def check_engine():
+    service, written = FakeService(), []
+    stats = run_pipeline(service, written, flush_rows=20)
+    assert service.calls == 10 and service.peak <= 2, vars(service)
+    assert stats["changed"] == stats["written"] == 50, stats
+    assert len(written) > 1, "flush_rows should write incrementally"
+    assert (pd.concat(written)["DOUBLE"] == pd.concat(written)["VALUE"] * 2).all()
+
+    # A second run answers everything from the cache
+    cache, service = LRUCache(), FakeService()
+    run_pipeline(service, [], cache=cache)
+    run_pipeline(service, [], cache=cache)
+    assert service.rows == 100, f"{service.rows} rows enriched, expected 100"
+
+    # A failed run resumes from its checkpoint and only enriches the rest
+    checkpoint, written = MemoryCheckpoint(), []
+    try:
+        run_pipeline(FakeService(fail_after=4), written, checkpoint=checkpoint)
+    except RuntimeError:
+        pass
+    done = sum(len(batch) for batch in checkpoint.saved)
+    assert 0 < done < 100 and not written, done
+
+    service = FakeService()
+    stats = run_pipeline(service, written, checkpoint=checkpoint)
+    assert stats["resumed"] == done and service.rows == 100 - done, stats
+    assert stats["written"] == 50 and not checkpoint.saved, stats
+    print(f"Pipeline engine OK, resumed {done} rows after a failure")
+
+
+def check_nndb():
+    import deadpool.deadpool_nndb as nndb
+
+    people = [
+        {"ID": str(i), "WIKI_ID": "-1" if i % 7 == 0 else f"Q{i}", "BIRTH_DATE": None,
+         "DEATH_DATE": None, "AGE": None}
+        for i in range(1, 501)
+    ]
+    # A NULL WIKI_ID is skipped like any other bad id
+    people.append(
+        {"ID": "501", "WIKI_ID": None, "BIRTH_DATE": None, "DEATH_DATE": None, "AGE": None}
+    )
+    connection = fake_snowflake({"NNDB_DATES": people})
+    offline_blocks(connection)
+    traffic = Traffic(SyntheticWiki())
+
+    with intercept(traffic):
+        nndb.deadpool_nndb_date_updates.with_options(retries=0)(batch_size=100)
+
+    dates = pd.read_sql("SELECT * FROM NNDB_DATES", connection.db)
+    found = dates["BIRTH_DATE"].notna()
+    assert found.sum() == 500 - 500 // 7, found.sum()
+    assert dates.loc[found, "AGE"].notna().all()
+    deaths = dates["DEATH_DATE"].notna().sum()
+    assert deaths == 9, f"{deaths} deaths, expected every 50th with a valid id"
+    print(
+        f"NNDB flow OK: {found.sum()} dates, {dict(traffic.requests)}, "
+        f"{dict(connection.statement_counts())}"
+    )
+
+
+if __name__ == "__main__":
+    check_engine()
+    check_nndb()
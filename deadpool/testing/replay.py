@@ -0,0 +1,356 @@
+"""
+Record/replay harness for the deadpool flows
+
+Intercepts every HTTP request made through requests (Wikidata, Wikipedia,
+the Enterprise API and Twilio) and every Slack webhook send, and either
+records it to a cassette or answers it from one. Slack and Twilio are
+never called for real, their payloads are recorded with a canned
+success. Snowflake is replaced by a SQLite database seeded from the
+roster snapshot kept in the cassette, so nothing is ever written to prod.
+
+Record reads against the live services, then replay them offline:
+
+    python -m deadpool.testing.replay record deadpool/testing/cassettes/sweep.json
+    python -m deadpool.testing.replay replay deadpool/testing/cassettes/sweep.json
+"""
+import asyncio
+import hashlib
+import json
+import re
+import sys
+import threading
+import time
+from collections import Counter, defaultdict, deque
+from contextlib import contextmanager
+from datetime import datetime
+from urllib.parse import parse_qs, urlencode, urlsplit
+import pandas as pd
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from slack_sdk.webhook import WebhookClient, WebhookResponse
+from slack_sdk.webhook.async_client import AsyncWebhookClient
+from prefect.blocks.system import Secret
+from prefect_slack import SlackWebhook
+from prefect_snowflake.database import SnowflakeConnector
+from utilities import util_blocks
+from deadpool.testing.fake_snowflake import (
+    FakeSnowflakeConnection,
+    FakeSnowflakeConnector,
+)
+
+SERVICES = {
+    "www.wikidata.org": "wikidata",
+    "query.wikidata.org": "wikidata",
+    "en.wikipedia.org": "wikipedia",
+    "api.enterprise.wikimedia.com": "enterprise",
+    "auth.enterprise.wikimedia.com": "enterprise",
+    "api.twilio.com": "twilio",
+    "hooks.slack.com": "slack",
+}
+
+# Outbound notifications, never sent for real while recording
+SINKS = {
+    "slack": (200, {}, "ok"),
+    "twilio": (
+        201,
+        {"Content-Type": "application/json"},
+        json.dumps({"sid": "SMreplay", "status": "queued"}),
+    ),
+}
+
+# Request bodies that carry credentials are left out of the match key
+UNKEYED_BODIES = {"auth.enterprise.wikimedia.com"}
+
+SECRET_FIELDS = re.compile(r'"(access_token|refresh_token|id_token)":\s*"[^"]*"')
+
+
+def service_for(url):
+    return SERVICES.get(urlsplit(url).netloc, urlsplit(url).netloc)
+
+
+def request_key(method, url, body):
+    """Match key for a request: method, URL with sorted params and body digest"""
+    parts = urlsplit(url)
+    query = urlencode(sorted(parse_qs(parts.query).items()), doseq=True)
+
+    if parts.netloc in UNKEYED_BODIES or not body:
+        digest = "-"
+    else:
+        if isinstance(body, str):
+            body = body.encode()
+        digest = hashlib.blake2b(body, digest_size=8).hexdigest()
+
+    return f"{method} {parts.scheme}://{parts.netloc}{parts.path}?{query} {digest}"
+
+
+class Cassette:
+    """Recorded interactions plus the Snowflake tables the run started from
+
+    On replay, repeated identical requests are answered in recorded order,
+    and the last answer repeats once they run out.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.interactions = []
+        self.tables = {}
+        self._queues = defaultdict(deque)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path):
+        cassette = cls(path)
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        cassette.tables = data["tables"]
+        for interaction in data["interactions"]:
+            cassette.add(interaction)
+        return cassette
+
+    def add(self, interaction):
+        with self._lock:
+            self.interactions.append(interaction)
+            self._queues[interaction["key"]].append(interaction)
+
+    def record(self, method, url, body, status, headers, text):
+        self.add(
+            {
+                "key": request_key(method, url, body),
+                "service": service_for(url),
+                "status": status,
+                "headers": {"Content-Type": headers.get("Content-Type", "")},
+                "body": SECRET_FIELDS.sub(r'"\1": "REDACTED"', text),
+            }
+        )
+
+    def play(self, method, url, body):
+        key = request_key(method, url, body)
+        with self._lock:
+            queue = self._queues.get(key)
+            if not queue:
+                raise LookupError(f"No recorded interaction for {key}")
+            return queue.popleft() if len(queue) > 1 else queue[0]
+
+    def save(self):
+        with open(self.path, "w", encoding="utf-8") as f:
+            json.dump(
+                {"tables": self.tables, "interactions": self.interactions},
+                f,
+                indent=1,
+                default=str,
+            )
+
+
+class Recorder:
+    """Send reads to the live services and write everything to a cassette
+
+    Args:
+        cassette (Cassette): Where to record
+        live (optional): Responder to record from instead of the network
+    """
+
+    def __init__(self, cassette, live=None):
+        self.cassette = cassette
+        self.live = live
+
+    def respond(self, method, url, body, send):
+        service = service_for(url)
+        if service in SINKS:
+            status, headers, text = SINKS[service]
+        elif self.live:
+            status, headers, text = self.live.respond(method, url, body, send)
+        else:
+            status, headers, text = send()
+        self.cassette.record(method, url, body, status, headers, text)
+        return status, headers, text
+
+
+class Player:
+    """Answer every request from a cassette"""
+
+    def __init__(self, cassette):
+        self.cassette = cassette
+
+    def respond(self, method, url, body, send):
+        interaction = self.cassette.play(method, url, body)
+        return interaction["status"], interaction["headers"], interaction["body"]
+
+
+class Traffic:
+    """Route intercepted requests to a responder and count them per service
+
+    Args:
+        responder: Object with respond(method, url, body, send)
+        latency (float, optional): Seconds added to every request, to stand
+            in for the network on replay. Defaults to 0.
+    """
+
+    def __init__(self, responder, latency=0):
+        self.responder = responder
+        self.latency = latency
+        self.requests = Counter()
+        self.bytes = Counter()
+        self._lock = threading.Lock()
+
+    def handle(self, method, url, body, send):
+        if self.latency:
+            time.sleep(self.latency)
+        status, headers, text = self.responder.respond(method, url, body, send)
+        with self._lock:
+            self.requests[service_for(url)] += 1
+            self.bytes[service_for(url)] += len(text)
+        return status, headers, text
+
+
+def _requests_response(request, status, headers, text):
+    response = requests.Response()
+    response.status_code = status
+    response.headers = CaseInsensitiveDict(headers)
+    response._content = text.encode()
+    response.encoding = "utf-8"
+    response.url = request.url
+    response.request = request
+    return response
+
+
+def _webhook_body(text, blocks):
+    return json.dumps({"text": text, "blocks": blocks}, sort_keys=True, default=str)
+
+
+@contextmanager
+def intercept(traffic):
+    """Patch requests and the Slack webhook clients to go through traffic"""
+    adapter_send = HTTPAdapter.send
+    sync_send = WebhookClient.send
+    async_send = AsyncWebhookClient.send
+
+    def send(adapter, request, **kwargs):
+        def live():
+            response = adapter_send(adapter, request, **kwargs)
+            return response.status_code, dict(response.headers), response.text
+
+        status, headers, text = traffic.handle(
+            request.method, request.url, request.body, live
+        )
+        return _requests_response(request, status, headers, text)
+
+    def slack_send(client, text=None, blocks=None, **kwargs):
+        status, headers, body = traffic.handle(
+            "POST", client.url, _webhook_body(text, blocks), None
+        )
+        return WebhookResponse(
+            url=client.url, status_code=status, body=body, headers=headers
+        )
+
+    async def async_slack_send(client, text=None, blocks=None, **kwargs):
+        return await asyncio.to_thread(slack_send, client, text, blocks)
+
+    HTTPAdapter.send = send
+    WebhookClient.send = slack_send
+    AsyncWebhookClient.send = async_slack_send
+    try:
+        yield traffic
+    finally:
+        HTTPAdapter.send = adapter_send
+        WebhookClient.send = sync_send
+        AsyncWebhookClient.send = async_send
+
+
+def offline_blocks(connection):
+    """Seed the block cache so no Prefect blocks or real credentials are loaded"""
+    cache = util_blocks.block_cache
+    cache.set(
+        (SnowflakeConnector.__name__, "snowflake-dka"),
+        FakeSnowflakeConnector(connection),
+    )
+    cache.set(
+        (SlackWebhook.__name__, "slack-notifications"),
+        SlackWebhook(url="https://hooks.slack.com/services/REPLAY"),
+    )
+    for name, value in {
+        "twilio-sid": "AC00000000000000000000000000000000",
+        "twilio-token": "replay",
+        "twilio-from": "+10000000000",
+    }.items():
+        cache.set((Secret.__name__, name), Secret(value=value))
+
+
+def fake_snowflake(tables):
+    """SQLite connection seeded with {table: list of row dicts}"""
+    connection = FakeSnowflakeConnection()
+    for table_name, rows in tables.items():
+        connection.seed(table_name, pd.DataFrame(rows))
+    return connection
+
+
+def snapshot_tables(block_name="snowflake-dka"):
+    """Read the roster and an anonymized opt in list from the real Snowflake"""
+    from utilities.util_snowflake import get_existing_values, get_snowflake_connection
+
+    connection = get_snowflake_connection.fn(block_name)
+    people = get_existing_values.fn(
+        connection,
+        "DEADPOOL",
+        "PROD",
+        "PEOPLE",
+        "ID, NAME, WIKI_PAGE, WIKI_ID, AGE, ROW_HASH, BIRTH_DATE, DEATH_DATE",
+        conditionals=(
+            "WHERE ID IN (SELECT ID FROM DEADPOOL.PROD.PICKS_CURRENT_YEAR)"
+            " AND DEATH_DATE IS NULL"
+        ),
+        return_list=False,
+    )
+    recipients = get_existing_values.fn(
+        connection, "DEADPOOL", "PROD", "DRAFT_OPTED_IN", "SMS"
+    )
+    return {
+        "PEOPLE": people.astype(object).where(people.notna(), None).to_dict("records"),
+        "DRAFT_OPTED_IN": [
+            {"SMS": f"+1555{i:07d}"} for i in range(len(recipients))
+        ],
+    }
+
+
+def run_sweep(traffic, connection, retries=0, cadence="all", **flow_kwargs):
+    """Run dead_pool_status_check offline, return the elapsed seconds"""
+    import deadpool.deadpool as deadpool
+    from utilities import util_events
+
+    offline_blocks(connection)
+    util_events.process_ledger = util_events.NotificationLedger()
+    # The one-off migration, applied directly so it isn't counted as the sweep's
+    for column_name, column_type in deadpool.PEOPLE_COLUMNS.items():
+        connection.add_column("PEOPLE", column_name, column_type)
+
+    start = time.perf_counter()
+    with intercept(traffic):
+        deadpool.dead_pool_status_check.with_options(
+            retries=retries, retry_delay_seconds=0
+        )(cadence=cadence, **flow_kwargs)
+    return time.perf_counter() - start
+
+
+def main(mode, path):
+    if mode == "record":
+        cassette = Cassette(path)
+        cassette.tables = snapshot_tables()
+        responder = Recorder(cassette)
+    else:
+        cassette = Cassette.load(path)
+        responder = Player(cassette)
+
+    connection = fake_snowflake(cassette.tables)
+    traffic = Traffic(responder)
+    elapsed = run_sweep(traffic, connection)
+
+    if mode == "record":
+        cassette.save()
+
+    print(f"{mode} finished in {elapsed:.2f}s at {datetime.now():%H:%M:%S}")
+    print(f"Requests: {dict(traffic.requests)}")
+    print(f"Statements: {dict(connection.statement_counts())}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1], sys.argv[2])
@@ -0,0 +1,59 @@
+"""
+Check that a retried roster sweep resumes from its checkpoint
+
+Wikidata fails once partway through the sweep, the flow retries within
+the same run and only the chunks that hadn't finished are looked up
+again. Runs once per checkpoint kind against the fake Snowflake.
+
+    python -m deadpool.testing.resume_check
+"""
+import math
+from urllib.parse import urlsplit
+from deadpool.testing.replay import Traffic, fake_snowflake, run_sweep
+from deadpool.testing.sweep_benchmark import SyntheticWiki, people_table, synthetic_tables
+
+PICKS = 400
+CHUNK_SIZE = 25
+
+
+class FailOnce(SyntheticWiki):
+    """Answers like SyntheticWiki but rejects one SPARQL request"""
+
+    def __init__(self, fail_at):
+        self.fail_at = fail_at
+        self.sparql = 0
+
+    def respond(self, method, url, body, send):
+        if urlsplit(url).path == "/sparql":
+            self.sparql += 1
+            if self.sparql == self.fail_at:
+                return 400, {}, "{}"
+        return super().respond(method, url, body, send)
+
+
+def check(checkpoint):
+    connection = fake_snowflake(synthetic_tables(PICKS))
+    responder = FailOnce(fail_at=8)
+    run_sweep(
+        Traffic(responder),
+        connection,
+        retries=1,
+        checkpoint=checkpoint,
+        chunk_size=CHUNK_SIZE,
+    )
+
+    chunks = math.ceil(PICKS / CHUNK_SIZE)
+    people = people_table(connection)
+    assert people["BIRTH_DATE"].notna().sum() == PICKS, "Not everyone was written"
+
+    # Without a checkpoint the retry would look up every chunk again
+    if checkpoint == "none":
+        assert responder.sparql == 2 * chunks, responder.sparql
+    else:
+        assert responder.sparql == chunks + 1, responder.sparql
+    print(f"{checkpoint}: {responder.sparql} SPARQL requests for {chunks} chunks")
+
+
+if __name__ == "__main__":
+    for kind in ("none", "file", "snowflake"):
+        check(kind)
@@ -0,0 +1,126 @@
+"""
+Check the risk tiers and the hourly revision check
+
+Tiers follow the age thresholds and the WATCH flag in Python and in
+SQL, the daily predicate spreads the weekly tier over seven days and
+only selects picks that are due, and an hourly run only does a full
+check for high risk picks whose page was edited since last time.
+
+    python -m deadpool.testing.schedule_check
+"""
+import json
+from datetime import datetime, timedelta
+import pandas as pd
+from deadpool.testing.replay import Traffic, fake_snowflake, run_sweep
+from deadpool.testing.sweep_benchmark import SyntheticWiki, people_table, synthetic_tables
+from utilities.util_schedule import TIER_SQL, assign_tiers, checked_at, due_predicate
+
+
+class EditableWiki(SyntheticWiki):
+    """SyntheticWiki whose pages can be edited, bumping their revision"""
+
+    def __init__(self):
+        self.edits = {}
+
+    def respond(self, method, url, body, send):
+        status, headers, text = super().respond(method, url, body, send)
+        if "rvprop=ids" in url:
+            data = json.loads(text)
+            for page in data["query"]["pages"]:
+                page["revisions"][0]["revid"] += self.edits.get(page["title"], 0)
+            text = json.dumps(data)
+        return status, headers, text
+
+
+def select(connection, condition):
+    return pd.read_sql(f"SELECT * FROM PEOPLE WHERE {condition}", connection.db)
+
+
+def check_tiers():
+    roster = pd.DataFrame(
+        {
+            "ID": [str(i) for i in range(8)],
+            "AGE": [30, 67, 68, 86, 87, 99, None, 40],
+            "WATCH": [None, None, None, None, None, None, None, True],
+        }
+    )
+    tiers = assign_tiers(roster)["TIER"].tolist()
+    assert tiers == [
+        "weekly", "weekly", "daily", "daily", "hourly", "hourly", "daily", "hourly"
+    ], tiers
+
+    # The SQL version of the tiers agrees
+    connection = fake_snowflake({"PEOPLE": roster.to_dict("records")})
+    in_sql = pd.read_sql(f"SELECT {TIER_SQL} AS TIER FROM PEOPLE", connection.db)
+    assert in_sql["TIER"].tolist() == tiers, in_sql["TIER"].tolist()
+
+    # Weekly picks never checked before come due once over seven days
+    people = [{"ID": str(i), "AGE": 40, "WIKI_ID": f"Q{i}"} for i in range(700)]
+    connection = fake_snowflake({"PEOPLE": people})
+    connection.add_column("PEOPLE", "WATCH", "BOOLEAN")
+    connection.add_column("PEOPLE", "LAST_CHECKED_AT", "TIMESTAMP")
+    start = datetime(2026, 1, 1, 17)
+    slices = [
+        select(connection, due_predicate("daily", start + timedelta(days=day)))["ID"]
+        for day in range(7)
+    ]
+    assert sorted(pd.concat(slices), key=int) == [p["ID"] for p in people]
+
+    # Once checked they're due again after a week, not before
+    connection.db.execute(f"UPDATE PEOPLE SET LAST_CHECKED_AT = '{checked_at(start)}'")
+    later = [
+        len(select(connection, due_predicate("daily", start + timedelta(days=days))))
+        for days in (1, 6, 7)
+    ]
+    assert later == [0, 0, 700], later
+    print("Tiers OK")
+
+
+def check_daily():
+    connection = fake_snowflake(synthetic_tables(400))
+    first, second = Traffic(SyntheticWiki()), Traffic(SyntheticWiki())
+    run_sweep(first, connection, cadence="daily")
+    people = people_table(connection)
+    checked = people["LAST_CHECKED_AT"].notna().sum()
+
+    # Missing Wiki IDs were stored on the first run, never resolved again
+    assert people["WIKI_ID"].notna().all(), people["WIKI_ID"].isna().sum()
+    assert first.requests["wikipedia"] == 1, first.requests
+
+    # Straight away nobody is due again
+    run_sweep(second, connection, cadence="daily")
+    assert not second.requests, second.requests
+    print(f"Daily OK: {checked} of 400 picks due on the first run, none on the second")
+
+
+def check_hourly():
+    connection = fake_snowflake(synthetic_tables(400))
+    wiki = EditableWiki()
+    hourly_picks = (assign_tiers(people_table(connection))["TIER"] == "hourly").sum()
+
+    def hourly_run():
+        traffic = Traffic(wiki)
+        run_sweep(traffic, connection, cadence="hourly")
+        return traffic.requests
+
+    # The first run checks every high risk pick and records their revisions
+    first = hourly_run()
+    people = people_table(connection)
+    recorded = people["LAST_REVID"].notna().sum()
+    assert recorded == hourly_picks, f"{recorded} revisions for {hourly_picks} picks"
+
+    # Nothing edited, nothing to check beyond the revision query
+    second = hourly_run()
+    assert "wikidata" not in second, second
+
+    wiki.edits = {"Person 351": 1}  # born 1931
+    third = hourly_run()
+    assert third["wikidata"] == 1, third
+    print(f"Hourly OK: {hourly_picks} high risk picks, requests {dict(first)}, "
+          f"{dict(second)} unedited, {dict(third)} after one edit")
+
+
+if __name__ == "__main__":
+    check_tiers()
+    check_daily()
+    check_hourly()
@@ -0,0 +1,82 @@
+"""
+Replay a recorded SPARQL response through the bulk birth/death date parser
+and the vectorized age calculation, no network needed.
+"""
+import json
+from datetime import datetime
+from pathlib import Path
+from prefect import flow
+from utilities import util_wiki
+from utilities.util_wiki import build_sparql_dates_query, parse_sparql_dates
+from utilities.util_dates import calculate_ages
+
+SAMPLE = Path(__file__).parent / "json_samples" / "sparql_birth_death_dates.json"
+
+with open(SAMPLE, encoding="utf-8") as f:
+    results = json.load(f)
+
+query = build_sparql_dates_query(["Q16193271", "Q2252"])
+print(query)
+assert "FILTER(?deathRank != wikibase:DeprecatedRank)" in query
+
+dates = parse_sparql_dates(results).set_index("WIKI_ID")
+dates["AGE"] = calculate_ages(
+    dates["BIRTH_DATE"],
+    dates["DEATH_DATE"],
+    dates["BIRTH_PRECISION"],
+    dates["DEATH_PRECISION"],
+    as_of=datetime(2026, 1, 1),
+)
+print(dates)
+
+# Day precision, dead
+assert dates.loc["Q16193271", "DEATH_DATE"] == datetime(2025, 1, 15)
+assert dates.loc["Q16193271", "AGE"] == 65
+# Several statements of the same rank, the most precise wins
+assert dates.loc["Q2252", "BIRTH_DATE"] == datetime(1942, 11, 4)
+assert dates.loc["Q2252", "AGE"] == 83
+# Year precision, aged by year only
+assert dates.loc["Q234555", "BIRTH_PRECISION"] == 9
+assert dates.loc["Q234555", "AGE"] == 95
+# BCE dates can't be represented and come back empty
+assert dates.loc["Q1048", "BIRTH_DATE"] is None
+# No dates at all
+assert dates.loc["Q99999999", "BIRTH_DATE"] is None
+# A deprecated death (a retracted hoax) is never used
+assert dates.loc["Q4115189", "DEATH_DATE"] is None
+assert dates.loc["Q4115189", "BIRTH_DATE"] == datetime(1944, 5, 2)
+# Preferred rank beats normal rank whatever the binding order
+assert dates.loc["Q5284", "BIRTH_DATE"] == datetime(1955, 10, 29)
+reordered = {"results": {"bindings": results["results"]["bindings"][::-1]}}
+assert parse_sparql_dates(reordered).set_index("WIKI_ID").equals(
+    parse_sparql_dates(results).set_index("WIKI_ID").loc[dates.index[::-1]]
+)
+
+
+@flow(name="SPARQL Malformed IDs")
+def malformed_ids():
+    """A bad WIKI_ID is left out of the query instead of failing it"""
+    queries = []
+
+    def request_json(url, **kwargs):
+        queries.append(kwargs["data"]["query"])
+        return results
+
+    real_request_json = util_wiki.request_json
+    util_wiki.request_json = request_json
+    try:
+        ids = ["Q16193271", "Q2252 ", "wd:Q1;DROP", "-1", "Q5284"]
+        fetched = util_wiki.query_birth_death_dates(ids).set_index("WIKI_ID")
+    finally:
+        util_wiki.request_json = real_request_json
+
+    assert len(queries) == 1
+    assert "wd:Q16193271 wd:Q5284 }" in queries[0], queries[0]
+    assert list(fetched.index) == ids
+    assert fetched.loc["wd:Q1;DROP", "BIRTH_DATE"] is None
+    assert fetched.loc["Q5284", "BIRTH_DATE"] == datetime(1955, 10, 29)
+
+
+malformed_ids()
+
+print("All SPARQL replay checks passed")
@@ -0,0 +1,93 @@
+"""
+Compare flow start-up time: per-run pip install vs the prebuilt image
+
+pip:   fresh virtualenv, pip install -r requirements.txt, import the flow
+image: docker run the image built from the repo Dockerfile with the repo
+       mounted (the deployment clones it), import the flow
+
+Both include everything a managed-pool run does before the flow body
+starts, apart from pulling the image / cloning the repo. Either path is
+reported as unavailable (with the reason) if pip can't reach the index
+or docker isn't installed, and no saving is claimed unless both ran.
+
+    docker build -t prefect-dka .
+    python -m deadpool.testing.startup_time_compare prefect-dka
+"""
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+REPO = Path(__file__).resolve().parents[2]
+IMAGE = sys.argv[1] if len(sys.argv) > 1 else "prefect-dka"
+IMPORT_FLOW = "import deadpool.deadpool"
+
+
+def timed_run(command, **kwargs):
+    """Run a command, return its wall time, raise with its output on failure"""
+    start = time.perf_counter()
+    result = subprocess.run(command, capture_output=True, text=True, **kwargs)
+    elapsed = time.perf_counter() - start
+    if result.returncode != 0:
+        raise RuntimeError((result.stderr or result.stdout).strip().splitlines()[-1])
+    return elapsed
+
+
+def pip_path():
+    with tempfile.TemporaryDirectory() as venv:
+        timed_run([sys.executable, "-m", "venv", venv])
+        python = os.path.join(venv, "bin", "python")
+
+        install = timed_run(
+            [python, "-m", "pip", "install", "-q", "-r", str(REPO / "requirements.txt")],
+            timeout=1800,
+        )
+        env = {**os.environ, "PYTHONPATH": str(REPO)}
+        flow_import = timed_run([python, "-c", IMPORT_FLOW], env=env)
+
+    return {"install_s": install, "import_s": flow_import}
+
+
+def image_path():
+    if not shutil.which("docker"):
+        raise RuntimeError("docker is not installed")
+
+    # Container start plus import, the image is already local and the code
+    # is mounted where from_source would have cloned it
+    start_and_import = timed_run(
+        [
+            "docker", "run", "--rm",
+            "-v", f"{REPO}:/opt/prefect/flows:ro",
+            "-w", "/opt/prefect/flows",
+            "-e", "PYTHONPATH=/opt/prefect/flows",
+            IMAGE, "python", "-c", IMPORT_FLOW,
+        ],
+        timeout=600,
+    )
+    return {"install_s": 0.0, "import_s": start_and_import}
+
+
+def current_env():
+    env = {**os.environ, "PYTHONPATH": str(REPO)}
+    return {"install_s": 0.0, "import_s": timed_run([sys.executable, "-c", IMPORT_FLOW], env=env)}
+
+
+results = {}
+for name, measure in (("pip", pip_path), ("image", image_path), ("this env", current_env)):
+    try:
+        results[name] = measure()
+    except (RuntimeError, subprocess.TimeoutExpired) as e:
+        print(f"{name}: unavailable ({e})")
+
+print()
+print(f"{'path':<10}{'install':>10}{'import':>10}{'total':>10}")
+for name, times in results.items():
+    total = times["install_s"] + times["import_s"]
+    print(f"{name:<10}{times['install_s']:>9.1f}s{times['import_s']:>9.1f}s{total:>9.1f}s")
+
+if "pip" in results and "image" in results:
+    saved = sum(results["pip"].values()) - sum(results["image"].values())
+    print(f"\nThe image saves {saved:.1f}s per run")
@@ -0,0 +1,147 @@
+"""
+Offline benchmark of the deadpool sweep over synthetic rosters
+
+Every run goes through the replay harness: a SQLite fake Snowflake
+seeded with a synthetic roster and a synthetic Wikipedia/Wikidata that
+answers from the roster with a fixed per-request latency. Reports wall
+time, requests per service and statements per kind for each roster size.
+Before benchmarking, a 100 pick sweep is recorded to a cassette and
+replayed to check replay reproduces the same requests and writes.
+
+    python -m deadpool.testing.sweep_benchmark 100 1000 10000
+"""
+import json
+import os
+import re
+import sys
+import tempfile
+from datetime import datetime
+from urllib.parse import parse_qs, urlsplit
+import pandas as pd
+from deadpool.testing.replay import (
+    Cassette,
+    Player,
+    Recorder,
+    SINKS,
+    Traffic,
+    fake_snowflake,
+    run_sweep,
+    service_for,
+)
+
+SIZES = [int(size) for size in sys.argv[1:]] or [100, 1000, 10000]
+LATENCY = float(os.getenv("BENCHMARK_LATENCY", "0.05"))
+JSON = {"Content-Type": "application/json"}
+
+
+def synthetic_tables(picks):
+    """Every 50th pick has died, every 10th is missing its WIKI_ID"""
+    people = [
+        {
+            "ID": str(i),
+            "NAME": f"Person {i}",
+            "WIKI_PAGE": f"Person_{i}",
+            "WIKI_ID": None if i % 10 == 0 else f"Q{i}",
+            "AGE": 60 + i % 40,
+            "ROW_HASH": None,
+            "BIRTH_DATE": None,
+            "DEATH_DATE": None,
+        }
+        for i in range(picks)
+    ]
+    recipients = [{"SMS": "+15550000001"}, {"SMS": "+15550000002"}]
+    return {"PEOPLE": people, "DRAFT_OPTED_IN": recipients}
+
+
+def _time_value(value):
+    return {"type": "literal", "value": f"{value:%Y-%m-%d}T00:00:00Z"}
+
+
+class SyntheticWiki:
+    """Answers Wikipedia title queries and Wikidata SPARQL from the pick number"""
+
+    def respond(self, method, url, body, send):
+        service = service_for(url)
+        if service in SINKS:
+            return SINKS[service]
+
+        if service == "wikipedia":
+            titles = parse_qs(urlsplit(url).query)["titles"][0].split("|")
+            query = {
+                "normalized": [
+                    {"from": title, "to": title.replace("_", " ")} for title in titles
+                ],
+                "pages": [
+                    {
+                        "title": title.replace("_", " "),
+                        "pageprops": {"wikibase_item": "Q" + title.split("_")[-1]},
+                        "revisions": [{"revid": 1000 + int(title.split("_")[-1])}],
+                    }
+                    for title in titles
+                ],
+            }
+            return 200, JSON, json.dumps({"query": query})
+
+        sparql = parse_qs(body if isinstance(body, str) else body.decode())["query"][0]
+        bindings = []
+        for entity_id in re.findall(r"wd:(Q\d+)", sparql):
+            number = int(entity_id[1:])
+            binding = {
+                "item": {"type": "uri", "value": f"http://www.wikidata.org/entity/{entity_id}"},
+                "birthDate": _time_value(datetime(1930 + number % 50, 1 + number % 12, 1 + number % 28)),
+                "birthPrecision": {"type": "literal", "value": "11"},
+            }
+            if number % 50 == 0:
+                binding["deathDate"] = _time_value(datetime(2026, 1, 1))
+                binding["deathPrecision"] = {"type": "literal", "value": "11"}
+            bindings.append(binding)
+        return 200, JSON, json.dumps({"results": {"bindings": bindings}})
+
+
+def people_table(connection):
+    return pd.read_sql("SELECT * FROM PEOPLE ORDER BY CAST(ID AS INTEGER)", connection.db)
+
+
+def check_replay():
+    """Record a small synthetic sweep, replay it, compare requests and writes"""
+    with tempfile.TemporaryDirectory() as tmp:
+        cassette = Cassette(os.path.join(tmp, "sweep.json"))
+        cassette.tables = synthetic_tables(100)
+        recorded = Traffic(Recorder(cassette, live=SyntheticWiki()))
+        recorded_db = fake_snowflake(cassette.tables)
+        run_sweep(recorded, recorded_db)
+        cassette.save()
+
+        cassette = Cassette.load(cassette.path)
+        replayed = Traffic(Player(cassette))
+        replayed_db = fake_snowflake(cassette.tables)
+        run_sweep(replayed, replayed_db)
+
+    assert recorded.requests == replayed.requests, "Replay made different requests"
+    # LAST_CHECKED_AT is the time of each run, everything else must match
+    recorded_people = people_table(recorded_db).drop(columns="LAST_CHECKED_AT")
+    replayed_people = people_table(replayed_db).drop(columns="LAST_CHECKED_AT")
+    assert recorded_people.equals(replayed_people), "Different writes"
+    print(f"Replay matches the recording: {dict(replayed.requests)}")
+
+
+def benchmark(picks):
+    connection = fake_snowflake(synthetic_tables(picks))
+    traffic = Traffic(SyntheticWiki(), latency=LATENCY)
+    elapsed = run_sweep(traffic, connection)
+    deaths = people_table(connection)["DEATH_DATE"].notna().sum()
+    return {
+        "picks": picks,
+        "seconds": round(elapsed, 2),
+        "deaths": int(deaths),
+        **{f"{service} requests": count for service, count in sorted(traffic.requests.items())},
+        **{f"{kind} statements": count for kind, count in sorted(connection.statement_counts().items())},
+    }
+
+
+if __name__ == "__main__":
+    check_replay()
+    results = pd.DataFrame([benchmark(picks) for picks in SIZES]).fillna(0)
+    print()
+    print(f"Sweep benchmark, {LATENCY * 1000:.0f}ms per request")
+    print(results.to_string(index=False))
@@ -0,0 +1,84 @@
+"""
+Compare Prefect orchestration overhead of per-row tasks against batched tasks
+
+Runs the same trivial per-row work three ways inside a flow:
+    1. one task run per row (the old pattern)
+    2. one batched task run per chunk, like check_roster_chunk
+    3. plain Python with no task runs as the floor
+
+Each mode runs in its own process so queued task-run events from one mode
+can't slow down the next. Wall time includes flow start-up and shutdown,
+so the plain Python run is the baseline to subtract.
+
+    python -m deadpool.testing.task_overhead_benchmark 1000
+"""
+import subprocess
+import sys
+import time
+from prefect import task, flow
+from prefect.cache_policies import NONE
+from utilities.util_batch import chunked
+
+CHUNK_SIZE = 100
+
+
+def square(value):
+    return value * value
+
+
+square_task = task(name="Square Per Row")(square)
+
+
+@task(name="Square Batch", cache_policy=NONE)
+def square_batch(values):
+    return [square(value) for value in values]
+
+
+@flow(name="Per Row Tasks")
+def per_row_flow(values):
+    return [square_task(value) for value in values]
+
+
+@flow(name="Batched Tasks")
+def batched_flow(values):
+    results = []
+    for chunk in chunked(values, CHUNK_SIZE):
+        results.extend(square_batch(chunk))
+    return results
+
+
+@flow(name="Plain Python")
+def plain_flow(values):
+    return [square(value) for value in values]
+
+
+MODES = {"per_row": per_row_flow, "batched": batched_flow, "plain": plain_flow}
+
+
+def run_mode(mode, rows):
+    start = time.perf_counter()
+    subprocess.run(
+        [sys.executable, "-m", "deadpool.testing.task_overhead_benchmark", str(rows), mode],
+        check=True,
+    )
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+
+    if len(sys.argv) > 2:
+        MODES[sys.argv[2]](list(range(rows)))
+        sys.exit(0)
+
+    plain = run_mode("plain", rows)
+    batched = run_mode("batched", rows)
+    per_row = run_mode("per_row", rows)
+
+    print()
+    print(f"Rows: {rows}, chunk size: {CHUNK_SIZE}")
+    print(f"Plain Python:  {plain:.2f}s (0 task runs)")
+    print(f"Batched tasks: {batched:.2f}s ({-(-rows // CHUNK_SIZE)} task runs)")
+    print(f"Per row tasks: {per_row:.2f}s ({rows} task runs)")
+    print(f"Overhead per row task run: {(per_row - plain) / rows * 1000:.1f}ms")
+    print()
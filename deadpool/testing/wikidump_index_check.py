@@ -0,0 +1,59 @@
+"""
+Build a dump index from the synthetic sample dump and query it the way
+util_wiki does, no network needed.
+"""
+import os
+import tempfile
+from datetime import datetime
+from pathlib import Path
+from utilities.util_wikidump import build_dump_index, WikidataDumpIndex
+
+SAMPLE = Path(__file__).parent / "json_samples" / "wikidata_dump_sample.json"
+
+with tempfile.TemporaryDirectory() as tmp:
+    index_path = os.path.join(tmp, "wikidata_people.sqlite")
+
+    count = build_dump_index(str(SAMPLE), index_path, batch_size=2)
+    print(f"Indexed {count} people")
+    assert count == 4, "Only humans should be indexed"
+
+    index = WikidataDumpIndex(index_path)
+
+    wiki_ids = index.get_wiki_ids(["Linda_Nolan", "tina_Turner", "New_York_City"])
+    print(wiki_ids)
+    assert wiki_ids == {"Linda_Nolan": "Q16193271", "tina_Turner": "Q234555"}
+
+    assert index.get_claim("P570", "Q16193271") == ("+2025-01-15T00:00:00Z", 11)
+    # Claims without a value are skipped in favour of the next one
+    assert index.get_claim("P569", "Q234555") == ("+1931-00-00T00:00:00Z", 9)
+    # Indexed without a death claim vs not in the index at all
+    assert index.get_claim("P570", "Q234555") == (None, None)
+    assert index.get_claim("P569", "Q60") is None
+    # A deprecated (retracted) death is never indexed, preferred rank wins
+    assert index.get_claim("P570", "Q5284") == (None, None)
+    assert index.get_claim("P569", "Q5284") == ("+1955-00-00T00:00:00Z", 9)
+
+    os.environ["WIKIDATA_DUMP_INDEX"] = index_path
+    from utilities import util_wiki
+    from utilities.util_wiki import get_birth_death_date, get_wiki_ids
+
+    assert get_wiki_ids(["Linda_Nolan"]) == {"Linda_Nolan": "Q16193271"}
+    assert get_birth_death_date("P569", "Q234555") == datetime(1931, 1, 1)
+
+    # Only the people alive in the dump are queried, they may have died since
+    queries = []
+
+    def request_json(url, data=None, **kwargs):
+        queries.append(data["query"])
+        return {"results": {"bindings": []}}
+
+    util_wiki.request_json = request_json
+    dates = util_wiki.query_birth_death_dates(["Q16193271", "Q234555"])
+    dates = dates.set_index("WIKI_ID")
+    assert len(queries) == 1 and "wd:Q234555" in queries[0], queries
+    assert "wd:Q16193271" not in queries[0], queries
+    assert dates.loc["Q16193271", "DEATH_DATE"] == datetime(2025, 1, 15)
+    assert dates.loc["Q16193271", "DEATH_PRECISION"] == 11
+    assert dates.loc["Q234555", "DEATH_DATE"] is None
+
+    print("All dump index checks passed")
@@ -1,12 +1,18 @@
 """Bash operator to refresh AWS EC2 AutoScaling Group on Schedule"""
 from prefect import flow
 from prefect_shell import ShellOperation
+from utilities.util_profile import profiled_flow
 
 
 @flow(name="Refresh EC2 Instances", retries=3, retry_delay_seconds=30)
-def refresh_instances():
+@profiled_flow
+def refresh_instances(profile: bool = False):
     """
     Refresh EC2 Instances On a Schedule Set in Prefect
+
+    Args:
+        profile (bool, optional): Attach a profile of the run as artifacts.
+            Defaults to False.
     """
     ShellOperation(
         commands=[
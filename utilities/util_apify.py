@@ -1,36 +1,82 @@
 """
 Utilities for APIFY Driven Endpoints
 """
-import requests
-from prefect.blocks.system import Secret
+import asyncio
+import os
+import httpx
+from utilities.util_blocks import get_secret
+from utilities.util_cache import LRUCache
+from utilities.util_metrics import metrics, timed
 
+# Seconds the notification path will wait on the LLM before falling back
+ARBITER_BUDGET = float(os.getenv("ARBITER_BUDGET_SECONDS", "10"))
 
-def the_arbiter(prompt):
-    """Chatbot API call to LangChang LLM
+# Prompt to response, so a retried flow doesn't pay for generation again
+arbiter_cache = LRUCache(maxsize=256)
+metrics.track_cache("arbiter responses", arbiter_cache)
+
+
+async def ask_the_arbiter(prompt, budget=None, fallback=None):
+    """Chatbot API call to LangChang LLM within a latency budget
+
+    Successful responses are memoized by prompt. Timeouts and errors are
+    not cached, so a later call can still get a real answer.
 
     Args:
         prompt (str): the prompt
+        budget (float, optional): Seconds to wait, secrets included.
+            Defaults to ARBITER_BUDGET.
+        fallback (str, optional): Returned when the budget runs out or the
+            call fails. Defaults to an "Arbiter is sleeping" message.
 
     Returns:
-        str: Text output from the LLM
+        str: Text output from the LLM, or the fallback
     """
+    budget = ARBITER_BUDGET if budget is None else budget
 
-    apify_api_url_secret = Secret.load("apify-base-api")
-    apify_bearer_secret = Secret.load("apify-base-bearer")
+    cached = arbiter_cache.get(prompt)
+    if cached is not None:
+        return cached
 
-    apify_api_url = apify_api_url_secret.get()
-    apify_bearer = apify_bearer_secret.get()
+    async def ask():
+        apify_api_url, apify_bearer = await asyncio.to_thread(
+            lambda: (get_secret("apify-base-api"), get_secret("apify-base-bearer"))
+        )
+
+        headers = {"Authorization": apify_bearer}
+        payload = {
+            "question": prompt,
+        }
 
-    headers = {"Authorization": apify_bearer}
-    payload = {
-        "question": prompt,
-    }
+        async with httpx.AsyncClient(timeout=budget) as client:
+            response = await client.post(apify_api_url, headers=headers, json=payload)
+            response.raise_for_status()
+            return response.json()["text"]
 
     try:
-        response = requests.post(
-            apify_api_url, headers=headers, json=payload, timeout=60
-        )
-        output = response.json()
-        return output["text"]
+        with timed("arbiter"):
+            text = await asyncio.wait_for(ask(), timeout=budget)
+    except asyncio.TimeoutError:
+        return fallback or f"The Arbiter is sleeping: no answer within {budget}s"
     except Exception as e:
-        return "The Arbiter is sleeping: " + str(e)
+        return fallback or "The Arbiter is sleeping: " + str(e)
+
+    arbiter_cache.set(prompt, text)
+    return text
+
+
+def the_arbiter(prompt, budget=None, fallback=None):
+    """Chatbot API call to LangChang LLM
+
+    Blocking wrapper around ask_the_arbiter for sync callers, don't call
+    it from inside a running event loop.
+
+    Args:
+        prompt (str): the prompt
+        budget (float, optional): Seconds to wait. Defaults to ARBITER_BUDGET.
+        fallback (str, optional): Returned when the budget runs out.
+
+    Returns:
+        str: Text output from the LLM
+    """
+    return asyncio.run(ask_the_arbiter(prompt, budget, fallback))
@@ -0,0 +1,64 @@
+"""
+Batching utilities
+
+Every Prefect task run carries state tracking and API round trips, so
+per-row helpers are kept as plain Python and called over chunks of rows
+from a single task per chunk. map_chunks runs such a task over every
+chunk on the flow's task runner (e.g. check_roster_chunk in the deadpool
+flow).
+"""
+
+import pandas as pd
+from prefect import unmapped
+
+
+def chunked(items, size):
+    """Split a sequence into lists of at most size items
+
+    Args:
+        items (iterable): Values to split
+        size (int): Maximum chunk size
+
+    Returns:
+        list: List of chunks
+    """
+    items = list(items)
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def split_rows(rows, size):
+    """Split a Dataframe into frames of at most size rows, or a sequence into lists
+
+    Args:
+        rows (Dataframe or iterable): Rows to split
+        size (int): Maximum chunk size
+
+    Returns:
+        list: List of chunks
+    """
+    if isinstance(rows, pd.DataFrame):
+        return [rows.iloc[i:i + size] for i in range(0, len(rows), size)]
+    return chunked(rows, size)
+
+
+def map_chunks(chunk_task, rows, chunk_size, **shared):
+    """Run a task once per chunk of rows, concurrently on the flow's task runner
+
+    Every chunk is waited for before a failure is raised, so the chunks
+    that finished still get to record their work (e.g. in a checkpoint).
+
+    Args:
+        chunk_task (Task): Task taking a chunk of rows as its first argument
+        rows (Dataframe or iterable): Rows to split
+        chunk_size (int): Rows per task run
+        **shared: Passed unchanged to every task run
+
+    Returns:
+        list: Each chunk's result, in chunk order
+    """
+    futures = chunk_task.map(
+        split_rows(rows, chunk_size),
+        **{name: unmapped(value) for name, value in shared.items()},
+    )
+    futures.wait()
+    return futures.result()
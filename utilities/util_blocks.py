@@ -0,0 +1,90 @@
+"""
+Process-level cache for Prefect blocks and secrets
+
+Every Block.load is a round trip to the Prefect API. Blocks are loaded
+once per process and kept for PREFECT_BLOCK_CACHE_TTL seconds (15
+minutes by default), so rotated credentials are picked up by long
+running workers without paying for a load on every task call.
+"""
+
+import os
+import threading
+from collections import Counter
+from prefect import get_run_logger
+from prefect.blocks.system import Secret
+from prefect.runtime import flow_run
+from utilities.util_cache import LRUCache
+from utilities.util_metrics import metrics, timed
+
+BLOCK_TTL = float(os.getenv("PREFECT_BLOCK_CACHE_TTL", "900"))
+
+block_cache = LRUCache(maxsize=128, ttl=BLOCK_TTL)
+metrics.track_cache("prefect blocks", block_cache)
+
+# Block.load calls that actually went to the API, per flow run id
+_block_loads = Counter()
+_block_loads_lock = threading.Lock()
+
+
+def load_block(block_type, name, refresh=False, **load_kwargs):
+    """Load a block through the process cache
+
+    Args:
+        block_type (type): Block class, e.g. SlackWebhook
+        name (str): Block document name
+        refresh (bool, optional): Load from the API even if cached.
+            Defaults to False.
+        **load_kwargs: Passed through to Block.load, e.g. validate=False
+
+    Returns:
+        Block: The loaded block, shared with other callers in the process
+    """
+    key = (block_type.__name__, name)
+
+    if refresh:
+        block_cache.invalidate(key)
+
+    def load():
+        with _block_loads_lock:
+            _block_loads[flow_run.id] += 1
+        with timed("prefect blocks"):
+            return block_type.load(name, **load_kwargs)
+
+    return block_cache.get_or_load(key, load)
+
+
+def get_secret(name, refresh=False):
+    """Return the value of a Secret block through the process cache"""
+    return load_block(Secret, name, refresh).get()
+
+
+def refresh_blocks(name=None):
+    """Drop one cached block by name, or every cached block"""
+    if name is None:
+        block_cache.invalidate()
+    else:
+        block_cache.invalidate_matching(lambda key: key[1] == name)
+
+
+def block_load_count(run_id=None):
+    """Number of block loads that went to the API, for a flow run
+
+    Args:
+        run_id (str, optional): Flow run id. Defaults to the current run.
+
+    Returns:
+        int: Block loads performed
+    """
+    with _block_loads_lock:
+        return _block_loads[run_id or flow_run.id]
+
+
+def log_block_loads():
+    """Log how many block loads the current flow run made"""
+    logger = get_run_logger()
+    stats = block_cache.stats()
+    logger.info(
+        "Block loads this run: %s (cache hit rate %.0f%%)",
+        block_load_count(),
+        stats["hit_rate"] * 100,
+    )
@@ -0,0 +1,225 @@
+"""
+Checkpoints that let a retried flow run resume where it left off
+
+Flow retries keep the flow run id, so finished rows are recorded under
+the run id and the next attempt of the same run loads them back instead
+of calling the external services again. A new run starts from scratch.
+
+FileCheckpoint appends to a local file and survives retries in the same
+container. SnowflakeCheckpoint writes to a staging table, so it also
+survives a retry that lands on a different worker.
+
+SnowflakeNotificationJournal keeps the idempotency keys of sent
+notifications next to it, keyed on nothing but the key, so a later run
+in another process doesn't notify the same death again.
+"""
+
+import json
+import os
+import pickle
+import tempfile
+import threading
+import pandas as pd
+from prefect.runtime import flow_run
+from utilities.util_batch import chunked
+from utilities.util_metrics import timed
+from utilities.util_pipeline import Checkpoint
+
+CHECKPOINT_DIR = os.getenv(
+    "CHECKPOINT_DIR", os.path.join(tempfile.gettempdir(), "flow-checkpoints")
+)
+
+
+class FileCheckpoint(Checkpoint):
+    """Finished rows appended to a local file, one pickled batch per save
+
+    Args:
+        name (str): What is being checkpointed, e.g. "roster-sweep"
+        directory (str, optional): Defaults to CHECKPOINT_DIR.
+        run_id (str, optional): Defaults to the current flow run id.
+    """
+
+    def __init__(self, name, directory=None, run_id=None):
+        run_id = run_id or flow_run.id or "local"
+        directory = directory or CHECKPOINT_DIR
+        self.path = os.path.join(directory, f"{name}-{run_id}.pkl")
+        self._lock = threading.Lock()
+
+    def load(self):
+        batches = []
+        try:
+            with open(self.path, "rb") as f:
+                while True:
+                    batches.append(pickle.load(f))
+        except FileNotFoundError:
+            return None
+        except (EOFError, pickle.UnpicklingError):
+            # End of file, or a batch cut short by a crash mid-write
+            pass
+        return pd.concat(batches) if batches else None
+
+    def save(self, enriched):
+        with self._lock:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self.path, "ab") as f:
+                pickle.dump(enriched, f)
+                f.flush()
+                os.fsync(f.fileno())
+
+    def clear(self):
+        with self._lock:
+            if os.path.exists(self.path):
+                os.remove(self.path)
+
+
+class SnowflakeTable:
+    """A table in Snowflake that is created the first time it's used"""
+
+    DDL = ""
+
+    def __init__(self, connection, database_name, schema_name, table_name):
+        self.connection = connection
+        self.table = f"{database_name}.{schema_name}.{table_name}"
+        self._created = False
+
+    def _execute(self, statement, params=None):
+        with timed("snowflake"), self.connection.cursor() as cursor:
+            if not self._created:
+                cursor.execute(
+                    f"CREATE TABLE IF NOT EXISTS {self.table} ({self.DDL})"
+                )
+                self._created = True
+            cursor.execute(statement, params)
+            if statement.startswith("SELECT"):
+                return cursor.fetch_pandas_all()
+
+
+class SnowflakeCheckpoint(SnowflakeTable, Checkpoint):
+    """Finished rows in a staging table, one JSON row per key
+
+    Args:
+        connection (connection): Snowflake Connection
+        name (str): What is being checkpointed, e.g. "roster-sweep"
+        key_column (str, optional): Unique row key. Defaults to "ID".
+        date_columns (list, optional): Columns to parse back into dates
+        database_name (str, optional): Defaults to "DEADPOOL".
+        schema_name (str, optional): Defaults to "PROD".
+        table_name (str, optional): Defaults to "RUN_CHECKPOINTS".
+        run_id (str, optional): Defaults to the current flow run id.
+    """
+
+    DDL = (
+        "RUN_ID VARCHAR, NAME VARCHAR, ROW_ID VARCHAR, RESULT VARCHAR, "
+        "CREATED_AT TIMESTAMP DEFAULT CURRENT_TIMESTAMP"
+    )
+
+    def __init__(
+        self,
+        connection,
+        name,
+        key_column="ID",
+        date_columns=(),
+        database_name="DEADPOOL",
+        schema_name="PROD",
+        table_name="RUN_CHECKPOINTS",
+        run_id=None,
+    ):
+        super().__init__(connection, database_name, schema_name, table_name)
+        self.name = name
+        self.key_column = key_column
+        self.date_columns = list(date_columns)
+        self.run_id = run_id or flow_run.id or "local"
+        self._lock = threading.Lock()
+
+    def load(self):
+        stored = self._execute(
+            f"SELECT RESULT FROM {self.table} WHERE RUN_ID = %s AND NAME = %s",
+            [self.run_id, self.name],
+        )
+        if stored is None or stored.empty:
+            return None
+
+        records = [json.loads(result) for result in stored["RESULT"]]
+        rows = pd.DataFrame(records, dtype=object)
+        for column in self.date_columns:
+            dates = pd.to_datetime(rows[column])
+            rows[column] = dates.astype(object).where(dates.notna(), None)
+        return rows.drop_duplicates(self.key_column, keep="last")
+
+    def save(self, enriched):
+        records = json.loads(enriched.to_json(orient="records", date_format="iso"))
+        rows = [
+            (self.run_id, self.name, str(record[self.key_column]), json.dumps(record))
+            for record in records
+        ]
+
+        with self._lock:
+            for batch in chunked(rows, 1000):
+                self._execute(
+                    f"INSERT INTO {self.table} (RUN_ID, NAME, ROW_ID, RESULT) VALUES "
+                    + ", ".join(["(%s, %s, %s, %s)"] * len(batch)),
+                    [value for row in batch for value in row],
+                )
+
+    def clear(self):
+        self._execute(
+            f"DELETE FROM {self.table} WHERE RUN_ID = %s AND NAME = %s",
+            [self.run_id, self.name],
+        )
+
+
+class SnowflakeNotificationJournal(SnowflakeTable):
+    """Idempotency keys of the notifications every run has sent
+
+    A key is claimed before the notification goes out and released again
+    if it fails, so a run in another process, e.g. the next scheduled run
+    after this one failed before its write-back, or an hourly run
+    overlapping the daily one, skips what was already sent.
+
+    Args:
+        connection (connection): Snowflake Connection
+        database_name (str, optional): Defaults to "DEADPOOL".
+        schema_name (str, optional): Defaults to "PROD".
+        table_name (str, optional): Defaults to "NOTIFICATIONS_SENT".
+        run_id (str, optional): Defaults to the current flow run id.
+    """
+
+    DDL = (
+        "NOTIFICATION_KEY VARCHAR, RUN_ID VARCHAR, "
+        "SENT_AT TIMESTAMP DEFAULT CURRENT_TIMESTAMP"
+    )
+
+    def __init__(
+        self,
+        connection,
+        database_name="DEADPOOL",
+        schema_name="PROD",
+        table_name="NOTIFICATIONS_SENT",
+        run_id=None,
+    ):
+        super().__init__(connection, database_name, schema_name, table_name)
+        self.run_id = run_id or flow_run.id or "local"
+        self._lock = threading.Lock()
+
+    def claim(self, key):
+        """Record a key, False if some run already has"""
+        with self._lock:
+            sent = self._execute(
+                f"SELECT RUN_ID FROM {self.table} WHERE NOTIFICATION_KEY = %s",
+                [key],
+            )
+            if sent is not None and not sent.empty:
+                return False
+            self._execute(
+                f"INSERT INTO {self.table} (NOTIFICATION_KEY, RUN_ID) VALUES (%s, %s)",
+                [key, self.run_id],
+            )
+            return True
+
+    def release(self, key):
+        """Remove this run's claim on a key after its notification failed"""
+        with self._lock:
+            self._execute(
+                f"DELETE FROM {self.table} WHERE NOTIFICATION_KEY = %s AND RUN_ID = %s",
+                [key, self.run_id],
+            )
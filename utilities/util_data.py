@@ -1,24 +1,37 @@
 """General FX-Data Wragling Functions"""
 
 from prefect import task, get_run_logger
-from fuzzywuzzy import fuzz
+from prefect.cache_policies import NONE
 import ast
 
 
-@task(name="Deduplicate Dataframe")
-def dedupe_dataframe(list_of_titles, df, column_name):
+@task(name="Deduplicate Dataframe", cache_policy=NONE)
+def dedupe_dataframe(list_of_titles, df, column_name, index=None, verify=None):
     """Removes any row from a dataframe for companies that are in a supplied list
 
+    With a membership index (load_membership_index) the existing titles
+    don't need to be downloaded: pass None for list_of_titles, and a
+    verify function (e.g. get_matching_values) to check the probable
+    hits exactly. Add the uploaded rows to the index and save it after
+    writing them.
+
     Args:
-        list_of_titles (list): Existing titles to remove
+        list_of_titles (list): Existing titles to remove, None with an index
         df (Pandas Dataframe): Complete set of scraped companies
+        column_name (str): Column to dedupe on
+        index (MembershipIndex, optional): Index of the existing titles
+        verify (callable, optional): Probable hits -> the ones that exist
 
     Returns:
         Pandas Dataframe: The deduplicated dataframe
     """
     logger = get_run_logger()
 
-    filtered_df = df[~df[column_name].isin(list_of_titles)]
+    if index is not None:
+        existing = index.contains(df[column_name], verify=verify)
+    else:
+        existing = df[column_name].isin(list_of_titles)
+    filtered_df = df[~existing]
 
     filtered_df = filtered_df.reset_index(drop=True)
 
@@ -27,7 +40,6 @@ def dedupe_dataframe(list_of_titles, df, column_name):
     return filtered_df
 
 
-@task(name="Fuzzy Match Name")
 def has_fuzzy_match(value, value_set, threshold=92):
     """_summary_
 
@@ -39,6 +51,8 @@ def has_fuzzy_match(value, value_set, threshold=92):
     Returns:
         _type_: _description_
     """
+    from fuzzywuzzy import fuzz
+
     for item in value_set:
         if fuzz.token_sort_ratio(value.lower(), item.lower()) >= threshold:
             return True
@@ -61,6 +75,8 @@ def dedupe_and_validate(df, fx_df):
     Returns:
         Dataframe: _description_
     """
+    from fuzzywuzzy import fuzz
+
     df["CHECKED"] = False
     all_org_names = fx_df["NAME_AND_ALT_NAMES"].explode().tolist()
 
@@ -0,0 +1,109 @@
+"""
+Date and age utilities
+"""
+
+from datetime import datetime
+import numpy as np
+import pandas as pd
+
+# Wikidata time precision codes
+PRECISION_YEAR = 9
+PRECISION_MONTH = 10
+PRECISION_DAY = 11
+
+
+def _to_days(values, length):
+    """Convert a column of dates into a numpy datetime64[D] array
+
+    datetime64[D] is used instead of pandas' nanosecond timestamps so
+    historic dates (before 1677) don't silently turn into NaT.
+
+    Args:
+        values (Series, list or None): datetime, Timestamp, string or None values
+        length (int): Size of the array to build when values is None
+
+    Returns:
+        ndarray: datetime64[D] array, NaT where there is no date
+    """
+    if values is None:
+        return np.full(length, np.datetime64("NaT"), dtype="datetime64[D]")
+
+    if isinstance(values, pd.Series):
+        values = values.to_numpy(dtype=object)
+
+    values = [None if pd.isna(value) else value for value in values]
+    return np.array(values, dtype="datetime64[D]")
+
+
+def _split_days(days):
+    """Break a datetime64[D] array into year, month and day integer arrays"""
+    months = days.astype("datetime64[M]")
+    year = days.astype("datetime64[Y]").astype(np.int64) + 1970
+    month = months.astype(np.int64) % 12 + 1
+    day = (days - months).astype(np.int64) + 1
+    return year, month, day
+
+
+def _to_precision(values, length):
+    """Build a precision array, defaulting to day precision"""
+    if values is None:
+        return np.full(length, PRECISION_DAY, dtype=np.int64)
+
+    precision = pd.to_numeric(pd.Series(list(values)), errors="coerce")
+    return precision.fillna(PRECISION_DAY).to_numpy(dtype=np.int64)
+
+
+def calculate_ages(
+    birth_dates,
+    death_dates=None,
+    birth_precision=None,
+    death_precision=None,
+    as_of=None,
+):
+    """Calculate ages for a whole column of birth and death dates at once
+
+    Living people (no death date) are aged as of today. Partial dates are
+    handled through Wikidata precision codes: with month precision only the
+    month is compared, with year precision (or coarser) the age is the
+    difference in years.
+
+    Args:
+        birth_dates (Series or list): Birth dates
+        death_dates (Series or list, optional): Death dates, None if alive
+        birth_precision (Series or list, optional): Wikidata precision codes
+        death_precision (Series or list, optional): Wikidata precision codes
+        as_of (datetime, optional): Date to age living people to. Defaults to now.
+
+    Returns:
+        Series: Nullable integer ages, <NA> where the birth date is unknown
+    """
+    index = birth_dates.index if isinstance(birth_dates, pd.Series) else None
+    length = len(birth_dates)
+
+    birth = _to_days(birth_dates, length)
+    death = _to_days(death_dates, length)
+
+    as_of = np.datetime64(as_of or datetime.now(), "D")
+    end = np.where(np.isnat(death), as_of, death)
+
+    birth_year, birth_month, birth_day = _split_days(birth)
+    end_year, end_month, end_day = _split_days(end)
+
+    # Only as precise as the least precise of the two dates
+    end_precision = np.where(
+        np.isnat(death), PRECISION_DAY, _to_precision(death_precision, length)
+    )
+    precision = np.minimum(_to_precision(birth_precision, length), end_precision)
+
+    before_birthday = np.where(
+        precision >= PRECISION_DAY,
+        (end_month < birth_month)
+        | ((end_month == birth_month) & (end_day < birth_day)),
+        np.where(precision == PRECISION_MONTH, end_month < birth_month, False),
+    )
+
+    ages = end_year - birth_year - before_birthday.astype(np.int64)
+
+    return pd.Series(
+        pd.array(np.where(np.isnat(birth), None, ages), dtype="Int64"), index=index
+    )
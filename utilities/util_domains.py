@@ -3,8 +3,6 @@ Utilities for working with Domains
 """
 
 import requests
-import tldextract
-import whois
 import hashlib
 from prefect import task
 
@@ -19,6 +17,8 @@ def extract_domain(url):
     Returns:
         String: the domain only
     """
+    import tldextract
+
     try:
         extracted = tldextract.extract(url)
         return extracted.registered_domain
@@ -107,6 +107,8 @@ def check_whois_info(domain):
     Returns:
         Dict: WHOIS registration data about the domain
     """
+    import whois
+
     try:
         w = whois.whois(domain)
         data = {
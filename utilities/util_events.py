@@ -0,0 +1,226 @@
+"""
+In-process event pipeline for notifications
+
+Producers (e.g. roster chunks running on the thread pool) emit events
+onto a queue that async notifier workers drain on a background event
+loop, so a slow Slack or Twilio call never holds up the producer.
+Every (event, notifier) pair, or (event, notifier, recipient) for
+notifiers that send to a list, carries an idempotency key recorded in a
+process-wide ledger, so flow retries never notify twice. Failed sends
+stay pending in the ledger and resend_pending queues them again. A
+journal (e.g. utilities.util_checkpoint.SnowflakeNotificationJournal)
+also records the keys outside the process, so later runs skip them too.
+"""
+
+import asyncio
+import threading
+
+
+class NotificationLedger:
+    """Thread-safe record of idempotency keys already notified"""
+
+    def __init__(self):
+        self._sent = set()
+        self._in_flight = set()
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def claim(self, key):
+        """Reserve a key, False if it was already sent or is being sent"""
+        with self._lock:
+            if key in self._sent or key in self._in_flight:
+                return False
+            self._in_flight.add(key)
+            return True
+
+    def complete(self, key):
+        with self._lock:
+            self._in_flight.discard(key)
+            self._pending.pop(key, None)
+            self._sent.add(key)
+
+    def release(self, key, item=None):
+        """Give a key back after a failed send so a retry can claim it
+
+        Args:
+            key (str): Idempotency key that failed
+            item (tuple, optional): What to queue again on resend_pending
+        """
+        with self._lock:
+            self._in_flight.discard(key)
+            if item is not None:
+                self._pending[key] = item
+
+    def pending(self):
+        """Items released after a failure and not sent since"""
+        with self._lock:
+            return list(self._pending.values())
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._sent
+
+
+# Lives for the process, which spans the in-process retries of a flow run
+process_ledger = NotificationLedger()
+
+
+class NotificationDispatcher:
+    """Fan events out to async notifiers on a background event loop
+
+    Use as a context manager; leaving it waits for every queued
+    notification to finish.
+
+    Notifiers named in recipients send to a list, e.g. SMS: each recipient
+    gets their own idempotency key and the notifier is called once per
+    recipient, so a retry after a partial failure only sends to the
+    recipients that didn't get it.
+
+    Args:
+        notifiers (dict): Name to async callable taking the event dict, and
+            the recipient for notifiers in recipients
+        logger (Logger): Logger for delivery failures
+        workers (int, optional): Concurrent notifier workers. Defaults to 4.
+        ledger (NotificationLedger, optional): Defaults to the process ledger.
+        recipients (dict, optional): Notifier name to a blocking callable
+            taking the event and returning the recipients
+        journal (optional): Blocking claim(key) and release(key) that record
+            the keys sent by every run, checked after the ledger
+    """
+
+    def __init__(
+        self, notifiers, logger, workers=4, ledger=None, recipients=None, journal=None
+    ):
+        self.notifiers = notifiers
+        self.recipients = recipients or {}
+        self.journal = journal
+        self.logger = logger
+        self.workers = workers
+        self.ledger = ledger if ledger is not None else process_ledger
+        self.failed = []
+        self.sent = []
+        self._loop = None
+        self._thread = None
+        self._queue = None
+        self._tasks = []
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+        return False
+
+    def start(self):
+        """Start the event loop and workers on a background thread"""
+        self._loop = asyncio.new_event_loop()
+        ready = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run_loop, args=(ready,), name="notifications", daemon=True
+        )
+        self._thread.start()
+        ready.wait()
+
+    def _run_loop(self, ready):
+        asyncio.set_event_loop(self._loop)
+        self._queue = asyncio.Queue()
+        self._tasks = [
+            self._loop.create_task(self._worker()) for _ in range(self.workers)
+        ]
+        ready.set()
+        self._loop.run_forever()
+
+    def emit(self, key, event):
+        """Queue an event for every notifier, safe to call from any thread
+
+        Args:
+            key (str): Idempotency key for the event, e.g. "death:123:2025-01-15"
+            event (dict): Payload handed to each notifier
+        """
+        for name in self.notifiers:
+            self._put((f"{key}:{name}", name, event, None))
+
+    def resend_pending(self):
+        """Queue every notification that failed earlier in the process
+
+        Returns:
+            int: Notifications queued again
+        """
+        pending = self.ledger.pending()
+        for item in pending:
+            self._put(item)
+        return len(pending)
+
+    def _put(self, item):
+        self._loop.call_soon_threadsafe(self._queue.put_nowait, item)
+
+    async def _expand(self, key, name, event):
+        """Queue one notification per recipient, each under its own key"""
+        try:
+            recipients = await asyncio.to_thread(self.recipients[name], event)
+        except Exception as e:
+            await self._fail(key, (key, name, event, None), e)
+            return
+        # The per-recipient keys track delivery from here on
+        self.ledger.complete(key)
+        for recipient in recipients:
+            self._queue.put_nowait((f"{key}:{recipient}", name, event, recipient))
+
+    async def _fail(self, key, item, error, journaled=False):
+        if journaled:
+            try:
+                await asyncio.to_thread(self.journal.release, key)
+            except Exception as e:
+                self.logger.error("Couldn't release %s for a retry: %s", key, e)
+        self.ledger.release(key, item)
+        self.failed.append(key)
+        self.logger.error("Notification %s failed: %s", key, error)
+
+    async def _send(self, key, name, event, recipient):
+        """Send one notification unless this process or another run already has"""
+        if not self.ledger.claim(key):
+            self.logger.info("Skipping %s, already notified", key)
+            return
+
+        journaled = False
+        try:
+            if self.journal:
+                if not await asyncio.to_thread(self.journal.claim, key):
+                    self.ledger.complete(key)
+                    self.logger.info("Skipping %s, notified by an earlier run", key)
+                    return
+                journaled = True
+            if recipient is None:
+                await self.notifiers[name](event)
+            else:
+                await self.notifiers[name](event, recipient)
+        except Exception as e:
+            await self._fail(key, (key, name, event, recipient), e, journaled)
+        else:
+            self.ledger.complete(key)
+            self.sent.append(key)
+
+    async def _worker(self):
+        while True:
+            key, name, event, recipient = await self._queue.get()
+            try:
+                if name in self.recipients and recipient is None:
+                    await self._expand(key, name, event)
+                else:
+                    await self._send(key, name, event, recipient)
+            finally:
+                self._queue.task_done()
+
+    async def _drain(self):
+        await self._queue.join()
+        for worker in self._tasks:
+            worker.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def close(self):
+        """Wait for the queue to drain, then stop the workers and the loop"""
+        asyncio.run_coroutine_threadsafe(self._drain(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
@@ -0,0 +1,63 @@
+"""
+Row fingerprinting utilities for change detection
+"""
+
+import hashlib
+import pandas as pd
+from pandas.api.types import is_numeric_dtype
+
+# Marker for missing values, can never be confused with a length prefix
+MISSING = "-"
+
+
+def _encode_column(column):
+    """Length-prefix every value of a column, e.g. "Cher" -> "4:Cher"
+
+    Numbers are rendered as floats so 76, 76.0 and Int64 76 all encode
+    the same way.
+
+    Args:
+        column (Series): Values to encode
+
+    Returns:
+        Series: Encoded strings
+    """
+    missing = column.isna()
+
+    if is_numeric_dtype(column):
+        text = pd.to_numeric(column).astype("float64").map(repr)
+    else:
+        text = column.astype(object).where(~missing, "").astype(str)
+
+    encoded = text.str.len().astype(str) + ":" + text
+    return encoded.where(~missing, MISSING).astype(object)
+
+
+def fingerprint_rows(df, columns, digest_size=8):
+    """Create a stable fingerprint for every row of a DataFrame
+
+    Each value is length-prefixed before the row is hashed so different
+    splits of the same characters ("AB" + "C" vs "A" + "BC") can't collide.
+    blake2b with a small digest is much cheaper than md5 over the same input
+    and the hex digest fits in a VARCHAR(16) ROW_HASH column.
+
+    Args:
+        df (Dataframe): Rows to fingerprint
+        columns (list): Columns that make up the fingerprint, in order
+        digest_size (int, optional): Digest size in bytes. Defaults to 8.
+
+    Returns:
+        Series: Hex digest per row, aligned with df
+    """
+    encoded = _encode_column(df[columns[0]])
+    for column in columns[1:]:
+        encoded = encoded + "|" + _encode_column(df[column])
+
+    return pd.Series(
+        [
+            hashlib.blake2b(value.encode(), digest_size=digest_size).hexdigest()
+            for value in encoded
+        ],
+        index=df.index,
+        dtype=object,
+    )
@@ -0,0 +1,200 @@
+"""
+Resilient HTTP utilities: jittered backoff, Retry-After/maxlag handling
+and a per-host circuit breaker
+"""
+
+import random
+import threading
+import time
+from urllib.parse import urlparse
+import requests
+from prefect import get_run_logger
+from utilities.util_metrics import metrics
+
+# Metric names for the hosts we call, anything else is reported by host
+DEPENDENCIES = {
+    "www.wikidata.org": "wikidata",
+    "query.wikidata.org": "wikidata-sparql",
+    "en.wikipedia.org": "wikipedia",
+}
+
+
+class ServiceUnavailableError(Exception):
+    """Raised when a service couldn't be reached after all retries"""
+
+
+class CircuitOpenError(ServiceUnavailableError):
+    """Raised without calling the service while its circuit is open"""
+
+
+class CircuitBreaker:
+    """Stop calling a host after repeated failures, then probe it again
+
+    After failure_threshold consecutive failures the circuit opens and
+    every call fails fast for reset_timeout seconds. The next call after
+    that is let through as a single probe, every other call keeps failing
+    fast until it's done: success closes the circuit, failure opens it
+    again.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=60):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+        self.lock = threading.Lock()
+
+    def check(self, host):
+        """Raise CircuitOpenError if the circuit is open"""
+        with self.lock:
+            if self.opened_at is None:
+                return
+            if not self.probing and (
+                time.monotonic() - self.opened_at >= self.reset_timeout
+            ):
+                # Half open, let this call through as the probe
+                self.probing = True
+                return
+        raise CircuitOpenError(f"Circuit open for {host}, failing fast")
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.probing = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.probing or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+            self.probing = False
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_circuit_breaker(host):
+    """Return the shared circuit breaker for a host"""
+    with _breakers_lock:
+        if host not in _breakers:
+            _breakers[host] = CircuitBreaker()
+        return _breakers[host]
+
+
+def backoff_delay(attempt, base_delay=1, max_delay=30):
+    """Full jitter exponential backoff: uniform(0, min(max, base * 2^attempt))"""
+    return random.uniform(0, min(max_delay, base_delay * 2**attempt))
+
+
+def retry_after(response):
+    """Seconds asked for by a Retry-After header, None if absent or a date"""
+    try:
+        return float(response.headers["Retry-After"])
+    except (KeyError, ValueError):
+        return None
+
+
+def request_json(
+    url,
+    params=None,
+    method="GET",
+    retries=5,
+    timeout=5,
+    base_delay=1,
+    max_delay=30,
+    **kwargs,
+):
+    """Make an HTTP request and return the JSON body, retrying transient errors
+
+    Connection errors, 429 and 5xx responses are retried with jittered
+    exponential backoff, honouring Retry-After. MediaWiki maxlag errors
+    (sent as HTTP 200) are retried after the requested wait without
+    counting against the host. Other 4xx responses fail straight away.
+
+    Args:
+        url (str): Endpoint to call
+        params (dict, optional): Query string parameters
+        method (str, optional): HTTP method. Defaults to "GET".
+        retries (int, optional): Attempts before giving up. Defaults to 5.
+        timeout (int, optional): Request timeout in seconds. Defaults to 5.
+        base_delay (int, optional): First backoff ceiling. Defaults to 1.
+        max_delay (int, optional): Largest backoff or Retry-After wait. Defaults to 30.
+        **kwargs: Passed through to requests, e.g. data or headers
+
+    Raises:
+        CircuitOpenError: The host has been failing and is being skipped
+        ServiceUnavailableError: All retries failed
+        requests.HTTPError: Non-retryable client error
+
+    Returns:
+        dict: JSON response
+    """
+    logger = get_run_logger()
+    host = urlparse(url).netloc
+    dependency = DEPENDENCIES.get(host, host)
+    breaker = get_circuit_breaker(host)
+
+    for attempt in range(retries):
+        breaker.check(host)
+        if attempt:
+            metrics.retry(dependency)
+
+        start = time.perf_counter()
+        try:
+            response = requests.request(
+                method, url, params=params, timeout=timeout, **kwargs
+            )
+        except requests.exceptions.RequestException as e:
+            metrics.observe(dependency, time.perf_counter() - start, error=True)
+            breaker.record_failure()
+            delay = backoff_delay(attempt, base_delay, max_delay)
+            logger.warning("Attempt %s to %s failed: %s", attempt + 1, host, e)
+        else:
+            metrics.observe(
+                dependency,
+                time.perf_counter() - start,
+                len(response.content),
+                error=response.status_code >= 400,
+            )
+            if response.status_code == 429 or response.status_code >= 500:
+                breaker.record_failure()
+                delay = retry_after(response) or backoff_delay(
+                    attempt, base_delay, max_delay
+                )
+                logger.warning(
+                    "Attempt %s to %s got HTTP %s",
+                    attempt + 1,
+                    host,
+                    response.status_code,
+                )
+            else:
+                if response.status_code >= 400:
+                    # The host is up, it's the request that's wrong
+                    breaker.record_success()
+                    response.raise_for_status()
+                try:
+                    data = response.json()
+                except ValueError:
+                    breaker.record_failure()
+                    raise ServiceUnavailableError(f"Invalid JSON from {host}")
+
+                # A maxlag answer still shows the host is up
+                breaker.record_success()
+                error = data.get("error") if isinstance(data, dict) else None
+                if not (isinstance(error, dict) and error.get("code") == "maxlag"):
+                    return data
+
+                # Replication lag, the server asks us to back off a bit
+                delay = retry_after(response) or backoff_delay(
+                    attempt, base_delay, max_delay
+                )
+                logger.info("%s is lagged, waiting %.1fs", host, delay)
+
+        # No point waiting after the last attempt
+        if attempt + 1 < retries:
+            time.sleep(min(delay, max_delay))
+
+    raise ServiceUnavailableError(f"{host} unavailable after {retries} attempts")
@@ -0,0 +1,214 @@
+"""
+Persistent membership index for deduplicating against a large column
+
+Answers "is this value already in the table?" without downloading the
+column. Values are hashed to 64 bits once; a Bloom filter rules out most
+new values with a few bit lookups, a sorted array of the hashes confirms
+the probable hits, and only those are checked exactly against the table.
+
+    index = MembershipIndex.from_values(existing_titles)
+    known = index.contains(batch["COMPANY_NAME"], verify=lookup_in_table)
+    index.add(batch.loc[~known, "COMPANY_NAME"])
+
+to_bytes/from_bytes serialize the index so it can be stored next to the
+table (see load_membership_index in util_snowflake) and updated as new
+rows are written. The watermark is an opaque fingerprint of the column
+the index was saved against, used to tell when it has gone stale.
+
+NULL/NaN values are never members: they aren't hashed, so a NULL row
+doesn't make the title "None" look known, and they always test as new.
+"""
+
+import hashlib
+import io
+import math
+import numpy as np
+import pandas as pd
+
+
+def hash_values(values):
+    """64-bit blake2b hash of each value's text
+
+    Args:
+        values (iterable): Values to hash, compared as str
+
+    Returns:
+        ndarray: uint64 hashes
+    """
+    return np.array(
+        [
+            int.from_bytes(
+                hashlib.blake2b(str(value).encode(), digest_size=8).digest(), "little"
+            )
+            for value in values
+        ],
+        dtype=np.uint64,
+    )
+
+
+def not_null(values):
+    """Mask of the values that aren't NULL/NaN"""
+    return np.array([not pd.isna(value) for value in values], dtype=bool)
+
+
+class MembershipIndex:
+    """Bloom filter over a sorted array of 64-bit value hashes
+
+    The filter is sized for capacity values at error_rate false
+    positives, and is rebuilt from the sorted hashes at twice the size
+    whenever it fills up.
+
+    Args:
+        capacity (int, optional): Values before the filter grows.
+            Defaults to 100_000.
+        error_rate (float, optional): Bloom false positive rate.
+            Defaults to 0.01.
+    """
+
+    def __init__(self, capacity=100_000, error_rate=0.01):
+        self.capacity = max(int(capacity), 1)
+        self.error_rate = error_rate
+        self.rows = 0
+        self.watermark = None
+        self.hashes = np.empty(0, dtype=np.uint64)
+        self._size_filter()
+
+    @classmethod
+    def from_values(cls, values, error_rate=0.01):
+        """Build an index holding every value, e.g. a whole table column
+
+        NULL/NaN values count as rows, like COUNT(*), but aren't indexed.
+        """
+        values = list(values)
+        index = cls(capacity=2 * len(values), error_rate=error_rate)
+        index.add(values)
+        return index
+
+    def __len__(self):
+        return len(self.hashes)
+
+    def _size_filter(self):
+        self.bits = math.ceil(
+            -self.capacity * math.log(self.error_rate) / math.log(2) ** 2
+        )
+        self.probes = max(1, round(self.bits / self.capacity * math.log(2)))
+        self.filter = np.zeros((self.bits + 7) // 8, dtype=np.uint8)
+
+    def _positions(self, hashes):
+        """Bit positions per hash, by double hashing the two 32-bit halves"""
+        low = hashes & np.uint64(0xFFFFFFFF)
+        high = (hashes >> np.uint64(32)) | np.uint64(1)
+        probes = np.arange(self.probes, dtype=np.uint64)
+        positions = low[:, None] + probes[None, :] * high[:, None]
+        return positions % np.uint64(self.bits)
+
+    def _set_bits(self, hashes):
+        # In slices so a large rebuild doesn't hold every position at once
+        for start in range(0, len(hashes), 100_000):
+            positions = self._positions(hashes[start:start + 100_000]).ravel()
+            np.bitwise_or.at(
+                self.filter,
+                (positions >> np.uint64(3)).astype(np.int64),
+                np.uint8(1) << (positions & np.uint64(7)).astype(np.uint8),
+            )
+
+    def add(self, values):
+        """Add values written to the table
+
+        Args:
+            values (iterable): New values, every one counts towards rows
+                but NULL/NaN values aren't indexed
+        """
+        values = list(values)
+        self.rows += len(values)
+        values = [value for value, kept in zip(values, not_null(values)) if kept]
+        hashes = np.unique(hash_values(values))
+        hashes = hashes[~self._in_sorted(hashes)]
+        if not len(hashes):
+            return
+
+        self.hashes = np.union1d(self.hashes, hashes)
+        if len(self.hashes) > self.capacity:
+            while len(self.hashes) > self.capacity:
+                self.capacity *= 2
+            self._size_filter()
+            self._set_bits(self.hashes)
+        else:
+            self._set_bits(hashes)
+
+    def _in_sorted(self, hashes):
+        slots = np.searchsorted(self.hashes, hashes)
+        found = slots < len(self.hashes)
+        found[found] = self.hashes[slots[found]] == hashes[found]
+        return found
+
+    def might_contain(self, values):
+        """Bloom filter test: False means definitely new
+
+        Args:
+            values (iterable): Values to test
+
+        Returns:
+            ndarray: bool per value
+        """
+        positions = self._positions(hash_values(values))
+        bytes_ = self.filter[(positions >> np.uint64(3)).astype(np.int64)]
+        bits = (bytes_ >> (positions & np.uint64(7)).astype(np.uint8)) & 1
+        return bits.all(axis=1)
+
+    def contains(self, values, verify=None):
+        """Which values are already in the table
+
+        Args:
+            values (iterable): Values to test
+            verify (callable, optional): Takes the probable hits and
+                returns the ones that really exist. Without it a 64-bit
+                hash match counts as a hit.
+
+        Returns:
+            ndarray: bool per value, always False for NULL/NaN
+        """
+        values = list(values)
+        kept = not_null(values)
+        probable = np.zeros(len(values), dtype=bool)
+
+        if kept.any():
+            tested = [value for value, keep in zip(values, kept) if keep]
+            hashes = hash_values(tested)
+            hits = self.might_contain(tested)
+            hits[hits] = self._in_sorted(hashes[hits])
+            probable[kept] = hits
+
+        if verify is None or not probable.any():
+            return probable
+
+        candidates = [value for value, hit in zip(values, probable) if hit]
+        existing = set(verify(list(dict.fromkeys(candidates))))
+        return np.array(
+            [hit and value in existing for value, hit in zip(values, probable)]
+        )
+
+    def to_bytes(self):
+        """Serialize the hashes, sizing and watermark, not the filter"""
+        buffer = io.BytesIO()
+        np.savez_compressed(
+            buffer,
+            hashes=self.hashes,
+            meta=np.array([self.capacity, self.rows], dtype=np.int64),
+            error_rate=np.array([self.error_rate]),
+            watermark=np.array([self.watermark or ""]),
+        )
+        return buffer.getvalue()
+
+    @classmethod
+    def from_bytes(cls, data):
+        """Load an index serialized with to_bytes"""
+        stored = np.load(io.BytesIO(data))
+        capacity, rows = stored["meta"].tolist()
+        index = cls(capacity=capacity, error_rate=float(stored["error_rate"][0]))
+        index.hashes = stored["hashes"]
+        index.rows = rows
+        if "watermark" in stored.files:
+            index.watermark = str(stored["watermark"][0]) or None
+        index._set_bits(index.hashes)
+        return index
@@ -0,0 +1,281 @@
+"""
+Per-dependency instrumentation for flows
+
+Latency histograms, bytes transferred, error and retry counts for every
+external dependency (Wikidata, Snowflake, Slack, Twilio...) plus hit
+rates for the in-process caches. Flows reset the process registry when
+they start and publish it as Prefect artifacts when they finish:
+
+    with timed("snowflake") as span:
+        df = cursor.fetch_pandas_all()
+        span.bytes = len(df)
+
+Set METRICS_OPENMETRICS_PATH to also write the run's metrics as
+OpenMetrics text, e.g. for a node exporter textfile collector.
+"""
+
+import bisect
+import functools
+import os
+import threading
+import time
+from prefect import get_run_logger
+from prefect.artifacts import create_markdown_artifact, create_table_artifact
+
+# Upper bounds in seconds, the last bucket catches everything slower
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+class DependencyStats:
+    """Counters and a latency histogram for one dependency"""
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.retries = 0
+        self.bytes = 0
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+
+    def percentile(self, q):
+        """Estimate a latency percentile as the upper bound of its bucket"""
+        if not self.calls:
+            return 0.0
+        wanted = q * self.calls
+        seen = 0
+        for bound, count in zip(LATENCY_BUCKETS, self.buckets):
+            seen += count
+            if seen >= wanted:
+                return min(bound, self.max_seconds)
+        return self.max_seconds
+
+
+class MetricsRegistry:
+    """Thread-safe registry of dependency stats and tracked caches"""
+
+    def __init__(self):
+        self.dependencies = {}
+        self.caches = {}
+        self._cache_baselines = {}
+        self._lock = threading.Lock()
+
+    def _stats(self, dependency):
+        if dependency not in self.dependencies:
+            self.dependencies[dependency] = DependencyStats()
+        return self.dependencies[dependency]
+
+    def observe(self, dependency, seconds, nbytes=0, error=False):
+        """Record one call to a dependency"""
+        with self._lock:
+            stats = self._stats(dependency)
+            stats.calls += 1
+            stats.errors += bool(error)
+            stats.bytes += nbytes
+            stats.seconds += seconds
+            stats.max_seconds = max(stats.max_seconds, seconds)
+            stats.buckets[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+
+    def retry(self, dependency):
+        """Record a retried attempt against a dependency"""
+        with self._lock:
+            self._stats(dependency).retries += 1
+
+    def track_cache(self, name, cache):
+        """Report the hit rate of an LRUCache alongside the dependencies"""
+        with self._lock:
+            self.caches[name] = cache
+            self._cache_baselines[name] = (cache.hits, cache.misses)
+
+    def reset(self):
+        """Start a new run: clear the stats and re-baseline the caches"""
+        with self._lock:
+            self.dependencies = {}
+            self._cache_baselines = {
+                name: (cache.hits, cache.misses)
+                for name, cache in self.caches.items()
+            }
+
+    def dependency_rows(self):
+        with self._lock:
+            return [
+                {
+                    "dependency": name,
+                    "calls": stats.calls,
+                    "errors": stats.errors,
+                    "retries": stats.retries,
+                    "bytes": stats.bytes,
+                    "total_s": round(stats.seconds, 3),
+                    "p50_s": round(stats.percentile(0.5), 3),
+                    "p95_s": round(stats.percentile(0.95), 3),
+                    "max_s": round(stats.max_seconds, 3),
+                }
+                for name, stats in sorted(self.dependencies.items())
+            ]
+
+    def cache_rows(self):
+        with self._lock:
+            rows = []
+            for name, cache in sorted(self.caches.items()):
+                base_hits, base_misses = self._cache_baselines[name]
+                hits = cache.hits - base_hits
+                misses = cache.misses - base_misses
+                lookups = hits + misses
+                rows.append(
+                    {
+                        "cache": name,
+                        "hits": hits,
+                        "misses": misses,
+                        "hit_rate": round(hits / lookups, 3) if lookups else 0.0,
+                        "size": len(cache),
+                    }
+                )
+            return rows
+
+    def to_openmetrics(self):
+        """Render the run's metrics as OpenMetrics text"""
+        lines = [
+            "# TYPE dependency_request_seconds histogram",
+            "# UNIT dependency_request_seconds seconds",
+        ]
+        with self._lock:
+            for name, stats in sorted(self.dependencies.items()):
+                cumulative = 0
+                for bound, count in zip(LATENCY_BUCKETS, stats.buckets):
+                    cumulative += count
+                    lines.append(
+                        f"dependency_request_seconds_bucket"
+                        f'{{dependency="{name}",le="{bound}"}} {cumulative}'
+                    )
+                labels = f'{{dependency="{name}"}}'
+                lines += [
+                    f"dependency_request_seconds_bucket"
+                    f'{{dependency="{name}",le="+Inf"}} {stats.calls}',
+                    f"dependency_request_seconds_count{labels} {stats.calls}",
+                    f"dependency_request_seconds_sum{labels} {stats.seconds}",
+                ]
+
+            for metric, attribute in (
+                ("dependency_errors", "errors"),
+                ("dependency_retries", "retries"),
+                ("dependency_bytes", "bytes"),
+            ):
+                lines.append(f"# TYPE {metric} counter")
+                for name, stats in sorted(self.dependencies.items()):
+                    lines.append(
+                        f'{metric}_total{{dependency="{name}"}} {getattr(stats, attribute)}'
+                    )
+
+        lines.append("# TYPE cache_hit_ratio gauge")
+        for row in self.cache_rows():
+            lines.append(
+                f'cache_hit_ratio{{cache="{row["cache"]}"}} {row["hit_rate"]}'
+            )
+
+        lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+
+# Shared by every utility in the process, reset at the start of each flow run
+metrics = MetricsRegistry()
+
+
+class Span:
+    """Handle yielded by timed, set bytes once the response size is known"""
+
+    def __init__(self):
+        self.bytes = 0
+
+
+class timed:
+    """Time a call to a dependency, as a context manager or a decorator
+
+    Exceptions are counted as errors and re-raised.
+
+    Args:
+        dependency (str): Dependency name, e.g. "slack"
+    """
+
+    def __init__(self, dependency):
+        self.dependency = dependency
+
+    def __enter__(self):
+        self._span = Span()
+        self._start = time.perf_counter()
+        return self._span
+
+    def __exit__(self, exc_type, exc, tb):
+        metrics.observe(
+            self.dependency,
+            time.perf_counter() - self._start,
+            self._span.bytes,
+            error=exc_type is not None,
+        )
+        return False
+
+    def __call__(self, fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with timed(self.dependency):
+                return fn(*args, **kwargs)
+
+        return wrapper
+
+
+def _markdown_table(rows):
+    if not rows:
+        return "_None_\n"
+    header = list(rows[0])
+    lines = [
+        "| " + " | ".join(header) + " |",
+        "|" + "---|" * len(header),
+    ]
+    lines += [
+        "| " + " | ".join(str(row[column]) for column in header) + " |"
+        for row in rows
+    ]
+    return "\n".join(lines) + "\n"
+
+
+def publish_metrics(key="dependency-metrics"):
+    """Publish the run's metrics as Prefect artifacts and optional OpenMetrics
+
+    Args:
+        key (str, optional): Artifact key, so runs can be compared over time.
+            Defaults to "dependency-metrics".
+    """
+    logger = get_run_logger()
+    dependency_rows = metrics.dependency_rows()
+    cache_rows = metrics.cache_rows()
+
+    create_table_artifact(
+        key=key,
+        table=dependency_rows,
+        description="Calls, errors, retries, bytes and latency per dependency",
+    )
+    create_markdown_artifact(
+        key=f"{key}-summary",
+        markdown=(
+            "## Dependencies\n\n"
+            + _markdown_table(dependency_rows)
+            + "\n## Caches\n\n"
+            + _markdown_table(cache_rows)
+        ),
+        description="Dependency and cache metrics for this run",
+    )
+
+    for row in dependency_rows:
+        logger.info(
+            "%s: %s calls, %s errors, %s retries, p95 %ss",
+            row["dependency"],
+            row["calls"],
+            row["errors"],
+            row["retries"],
+            row["p95_s"],
+        )
+
+    export_path = os.getenv("METRICS_OPENMETRICS_PATH")
+    if export_path:
+        with open(export_path, "w", encoding="utf-8") as f:
+            f.write(metrics.to_openmetrics())
+        logger.info("Wrote OpenMetrics to %s", export_path)
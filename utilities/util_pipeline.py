@@ -0,0 +1,212 @@
+"""
+Pipeline engine for "check a table of entities against an external API"
+
+    source -> enrich -> diff -> sink -> notify
+
+The source returns a DataFrame with a key column. It is split into
+batches that are enriched concurrently on a bounded thread pool, with at
+most max_pending batches in flight so a large source can't flood the
+external service or memory. Enriched rows are diffed and buffered, the
+sink writes them in bulk (every flush_rows rows, or once at the end) and
+notify is called with each batch of written rows.
+
+Enrichment results can be cached per cache_column value across batches
+and runs, and a checkpoint records finished rows so a retried run only
+enriches what's left.
+
+    pipeline = Pipeline(
+        name="NNDB dates",
+        source=read_people,
+        enrich=lookup_dates,
+        diff=lambda df: df[df["BIRTH_DATE"].notna()],
+        sink=write_dates,
+        key_column="ID",
+    )
+    stats = pipeline.run()
+"""
+
+import contextvars
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import pandas as pd
+from prefect import get_run_logger
+
+
+class Checkpoint:
+    """No-op checkpoint, subclass to persist finished rows between attempts"""
+
+    def load(self):
+        """Return the enriched rows finished by an earlier attempt, or None"""
+        return None
+
+    def save(self, enriched):
+        """Record a batch of enriched rows as finished"""
+
+    def clear(self):
+        """Forget everything once the run has succeeded"""
+
+
+def _all_rows(df):
+    return df
+
+
+class Pipeline:
+    """Batched, bounded, cached and checkpointed source/enrich/diff/sink/notify
+
+    Args:
+        name (str): Name used in the logs
+        source (callable): () -> DataFrame of rows to check
+        enrich (callable): DataFrame batch -> the batch with new columns added
+        sink (callable): DataFrame of changed rows -> number of rows written
+        diff (callable, optional): Enriched DataFrame -> rows that changed.
+            Defaults to every row.
+        notify (callable, optional): Called with each DataFrame of written rows
+        key_column (str, optional): Unique row key. Defaults to "ID".
+        batch_size (int, optional): Rows per enrich call. Defaults to 100.
+        max_workers (int, optional): Concurrent enrich calls. Defaults to 4.
+        max_pending (int, optional): Batches submitted but not finished.
+            Defaults to twice max_workers.
+        flush_rows (int, optional): Write whenever this many changed rows are
+            buffered. Defaults to a single write at the end.
+        cache (LRUCache, optional): Enrichment results by cache_column value
+        cache_column (str, optional): Column the cache is keyed on.
+            Defaults to key_column.
+        checkpoint (Checkpoint, optional): Where finished rows are recorded
+    """
+
+    def __init__(
+        self,
+        name,
+        source,
+        enrich,
+        sink,
+        diff=None,
+        notify=None,
+        key_column="ID",
+        batch_size=100,
+        max_workers=4,
+        max_pending=None,
+        flush_rows=None,
+        cache=None,
+        cache_column=None,
+        checkpoint=None,
+    ):
+        self.name = name
+        self.source = source
+        self.enrich = enrich
+        self.sink = sink
+        self.diff = diff or _all_rows
+        self.notify = notify
+        self.key_column = key_column
+        self.batch_size = batch_size
+        self.max_workers = max_workers
+        self.max_pending = max_pending or 2 * max_workers
+        self.flush_rows = flush_rows
+        self.cache = cache
+        self.cache_column = cache_column or key_column
+        self.checkpoint = checkpoint or Checkpoint()
+
+    def _enrich_batch(self, batch):
+        """Enrich one batch, answering what we can from the cache"""
+        if self.cache is None:
+            return self.enrich(batch)
+
+        cached = {}
+        for value in batch[self.cache_column].dropna().unique():
+            hit = self.cache.get(value)
+            if hit is not None:
+                cached[value] = hit
+
+        misses = batch[~batch[self.cache_column].isin(list(cached))]
+        parts = []
+
+        if len(misses):
+            enriched = self.enrich(misses)
+            added = [c for c in enriched.columns if c not in batch.columns]
+            keyed = enriched[enriched[self.cache_column].notna()]
+            for row in keyed.drop_duplicates(self.cache_column).to_dict("records"):
+                self.cache.set(row[self.cache_column], {c: row[c] for c in added})
+            parts.append(enriched)
+
+        if cached:
+            hits = batch[batch[self.cache_column].isin(list(cached))].copy()
+            values = hits[self.cache_column].map(cached)
+            for column in next(iter(cached.values())):
+                hits[column] = values.map(lambda entry: entry[column])
+            parts.append(hits)
+
+        return pd.concat(parts) if len(parts) > 1 else parts[0]
+
+    def _batches(self, rows):
+        for i in range(0, len(rows), self.batch_size):
+            yield rows.iloc[i:i + self.batch_size]
+
+    def run(self):
+        """Run every stage and return row counts and the elapsed time
+
+        Returns:
+            dict: read, resumed, enriched, changed, written and seconds
+        """
+        logger = get_run_logger()
+        start = time.perf_counter()
+
+        rows = self.source()
+        stats = dict(read=len(rows), resumed=0, enriched=0, changed=0, written=0)
+
+        # Rows finished by an earlier attempt skip straight to the diff
+        buffered = []
+        done = self.checkpoint.load()
+        if done is not None and len(done):
+            done = done[done[self.key_column].isin(rows[self.key_column])]
+            rows = rows[~rows[self.key_column].isin(done[self.key_column])]
+            stats["resumed"] = len(done)
+            buffered.append(self.diff(done))
+            stats["changed"] += len(buffered[-1])
+            logger.info("%s: resuming, %s rows already checked", self.name, len(done))
+
+        def flush(force=False):
+            pending_rows = sum(len(part) for part in buffered)
+            if not pending_rows:
+                return
+            if not force and (not self.flush_rows or pending_rows < self.flush_rows):
+                return
+            changed = pd.concat(buffered)
+            buffered.clear()
+            stats["written"] += self.sink(changed) or 0
+            if self.notify:
+                self.notify(changed)
+
+        batches = self._batches(rows)
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            in_flight = set()
+            while True:
+                # Backpressure: only pull more batches while there's room
+                for batch in batches:
+                    # Copy the Prefect run context so loggers work in the pool
+                    context = contextvars.copy_context()
+                    in_flight.add(
+                        executor.submit(context.run, self._enrich_batch, batch)
+                    )
+                    if len(in_flight) >= self.max_pending:
+                        break
+
+                if not in_flight:
+                    break
+
+                finished, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    enriched = future.result()
+                    self.checkpoint.save(enriched)
+                    stats["enriched"] += len(enriched)
+
+                    changed = self.diff(enriched)
+                    stats["changed"] += len(changed)
+                    buffered.append(changed)
+                flush()
+
+        flush(force=True)
+        self.checkpoint.clear()
+
+        stats["seconds"] = round(time.perf_counter() - start, 2)
+        logger.info("%s: %s", self.name, stats)
+        return stats
@@ -0,0 +1,194 @@
+"""
+Profiling mode for flows
+
+Put profiled_flow under @flow and give the flow a profile parameter, or
+set FLOW_PROFILE=1 to profile every run:
+
+    @flow(name="My Flow")
+    @profiled_flow
+    def my_flow(profile: bool = False):
+        ...
+
+A profiled run samples the stacks of every thread (so tasks on the
+thread pool show up too), runs cProfile on the flow thread and takes
+tracemalloc snapshots. The hottest stacks, the cProfile summary, the
+top allocators and the full collapsed stacks (flamegraph.pl / speedscope
+input) are attached to the run as artifacts, so a managed-pool run can
+be profiled after its worker is gone. The collapsed stacks and the
+pstats dump are also written to PROFILE_DIR. Expect a profiled run to
+be several times slower, tracemalloc in particular is not cheap.
+"""
+
+import cProfile
+import functools
+import inspect
+import io
+import os
+import pstats
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+from prefect import get_run_logger
+from prefect.artifacts import create_markdown_artifact, create_table_artifact
+from prefect.runtime import flow_run
+
+PROFILE_DIR = os.getenv(
+    "PROFILE_DIR", os.path.join(tempfile.gettempdir(), "flow-profiles")
+)
+
+
+class StackSampler:
+    """Sample the stacks of all threads into collapsed-stack counts
+
+    Args:
+        interval (float, optional): Seconds between samples. Defaults to 0.01.
+    """
+
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name="stack-sampler", daemon=True
+        )
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(
+                        f"{code.co_name} ({os.path.basename(code.co_filename)}"
+                        f":{code.co_firstlineno})"
+                    )
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, str(thread_id)))
+                self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def collapsed(self):
+        """Collapsed stacks, one "frame;frame;frame count" line per stack"""
+        return "".join(
+            f"{stack} {count}\n" for stack, count in self.stacks.most_common()
+        )
+
+
+def top_allocators(snapshot, limit=25):
+    """Largest allocation sites in a tracemalloc snapshot"""
+    return [
+        {
+            "site": f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+            "size_kib": round(stat.size / 1024, 1),
+            "blocks": stat.count,
+        }
+        for stat in snapshot.statistics("lineno")[:limit]
+    ]
+
+
+def publish_profile(name, sampler, profiler, snapshot, elapsed):
+    """Attach the profile to the run as artifacts and write the raw output"""
+    logger = get_run_logger()
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    prefix = os.path.join(PROFILE_DIR, f"{name}-{flow_run.id or int(time.time())}")
+
+    with open(f"{prefix}.collapsed", "w", encoding="utf-8") as f:
+        f.write(sampler.collapsed())
+    profiler.dump_stats(f"{prefix}.pstats")
+
+    summary = io.StringIO()
+    pstats.Stats(profiler, stream=summary).sort_stats("cumulative").print_stats(30)
+
+    hottest = "\n".join(
+        f"{count:>6}  {stack.split(';', 1)[0]}: {';'.join(stack.split(';')[-4:])}"
+        for stack, count in sampler.stacks.most_common(30)
+    )
+
+    create_markdown_artifact(
+        key=f"{name.replace('_', '-')}-profile",
+        markdown=(
+            f"## Profile of {name}\n\n"
+            f"{elapsed:.1f}s, {sampler.samples} samples every "
+            f"{sampler.interval * 1000:.0f}ms. Full collapsed stacks in the "
+            f"`{name.replace('_', '-')}-collapsed-stacks` artifact and "
+            f"`{prefix}.collapsed`, cProfile dump: `{prefix}.pstats`\n\n"
+            f"### Hottest sampled stacks (innermost frames)\n\n```\n{hottest}\n```\n\n"
+            f"### cProfile, flow thread\n\n```\n{summary.getvalue()}\n```\n"
+        ),
+        description="Sampled stacks and cProfile summary",
+    )
+    # The whole profile, the worker's PROFILE_DIR goes away with it
+    create_markdown_artifact(
+        key=f"{name.replace('_', '-')}-collapsed-stacks",
+        markdown=f"```\n{sampler.collapsed()}```\n",
+        description="Every sampled stack, paste into speedscope or flamegraph.pl",
+    )
+    create_table_artifact(
+        key=f"{name.replace('_', '-')}-allocations",
+        table=top_allocators(snapshot),
+        description="Top allocation sites still held at the end of the run",
+    )
+
+    logger.info("Profile written to %s.collapsed and %s.pstats", prefix, prefix)
+
+
+@contextmanager
+def profiling(name):
+    """Profile the enclosed block and publish the results as artifacts"""
+    sampler = StackSampler()
+    profiler = cProfile.Profile()
+    started_tracing = not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start()
+
+    start = time.perf_counter()
+    sampler.start()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        sampler.stop()
+        elapsed = time.perf_counter() - start
+        snapshot = tracemalloc.take_snapshot()
+        if started_tracing:
+            tracemalloc.stop()
+        # A failed publish must not hide the flow's own result or exception
+        try:
+            publish_profile(name, sampler, profiler, snapshot, elapsed)
+        except Exception as e:
+            get_run_logger().error("Couldn't publish the profile of %s: %s", name, e)
+
+
+def profiled_flow(fn):
+    """Profile a flow function when its profile parameter or FLOW_PROFILE is set"""
+    signature = inspect.signature(fn)
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        bound = signature.bind(*args, **kwargs)
+        bound.apply_defaults()
+        enabled = bound.arguments.get("profile") or os.getenv("FLOW_PROFILE") == "1"
+
+        if not enabled:
+            return fn(*args, **kwargs)
+        with profiling(fn.__name__):
+            return fn(*args, **kwargs)
+
+    return wrapper
@@ -0,0 +1,137 @@
+"""
+Risk-based check scheduling for the roster
+
+Each living pick is put in a tier by their chance of dying within the
+year, estimated from AGE, or by a manual WATCH flag:
+
+    hourly  annual risk >= 10% (87 and older) or watched
+    daily   annual risk >= 2% (68 and older) or age unknown
+    weekly  everyone else
+
+The tiers are evaluated in Snowflake (TIER_SQL and due_predicate) so
+the roster query only returns the picks a run needs. The daily run
+checks everyone whose tier interval has passed since LAST_CHECKED_AT.
+The hourly run checks only the hourly tier, and only the pages edited
+since the last check. An "all" run checks everyone, e.g. to catch up
+after an outage.
+"""
+
+import math
+from datetime import datetime, timedelta, timezone
+import numpy as np
+import pandas as pd
+
+# Gompertz hazard, close to the US period life table: about 6% a year at
+# 80, doubling every 8 years
+GOMPERTZ_A = 5.9e-5
+GOMPERTZ_B = math.log(2) / 8
+
+# Tier name, minimum annual risk and hours between checks, riskiest first
+TIERS = [
+    ("hourly", 0.10, 1),
+    ("daily", 0.02, 24),
+    ("weekly", 0.0, 168),
+]
+
+
+def annual_mortality(ages):
+    """Chance of dying within a year at each age
+
+    Args:
+        ages (Series): Ages in years, missing where unknown
+
+    Returns:
+        Series: Probability between 0 and 1, NaN where the age is unknown
+    """
+    ages = pd.to_numeric(ages, errors="coerce").astype("float64")
+    hazard = GOMPERTZ_A * np.exp(GOMPERTZ_B * ages)
+    return 1 - np.exp(-hazard)
+
+
+def assign_tiers(roster, watch_column="WATCH"):
+    """Add RISK and TIER columns to the roster
+
+    Args:
+        roster (Dataframe): Picks with AGE and, optionally, a watch flag
+        watch_column (str, optional): Flag that forces the hourly tier.
+            Defaults to "WATCH".
+
+    Returns:
+        Dataframe: Copy of the roster with RISK and TIER
+    """
+    risk = annual_mortality(roster["AGE"])
+
+    tier = pd.Series(TIERS[-1][0], index=roster.index, dtype=object)
+    for name, threshold, _ in reversed(TIERS[:-1]):
+        tier = tier.mask(risk >= threshold, name)
+
+    # Unknown ages get the daily check rather than being left for a week
+    tier = tier.mask(risk.isna() & (tier == TIERS[-1][0]), "daily")
+
+    if watch_column in roster:
+        watched = roster[watch_column].fillna(False).astype(bool)
+        tier = tier.mask(watched, TIERS[0][0])
+
+    return roster.assign(RISK=risk, TIER=tier)
+
+
+def tier_min_age(threshold):
+    """Youngest whole age whose annual risk reaches a threshold"""
+    return math.ceil(math.log(-math.log(1 - threshold) / GOMPERTZ_A) / GOMPERTZ_B)
+
+
+# The same tiers as assign_tiers, as a SQL expression over AGE and WATCH
+TIER_SQL = (
+    "CASE"
+    f" WHEN COALESCE(WATCH, FALSE) OR AGE >= {tier_min_age(TIERS[0][1])}"
+    f" THEN '{TIERS[0][0]}'"
+    f" WHEN AGE >= {tier_min_age(TIERS[1][1])} OR AGE IS NULL THEN '{TIERS[1][0]}'"
+    f" ELSE '{TIERS[2][0]}' END"
+)
+
+# LAST_CHECKED_AT is written and compared as UTC text in this format
+CHECKED_AT_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def checked_at(now=None):
+    """Timestamp to record in LAST_CHECKED_AT"""
+    return (now or datetime.now(timezone.utc)).strftime(CHECKED_AT_FORMAT)
+
+
+def due_predicate(cadence, now=None):
+    """SQL condition for the picks a run should check
+
+    Daily runs take every pick whose tier interval has passed since
+    LAST_CHECKED_AT (an hour early, so a run that starts a little earlier
+    than yesterday's still counts them), plus every pick without a
+    WIKI_ID. Weekly picks never checked before are spread over the week
+    by HASH(ID). Hourly runs take the whole hourly tier, the revision
+    check decides which of them get a full check.
+
+    Args:
+        cadence (str): "hourly", "daily" or "all"
+        now (datetime, optional): Defaults to the current time.
+
+    Returns:
+        str: Condition to AND into the roster query, "TRUE" for "all"
+    """
+    if cadence == "all":
+        return "TRUE"
+    if cadence == "hourly":
+        return f"{TIER_SQL} = '{TIERS[0][0]}'"
+
+    now = now or datetime.now(timezone.utc)
+    due = ["WIKI_ID IS NULL"]
+    for name, _, hours in TIERS:
+        cutoff = checked_at(now - timedelta(hours=max(hours, 24) - 1))
+        overdue = f"LAST_CHECKED_AT <= '{cutoff}'"
+        days = max(hours // 24, 1)
+        if days > 1:
+            never = f"MOD(ABS(HASH(ID)), {days}) = {now.toordinal() % days}"
+        else:
+            never = "TRUE"
+        due.append(
+            f"({TIER_SQL} = '{name}' AND (({overdue})"
+            f" OR (LAST_CHECKED_AT IS NULL AND {never})))"
+        )
+    return "(" + " OR ".join(due) + ")"
@@ -2,16 +2,19 @@
 
 import asyncio
 from prefect import task
-from prefect_slack import SlackWebhook
-from prefect_slack.messages import send_incoming_webhook_message
+from utilities.util_blocks import load_block
+from utilities.util_metrics import timed
 
 
 async def send_message(slack_webhook, text_only_message, message_block):
-    await send_incoming_webhook_message(
-        slack_webhook=slack_webhook,
-        text=text_only_message,
-        slack_blocks=message_block,
-    )
+    from prefect_slack.messages import send_incoming_webhook_message
+
+    with timed("slack"):
+        await send_incoming_webhook_message(
+            slack_webhook=slack_webhook,
+            text=text_only_message,
+            slack_blocks=message_block,
+        )
 
 
 @task(name="Slack Notification for Bad Wiki Page")
@@ -25,7 +28,9 @@ def bad_wiki_page(person, wiki_page, emoji):
     Returns:
         _type_: _description_
     """
-    slack_webhook = SlackWebhook.load("slack-notifications")
+    from prefect_slack import SlackWebhook
+
+    slack_webhook = load_block(SlackWebhook, "slack-notifications")
 
     death_details = f"• Person: {person} \n• Wiki Page: {wiki_page}"
 
@@ -48,9 +53,8 @@ def bad_wiki_page(person, wiki_page, emoji):
     )  # Run the async function
 
 
-@task(name="Slack Notification for Death")
-def death_notification(person, birth_date, death_date, age, emoji):
-    """Deadpool Slack notifcation
+def death_message(person, birth_date, death_date, age, emoji):
+    """Build the text and blocks for a death notification
 
     Args:
         person (str): Name of the Person
@@ -60,10 +64,8 @@ def death_notification(person, birth_date, death_date, age, emoji):
         emoji (str): Slack formatted emjo e.g., :bat:
 
     Returns:
-        _type_: _description_
+        tuple: Text only message and the message blocks
     """
-    slack_webhook = SlackWebhook.load("slack-notifications")
-
     death_details = (
         f"• Birth Date: {birth_date} \n• Death Date: {death_date} \n• Age: {age}"  # noqa: E501
     )
@@ -82,6 +84,61 @@ def death_notification(person, birth_date, death_date, age, emoji):
         {"type": "section", "text": {"type": "mrkdwn", "text": death_details}},
     ]
 
+    return text_only_message, message_block
+
+
+@task(name="Slack Notification for Death")
+def death_notification(person, birth_date, death_date, age, emoji):
+    """Deadpool Slack notifcation
+
+    Args:
+        person (str): Name of the Person
+        birth_date (str): Birth Date
+        death_date (str): Death Date
+        age (str): Age
+        emoji (str): Slack formatted emjo e.g., :bat:
+
+    Returns:
+        _type_: _description_
+    """
+    from prefect_slack import SlackWebhook
+
+    slack_webhook = load_block(SlackWebhook, "slack-notifications")
+
+    text_only_message, message_block = death_message(
+        person, birth_date, death_date, age, emoji
+    )
+
     asyncio.run(
         send_message(slack_webhook, text_only_message, message_block)
     )  # Run the async function
+
+
+async def send_death_notification(person, birth_date, death_date, age, emoji):
+    """Deadpool Slack notifcation for async callers outside of a task
+
+    Args:
+        person (str): Name of the Person
+        birth_date (str): Birth Date
+        death_date (str): Death Date
+        age (str): Age
+        emoji (str): Slack formatted emjo e.g., :bat:
+    """
+    from prefect_slack import SlackWebhook
+
+    # Block loading is blocking, keep it off the event loop
+    slack_webhook = await asyncio.to_thread(
+        load_block, SlackWebhook, "slack-notifications"
+    )
+
+    text_only_message, message_block = death_message(
+        person, birth_date, death_date, age, emoji
+    )
+
+    with timed("slack") as span:
+        response = await slack_webhook.get_client().send(
+            text=text_only_message, blocks=message_block
+        )
+        span.bytes = len(str(message_block))
+        if response.status_code >= 400:
+            raise RuntimeError(f"Slack webhook failed: {response.status_code}")
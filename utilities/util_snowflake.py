@@ -1,14 +1,28 @@
 """Snowflake Utilites"""
+import os
+import tempfile
+import threading
 from prefect import task, get_run_logger
-from prefect_snowflake.database import SnowflakeConnector
-from snowflake.connector.pandas_tools import write_pandas
+from prefect.runtime import flow_run
 from prefect.cache_policies import NONE
+from utilities.util_batch import chunked
+from utilities.util_cache import LRUCache
+from utilities.util_blocks import load_block
+from utilities.util_metrics import metrics, timed
+from utilities.util_membership import MembershipIndex
+
+# Small, static reference tables (recipient lists etc.) read within a run
+reference_cache = LRUCache(maxsize=64)
+metrics.track_cache("snowflake reference", reference_cache)
+_reference_lock = threading.Lock()
 
 
 @task(name="Create Snowflake Connection")
 def get_snowflake_connection(block_name):
     """Establish a Snowflake connection and return it as a context manager."""
-    connector = SnowflakeConnector.load(block_name)
+    from prefect_snowflake.database import SnowflakeConnector
+
+    connector = load_block(SnowflakeConnector, block_name)
     connection = connector.get_connection()
     return connection
 
@@ -25,10 +39,27 @@ def create_table(connection, database_name, schema_name, table_name, DDL):
         f"CREATE TABLE IF NOT EXISTS {database_name}.{schema_name}."
         f"{table_name} ({DDL})"
     )
-    with connection.cursor() as cursor:
+    with timed("snowflake"), connection.cursor() as cursor:
         cursor.execute(statement)
 
 
+@task(name="Add Columns in Snowflake", cache_policy=NONE)
+def add_columns(connection, database_name, schema_name, table_name, columns):
+    """Adds any missing columns to an existing table
+
+    Args:
+        connection (connection): Snowflake Connection
+        columns (dict): Column name to type, e.g. {"ROW_HASH": "VARCHAR(16)"}
+    """
+
+    with timed("snowflake"), connection.cursor() as cursor:
+        for column_name, column_type in columns.items():
+            cursor.execute(
+                f"ALTER TABLE {database_name}.{schema_name}.{table_name} "
+                f"ADD COLUMN IF NOT EXISTS {column_name} {column_type}"
+            )
+
+
 @task(name="Update Rows", timeout_seconds=15, cache_policy=NONE)
 def update_rows(
     connection,
@@ -54,7 +85,7 @@ def update_rows(
         f"{set_string} {conditionals};"
     )
 
-    with connection.cursor() as cursor:
+    with timed("snowflake"), connection.cursor() as cursor:
         cursor.execute(statement)
 
     return
@@ -91,9 +122,10 @@ def get_existing_values(
         f"{table_name} {conditionals};"
     )
 
-    with connection.cursor() as cursor:
+    with timed("snowflake") as span, connection.cursor() as cursor:
         cursor.execute(statement)
         df = cursor.fetch_pandas_all()
+        span.bytes = int(df.memory_usage(deep=True).sum())
 
     if return_list:
         existing_values_list = df[column_name].tolist()
@@ -102,6 +134,84 @@ def get_existing_values(
         return df
 
 
+def get_reference_values(
+    connection,
+    database_name,
+    schema_name,
+    table_name,
+    column_name,
+    conditionals=None,
+    return_list=True,
+):
+    """get_existing_values for small reference tables, cached for the flow run
+
+    The first call in a flow run queries Snowflake, later calls with the
+    same arguments are served from memory. Entries are keyed by flow run
+    id so a new run (or a retry in a new process) always reads fresh
+    values. Use invalidate_reference_values after writing to a table.
+    Safe to call from worker threads.
+
+    Args:
+        connection (conn): snowflake connection
+        database_name (String): target DB name
+        schema_name (String): target Schema
+        table_name (String): Target Table
+        column_name (String): Column to Select and Return
+        conditionals (String, optional): "LIMIT 10". Defaults to None.
+        return_list (Bool), optional): If you want a list or a Dataframe
+
+    Returns:
+        list: Flat list of all values, or a Dataframe if return_list is False
+    """
+    key = (
+        flow_run.id,
+        database_name,
+        schema_name,
+        table_name,
+        column_name,
+        conditionals,
+        return_list,
+    )
+
+    def load():
+        return get_existing_values.fn(
+            connection,
+            database_name,
+            schema_name,
+            table_name,
+            column_name,
+            conditionals,
+            return_list,
+        )
+
+    # Serialize loads so concurrent callers don't all miss and query at once
+    with _reference_lock:
+        values = reference_cache.get_or_load(key, load)
+
+    # Hand out copies so callers can't change the cached values
+    return list(values) if return_list else values.copy()
+
+
+def invalidate_reference_values(
+    database_name=None, schema_name=None, table_name=None
+):
+    """Drop cached reference values, for one table or everything
+
+    Args:
+        database_name (String, optional): Only this DB. Defaults to any.
+        schema_name (String, optional): Only this Schema. Defaults to any.
+        table_name (String, optional): Only this Table. Defaults to any.
+    """
+    wanted = (database_name, schema_name, table_name)
+
+    def matches(key):
+        return all(
+            want is None or want == got for want, got in zip(wanted, key[1:4])
+        )
+
+    reference_cache.invalidate_matching(matches)
+
+
 @task(name="Write Dataframe to Snowflake", cache_policy=NONE)
 def write_dataframe(connection,
                     database_name,
@@ -114,19 +224,249 @@ def write_dataframe(connection,
         connection (_type_): Snowflake Connection
         filtered_df (_type_): Deduped Dataframe
     """
+    from snowflake.connector.pandas_tools import write_pandas
+
     logger = get_run_logger()
 
     if len(filtered_df) != 0:
         logger.info(filtered_df)
 
-        write_pandas(
-            conn=connection,
-            df=filtered_df,
-            table_name=table_name,
-            database=database_name,
-            schema=schema_name,
-        )
+        with timed("snowflake") as span:
+            write_pandas(
+                conn=connection,
+                df=filtered_df,
+                table_name=table_name,
+                database=database_name,
+                schema=schema_name,
+            )
+            span.bytes = int(filtered_df.memory_usage(deep=True).sum())
 
         logger.info("Data loaded to Snowflake")
     else:
         logger.info("No new records to log")
+
+
+@task(name="Bulk Update Rows", cache_policy=NONE)
+def bulk_update_rows(
+    connection,
+    database_name,
+    schema_name,
+    table_name,
+    df,
+    key_column,
+    column_types=None,
+    batch_size=1000,
+):
+    """Update many rows with one statement per batch, matched on a key column
+
+    The values are bound as parameters into an UPDATE ... FROM VALUES
+    statement so there is no per-row round trip or quote escaping.
+
+    Args:
+        connection (connection): Snowflake Connection
+        database_name (String): target DB name
+        schema_name (String): target Schema
+        table_name (String): Target Table
+        df (Dataframe): Key column plus the columns to set
+        key_column (String): Column to match rows on, e.g. "ID"
+        column_types (dict, optional): Snowflake casts, e.g. {"BIRTH_DATE": "DATE"}
+        batch_size (int, optional): Rows per statement. Defaults to 1000.
+
+    Returns:
+        int: Number of rows sent for update
+    """
+    logger = get_run_logger()
+
+    if len(df) == 0:
+        logger.info("No rows to update")
+        return 0
+
+    column_types = column_types or {}
+    columns = list(df.columns)
+
+    select_list = ", ".join(
+        f"column{i}::{column_types[column]} AS {column}"
+        if column in column_types
+        else f"column{i} AS {column}"
+        for i, column in enumerate(columns, start=1)
+    )
+    set_list = ", ".join(
+        f"{column} = source.{column}" for column in columns if column != key_column
+    )
+    row_placeholder = "(" + ", ".join(["%s"] * len(columns)) + ")"
+
+    values = df.astype(object).where(df.notna(), None)
+    rows = list(values.itertuples(index=False, name=None))
+
+    for batch in chunked(rows, batch_size):
+        statement = (
+            f"UPDATE {database_name}.{schema_name}.{table_name} AS target "
+            f"SET {set_list} "
+            f"FROM (SELECT {select_list} FROM VALUES "
+            f"{', '.join([row_placeholder] * len(batch))}) AS source "
+            f"WHERE target.{key_column} = source.{key_column};"
+        )
+        params = [value for row in batch for value in row]
+
+        with timed("snowflake"), connection.cursor() as cursor:
+            cursor.execute(statement, params)
+
+    logger.info("Updated %s rows in %s", len(rows), table_name)
+    return len(rows)
+
+
+@task(name="Get Matching Values", cache_policy=NONE)
+def get_matching_values(
+    connection,
+    database_name,
+    schema_name,
+    table_name,
+    column_name,
+    values,
+    batch_size=1000,
+):
+    """Which of the given values exist in a column, without reading the column
+
+    Args:
+        connection (connection): Snowflake Connection
+        database_name (String): target DB name
+        schema_name (String): target Schema
+        table_name (String): Target Table
+        column_name (String): Column to match
+        values (list): Candidate values
+        batch_size (int, optional): Values per IN list. Defaults to 1000.
+
+    Returns:
+        list: The values that are in the column
+    """
+    found = []
+    for batch in chunked(list(dict.fromkeys(values)), batch_size):
+        statement = (
+            f"SELECT DISTINCT {column_name} FROM {database_name}.{schema_name}."
+            f"{table_name} WHERE {column_name} IN ({', '.join(['%s'] * len(batch))});"
+        )
+        with timed("snowflake"), connection.cursor() as cursor:
+            cursor.execute(statement, batch)
+            found.extend(cursor.fetch_pandas_all()[column_name].tolist())
+    return found
+
+
+def _index_stage(database_name, schema_name, table_name):
+    """Folder for membership indexes in the table's own stage"""
+    return f"@{database_name}.{schema_name}.%{table_name}/membership"
+
+
+def _column_watermark(cursor, database_name, schema_name, table_name, column_name):
+    """Row count and order independent HASH_AGG of a column
+
+    Computed in Snowflake, so it covers the whole column without
+    downloading it. Any insert, delete or update of the column changes
+    the hash, even one that leaves the row count the same.
+
+    Returns:
+        tuple: Row count and the content hash as a string
+    """
+    cursor.execute(
+        f"SELECT COUNT(*) AS ROW_COUNT, HASH_AGG({column_name}) AS CONTENT_HASH "
+        f"FROM {database_name}.{schema_name}.{table_name};"
+    )
+    row_count, content_hash = cursor.fetch_pandas_all().iloc[0].tolist()
+    return int(row_count), str(content_hash)
+
+
+@task(name="Save Membership Index", cache_policy=NONE)
+def save_membership_index(
+    connection, database_name, schema_name, table_name, column_name, index
+):
+    """Upload a membership index to the table's stage, replacing the old one
+
+    The column's current HASH_AGG is stored with it, so save right after
+    writing the rows the index was updated with.
+
+    Args:
+        connection (connection): Snowflake Connection
+        database_name (String): target DB name
+        schema_name (String): target Schema
+        table_name (String): Table the index covers
+        column_name (String): Column the index covers
+        index (MembershipIndex): Index to store
+    """
+    stage = _index_stage(database_name, schema_name, table_name)
+
+    with timed("snowflake"), connection.cursor() as cursor:
+        _, index.watermark = _column_watermark(
+            cursor, database_name, schema_name, table_name, column_name
+        )
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, f"{column_name}.npz")
+        with open(path, "wb") as f:
+            f.write(index.to_bytes())
+
+        with timed("snowflake") as span, connection.cursor() as cursor:
+            cursor.execute(
+                f"PUT 'file://{path}' {stage} AUTO_COMPRESS=FALSE OVERWRITE=TRUE"
+            )
+            span.bytes = os.path.getsize(path)
+
+
+@task(name="Load Membership Index", cache_policy=NONE)
+def load_membership_index(
+    connection, database_name, schema_name, table_name, column_name
+):
+    """Load the membership index kept next to a table
+
+    The index is rebuilt from a full read of the column, and saved, when
+    there isn't one yet or the column changed behind its back: the row
+    count differs from the rows the index covers (e.g. a concurrent
+    writer) or the column's HASH_AGG differs from the one saved with it
+    (e.g. rows deleted and the same number inserted).
+
+    Args:
+        connection (connection): Snowflake Connection
+        database_name (String): target DB name
+        schema_name (String): target Schema
+        table_name (String): Table the index covers
+        column_name (String): Column the index covers
+
+    Returns:
+        MembershipIndex: Index of every value in the column
+    """
+    logger = get_run_logger()
+    stage = _index_stage(database_name, schema_name, table_name)
+    file_name = f"{column_name}.npz"
+
+    with tempfile.TemporaryDirectory() as tmp:
+        with timed("snowflake") as span, connection.cursor() as cursor:
+            row_count, content_hash = _column_watermark(
+                cursor, database_name, schema_name, table_name, column_name
+            )
+            cursor.execute(f"GET {stage}/{file_name} 'file://{tmp}/'")
+
+            path = os.path.join(tmp, file_name)
+            stored = os.path.exists(path)
+            if stored:
+                span.bytes = os.path.getsize(path)
+                with open(path, "rb") as f:
+                    index = MembershipIndex.from_bytes(f.read())
+
+    if stored and index.rows == row_count and index.watermark == content_hash:
+        logger.info(
+            "Membership index for %s.%s: %s values", table_name, column_name, len(index)
+        )
+        return index
+
+    logger.info(
+        "Rebuilding the membership index for %s.%s from %s rows",
+        table_name,
+        column_name,
+        row_count,
+    )
+    values = get_existing_values.fn(
+        connection, database_name, schema_name, table_name, column_name
+    )
+    index = MembershipIndex.from_values(values)
+    save_membership_index.fn(
+        connection, database_name, schema_name, table_name, column_name, index
+    )
+    return index
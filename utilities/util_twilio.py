@@ -3,21 +3,20 @@ General Twilio and SMS sending utilities
 """
 
 from prefect import task
-from twilio.rest import Client
-from prefect.blocks.notifications import TwilioSMS
-from prefect.blocks.system import Secret
-from utilities.util_apify import the_arbiter
+from utilities.util_blocks import get_secret, load_block
+from utilities.util_metrics import timed
 
 
 @task(name="Send Simple SMS Message")
 def send_sms_via_prefect(message):
-    twilio_webhook_block = TwilioSMS.load("twilio-dka", validate=False)
+    from prefect.blocks.notifications import TwilioSMS
+
+    twilio_webhook_block = load_block(TwilioSMS, "twilio-dka", validate=False)
     twilio_webhook_block.to_phone_numbers = ["+14155479222"]
     twilio_webhook_block.notify(message)
 
 
-@task(name="Send SMS Messages to Opt In List")
-def send_sms_via_api(message_text, distro_list, arbiter=False):
+def send_sms(message_text, distro_list, arbiter=False):
     """Send and SMS via Twillio to a list of numbers
 
     Args:
@@ -26,19 +25,20 @@ def send_sms_via_api(message_text, distro_list, arbiter=False):
         arbiter (bool, optional): do you want to use the AI Chatbot.
 
     Returns:
-        _type_: _description_
+        str: SID of the last message sent, None if the list is empty
     """
-    account_sid_block = Secret.load("twilio-sid")
-    auth_token_block = Secret.load("twilio-token")
-    from_number_block = Secret.load("twilio-from")
+    # Access the stored secrets, cached for the process
+    account_sid = get_secret("twilio-sid")
+    auth_token = get_secret("twilio-token")
+    from_number = get_secret("twilio-from")
 
-    # Access the stored secret
-    account_sid = account_sid_block.get()
-    auth_token = auth_token_block.get()
-    from_number = from_number_block.get()
+    from twilio.rest import Client
 
     if arbiter:
-        message_text = the_arbiter(message_text)
+        from utilities.util_apify import the_arbiter
+
+        # Fall back to the plain message rather than hold up the SMS
+        message_text = the_arbiter(message_text, fallback=message_text)
 
     client = Client(account_sid, auth_token)
 
@@ -46,8 +46,25 @@ def send_sms_via_api(message_text, distro_list, arbiter=False):
         return None
     else:
         for number in distro_list:
-            message = client.messages.create(
-                from_=from_number, body=message_text, to=number
-            )
+            with timed("twilio") as span:
+                message = client.messages.create(
+                    from_=from_number, body=message_text, to=number
+                )
+                span.bytes = len(message_text)
 
     return message.sid
+
+
+@task(name="Send SMS Messages to Opt In List")
+def send_sms_via_api(message_text, distro_list, arbiter=False):
+    """Send and SMS via Twillio to a list of numbers
+
+    Args:
+        message_text (str): Any string
+        distro_list (list): numbers must be strings like - "+1231231234"
+        arbiter (bool, optional): do you want to use the AI Chatbot.
+
+    Returns:
+        _type_: _description_
+    """
+    return send_sms(message_text, distro_list, arbiter)
@@ -2,45 +2,165 @@
 Wikipedia lookup tools
 """
 
-import time
-import requests
-from functools import lru_cache
+import re
+import pandas as pd
 from prefect import get_run_logger
-from SPARQLWrapper import SPARQLWrapper, JSON
 from datetime import datetime
 from prefect import task
+from prefect.cache_policies import NONE
+from utilities.util_batch import chunked
+from utilities.util_wikidump import get_dump_index
+from utilities.util_http import request_json
 
+WIKIDATA_API_URL = "https://www.wikidata.org/w/api.php"
+WIKIPEDIA_API_URL = "https://en.wikipedia.org/w/api.php"
+WIKIDATA_SPARQL_URL = "https://query.wikidata.org/sparql"
 
-@task(name="Fetch Wiki Data")
-def fetch_wikidata(params, retries=3, delay=2):
-    """Fetch Wikidata with retries on failure.
+# MediaWiki accepts up to 50 titles per action=query request
+MAX_TITLES_PER_QUERY = 50
+
+# Entities per bulk SPARQL date query
+SPARQL_CHUNK_SIZE = 200
+
+# Seconds of replication lag after which the MediaWiki APIs turn us away
+MAXLAG_SECONDS = 5
+
+# Wikidata entity ids, anything else breaks a whole SPARQL request
+WIKI_ID_PATTERN = re.compile(r"^Q\d+$")
+
+# Statement ranks in order of preference, deprecated ones are never used
+RANKS = {
+    "http://wikiba.se/ontology#PreferredRank": 2,
+    "http://wikiba.se/ontology#NormalRank": 1,
+}
+
+# +1939-11-26T00:00:00Z, 1950-00-00T00:00:00Z, -0043-03-15T00:00:00Z
+WIKIDATA_TIME = re.compile(r"^([+-]?)(\d+)-(\d{2})-(\d{2})T")
+
+
+def is_wiki_id(value):
+    """Whether a value is a well formed Wikidata entity id, e.g. Q42"""
+    return isinstance(value, str) and bool(WIKI_ID_PATTERN.match(value))
+
+
+def parse_wikidata_time(time_str):
+    """Parse a Wikidata time value into a datetime
+
+    Handles the "+" prefix and the 00 month/day used for year and month
+    precision dates, which are returned as the first of the year/month.
+
+    Args:
+        time_str (str): Wikidata time e.g., +1950-00-00T00:00:00Z
+
+    Returns:
+        datetime: Parsed date, or None for BCE or unparseable dates
+    """
+    match = WIKIDATA_TIME.match(time_str or "")
+    if not match:
+        return None
+
+    sign, year, month, day = match.groups()
+    year, month, day = int(year), int(month), int(day)
+    if sign == "-" or not 1 <= year <= 9999:
+        return None
+
+    try:
+        return datetime(year, max(month, 1), max(day, 1))
+    except ValueError:
+        return None
+
+
+def fetch_json(url, params, retries=5, delay=1):
+    """Fetch a MediaWiki API with backoff, maxlag and circuit breaking.
+
+    Args:
+        url (str): API endpoint.
+        params (dict): Request parameters for the API.
+        retries (int): Number of attempts before giving up.
+        delay (int): Base delay in seconds for the jittered backoff.
+
+    Raises:
+        ServiceUnavailableError: The API couldn't be reached, callers should
+        fail rather than treat it as missing data.
+
+    Returns:
+        dict: JSON response from the API.
+    """
+    # Ask to be turned away when replicas lag, as Wikimedia asks of bots
+    params = {"maxlag": MAXLAG_SECONDS, **params}
+    return request_json(url, params, retries=retries, base_delay=delay)
+
+
+def fetch_wikidata(params, retries=5, delay=1):
+    """Fetch Wikidata with backoff, maxlag and circuit breaking.
 
     Args:
         params (dict): Request parameters for the Wikidata API.
-        retries (int): Number of retries before giving up.
-        delay (int): Delay in seconds between retries.
+        retries (int): Number of attempts before giving up.
+        delay (int): Base delay in seconds for the jittered backoff.
 
     Returns:
-        dict: JSON response from the API, or None if all retries fail.
+        dict: JSON response from the API.
     """
-    logger = get_run_logger()
+    return fetch_json(WIKIDATA_API_URL, params, retries, delay)
 
-    for attempt in range(retries):
-        try:
-            response = requests.get(
-                "https://www.wikidata.org/w/api.php", params=params, timeout=5
-            )
-            response.raise_for_status()  # Raise an error for HTTP issues
-            return response.json()
-        except (requests.exceptions.RequestException, ValueError) as e:
-            logger.error("Attempt %s failed: %s", attempt + 1, e)
-            time.sleep(delay)  # Wait before retrying
 
-    logger.warning("All retries failed.")
-    return None  # Return None if all retries fail
+def _final_title(title, normalized, redirects):
+    """Follow a title through normalization and redirect chains"""
+    final_title = normalized.get(title, title)
+
+    # Follow redirect chains, guarding against loops
+    seen = set()
+    while final_title in redirects and final_title not in seen:
+        seen.add(final_title)
+        final_title = redirects[final_title]
+
+    return final_title
+
+
+def resolve_page_titles(titles):
+    """Resolve normalization, redirects and Wikidata IDs for many page titles
+
+    Titles are sent 50 at a time (the MediaWiki limit) joined by "|", and
+    each response carries all the normalized and redirects mappings plus
+    the wikibase_item page prop, so there's no per-title or per-hop request.
+
+    Args:
+        titles (list): Page URL titles (end of URL)
+
+    Returns:
+        dict: Original title to {"title": resolved title, "wiki_id": Q number or None}
+    """
+    resolved = {}
+
+    for chunk in chunked(dict.fromkeys(titles), MAX_TITLES_PER_QUERY):
+        params = {
+            "action": "query",
+            "titles": "|".join(chunk),
+            "redirects": 1,
+            "prop": "pageprops",
+            "ppprop": "wikibase_item",
+            "format": "json",
+            "formatversion": 2,
+        }
+        data = fetch_json(WIKIPEDIA_API_URL, params)
+        query = data.get("query", {})
+
+        normalized = {n["from"]: n["to"] for n in query.get("normalized", [])}
+        redirects = {r["from"]: r["to"] for r in query.get("redirects", [])}
+        pages = {page["title"]: page for page in query.get("pages", [])}
+
+        for title in chunk:
+            final_title = _final_title(title, normalized, redirects)
+            page = pages.get(final_title, {})
+            resolved[title] = {
+                "title": final_title if page else title,
+                "wiki_id": page.get("pageprops", {}).get("wikibase_item"),
+            }
+
+    return resolved
 
 
-@task(name="Resolve Wiki Page Redirects")
 def resolve_redirect(title):
     """Function to assist when Wiki Pages have 1-n redirects
 
@@ -50,69 +170,113 @@ def resolve_redirect(title):
     Returns:
         str: Fully resolved title
     """
+    return resolve_page_titles([title])[title]["title"]
+
+
+def get_wiki_id_from_page(page_title):
+    """Function to get the Wikidata ID from a Wikipedia page title
+
+    Args:
+        page_title (str): Page URL title (end of URL)
+
+    Returns:
+        str: Wiki Data identifier
+    """
+    return get_wiki_ids([page_title])[page_title]
+
+
+def get_wiki_ids(page_titles):
+    """Get the Wikidata IDs for many Wikipedia page titles at once
+
+    Titles found in the local dump index (WIKIDATA_DUMP_INDEX) are answered
+    from it, only the rest go to the Wikipedia API.
+
+    Args:
+        page_titles (list): Page URL titles (end of URL)
+
+    Returns:
+        dict: Page title to Wiki Data identifier, None when not found
+    """
+    wiki_ids = {}
+    dump_index = get_dump_index()
+    if dump_index:
+        wiki_ids.update(dump_index.get_wiki_ids(page_titles))
+
+    remaining = [title for title in page_titles if title not in wiki_ids]
+    if remaining:
+        resolved = resolve_page_titles(remaining)
+        wiki_ids.update({title: page["wiki_id"] for title, page in resolved.items()})
+
+    return wiki_ids
 
-    wikipedia_api_url = "https://en.wikipedia.org/w/api.php"
 
-    def query_wikipedia(t):
+def get_latest_revids(page_titles):
+    """Get the id of the latest revision of many Wikipedia pages at once
+
+    A cheap way to tell whether a page has been edited since it was last
+    checked: 50 titles per request and no page content is downloaded.
+
+    Args:
+        page_titles (list): Page URL titles (end of URL)
+
+    Returns:
+        dict: Page title to latest revision id, None when the page is missing
+    """
+    revids = {}
+
+    for chunk in chunked(dict.fromkeys(page_titles), MAX_TITLES_PER_QUERY):
         params = {
             "action": "query",
-            "titles": t,
+            "titles": "|".join(chunk),
             "redirects": 1,
+            "prop": "revisions",
+            "rvprop": "ids",
             "format": "json",
-        }  # noqa: E501
-        response = requests.get(wikipedia_api_url, params=params, timeout=5)
-        return response.json()
-
-    data = query_wikipedia(title)
-
-    # Loop to follow through all redirects
-    while "redirects" in data["query"]:
-        # Get the last redirect target
-        redirects = data["query"]["redirects"]
-        final_redirect = redirects[-1]["to"]
-        data = query_wikipedia(final_redirect)
-
-    if "normalized" in data["query"]:
-        final_title = data["query"]["normalized"][0]["to"]
-    elif "pages" in data["query"]:
-        page_id = next(iter(data["query"]["pages"]))
-        final_title = data["query"]["pages"][page_id]["title"]
-    else:
-        final_title = title  # No normalization or redirects, use the original
+            "formatversion": 2,
+        }
+        data = fetch_json(WIKIPEDIA_API_URL, params)
+        query = data.get("query", {})
 
-    return final_title
+        normalized = {n["from"]: n["to"] for n in query.get("normalized", [])}
+        redirects = {r["from"]: r["to"] for r in query.get("redirects", [])}
+        pages = {page["title"]: page for page in query.get("pages", [])}
 
+        for title in chunk:
+            page = pages.get(_final_title(title, normalized, redirects), {})
+            revisions = page.get("revisions") or [{}]
+            revids[title] = revisions[0].get("revid")
 
-@task(name="Get Wiki ID from Page")
-def get_wiki_id_from_page(page_title):
-    """Function to get the Wikidata ID from a Wikipedia page title
+    return revids
+
+
+def fetch_entity_claims(wikidata_q_number):
+    """Download the claims of a Wikidata entity.
 
     Args:
-        page_title (str): Page URL title (end of URL)
+        wikidata_q_number (str): Wiki Data ID (Q Number).
 
     Returns:
-        str: Wiki Data identifier
+        dict: Claims keyed by property ID, or None if the entity is invalid.
     """
-    final_title = resolve_redirect(page_title)  # Resolve redirects first
     params = {
         "action": "wbgetentities",
+        "ids": wikidata_q_number,
+        "props": "claims",
         "format": "json",
-        "sites": "enwiki",
-        "titles": final_title,
         "languages": "en",
-        "redirects": "yes",
     }
+
+    logger = get_run_logger()
+
     data = fetch_wikidata(params)
-    if (
-        isinstance(data, str) or "entities" not in data or len(data["entities"]) == 0  # noqa: E501
-    ):
+
+    if not data or "entities" not in data or wikidata_q_number not in data["entities"]:
+        logger.warning("Invalid data for %s.", wikidata_q_number)
         return None
 
-    entity_id = list(data["entities"].keys())[0]
-    return entity_id
+    return data["entities"][wikidata_q_number].get("claims", {})
 
 
-@lru_cache(maxsize=128)
 def get_birth_death_date(wikidata_prop_id, wikidata_q_number):
     """Get a birth or death date from Wikidata.
 
@@ -123,23 +287,21 @@ def get_birth_death_date(wikidata_prop_id, wikidata_q_number):
     Returns:
         datetime: Date of the requested entity, or None if not found.
     """
-    params = {
-        "action": "wbgetentities",
-        "ids": wikidata_q_number,
-        "format": "json",
-        "languages": "en",
-    }
+    # A date in the local dump index is final. A missing one may just be
+    # newer than the dump (e.g. a recent death) so that goes to the API.
+    dump_index = get_dump_index()
+    if dump_index:
+        claim = dump_index.get_claim(wikidata_prop_id, wikidata_q_number)
+        if claim and claim[0]:
+            return parse_wikidata_time(claim[0])
 
     logger = get_run_logger()
 
-    data = fetch_wikidata(params)
-
-    if not data or "entities" not in data or wikidata_q_number not in data["entities"]:
-        logger.warning("Invalid data for %s.", wikidata_q_number)
+    claims = fetch_entity_claims(wikidata_q_number)
+    if claims is None:
         return None
 
     try:
-        claims = data["entities"][wikidata_q_number]["claims"]
         if wikidata_prop_id not in claims:
             logger.info(
                 "Property %s not found for %s.", wikidata_prop_id, wikidata_q_number
@@ -149,26 +311,220 @@ def get_birth_death_date(wikidata_prop_id, wikidata_q_number):
         date_str = claims[wikidata_prop_id][0]["mainsnak"]["datavalue"]["value"]["time"]
     except (KeyError, IndexError, TypeError) as e:
         logger.warning("Error accessing data: %s", e)
-        logger.info("Data received: %s", data)
+        logger.info("Claims received: %s", claims.get(wikidata_prop_id))
         return None
 
-    if date_str.startswith("-") or date_str.startswith("+"):
-        date_str = date_str[1:]
-
-    try:
-        if date_str.endswith("-00-00T00:00:00Z"):
-            date_obj = datetime.strptime(date_str, "%Y-00-00T00:00:00Z")
-        elif date_str[5:7] != "00" and date_str.endswith("-00T00:00:00Z"):
-            date_obj = datetime.strptime(date_str, "%Y-%m-00T00:00:00Z")
-        else:
-            date_obj = datetime.strptime(date_str, "%Y-%m-%dT%H:%M:%SZ")
-    except ValueError as e:
-        logger.error("Error parsing date: %s", e)
-        return None
+    date_obj = parse_wikidata_time(date_str)
+    if date_obj is None:
+        logger.error("Error parsing date: %s", date_str)
 
     return date_obj
 
 
+def build_sparql_dates_query(entity_ids):
+    """Build one SPARQL query for the birth and death dates of many entities
+
+    Args:
+        entity_ids (list): Wikidata entity IDs, e.g. ["Q1", "Q2"]
+
+    Returns:
+        str: SPARQL query
+    """
+    values = " ".join(f"wd:{entity_id}" for entity_id in entity_ids)
+
+    return f"""
+    SELECT ?item ?birthDate ?birthPrecision ?birthRank
+           ?deathDate ?deathPrecision ?deathRank
+    WHERE {{
+      VALUES ?item {{ {values} }}
+      OPTIONAL {{
+        ?item p:P569 ?birthStatement .
+        ?birthStatement wikibase:rank ?birthRank ;
+                        psv:P569 ?birthNode .
+        FILTER(?birthRank != wikibase:DeprecatedRank)
+        ?birthNode wikibase:timeValue ?birthDate ;
+                   wikibase:timePrecision ?birthPrecision .
+      }}
+      OPTIONAL {{
+        ?item p:P570 ?deathStatement .
+        ?deathStatement wikibase:rank ?deathRank ;
+                        psv:P570 ?deathNode .
+        FILTER(?deathRank != wikibase:DeprecatedRank)
+        ?deathNode wikibase:timeValue ?deathDate ;
+                   wikibase:timePrecision ?deathPrecision .
+      }}
+    }}
+    """
+
+
+def parse_sparql_dates(results):
+    """Turn SPARQL JSON results into one row of dates per entity
+
+    Entities with several birth or death statements come back as several
+    bindings. Deprecated statements (e.g. a retracted death) are ignored,
+    preferred rank beats normal rank, then the more precise date, then
+    the earlier one, so the choice doesn't depend on the binding order.
+
+    Args:
+        results (dict): SPARQL JSON results
+
+    Returns:
+        Dataframe: WIKI_ID, BIRTH_DATE, BIRTH_PRECISION, DEATH_DATE, DEATH_PRECISION
+    """
+    best = {}
+    for binding in results["results"]["bindings"]:
+        entity_id = binding["item"]["value"].rsplit("/", 1)[-1]
+        entity = best.setdefault(entity_id, {})
+
+        for prefix, column in (("birth", "BIRTH"), ("death", "DEATH")):
+            if f"{prefix}Date" not in binding:
+                continue
+
+            # Results without ranks (older queries) count as normal rank
+            rank = binding.get(f"{prefix}Rank", {}).get(
+                "value", "http://wikiba.se/ontology#NormalRank"
+            )
+            date = parse_wikidata_time(binding[f"{prefix}Date"]["value"])
+            if rank not in RANKS or date is None:
+                continue
+
+            precision = binding.get(f"{prefix}Precision")
+            precision = int(precision["value"]) if precision else None
+            key = (RANKS[rank], precision or 0, -date.toordinal())
+            if column not in entity or key > entity[column][0]:
+                entity[column] = (key, date, precision)
+
+    rows = []
+    for entity_id, entity in best.items():
+        row = {"WIKI_ID": entity_id}
+        for column in ("BIRTH", "DEATH"):
+            _, date, precision = entity.get(column, (None, None, None))
+            row[f"{column}_DATE"] = date
+            row[f"{column}_PRECISION"] = precision
+        rows.append(row)
+
+    return pd.DataFrame(
+        rows,
+        columns=[
+            "WIKI_ID",
+            "BIRTH_DATE",
+            "BIRTH_PRECISION",
+            "DEATH_DATE",
+            "DEATH_PRECISION",
+        ],
+        dtype=object,
+    )
+
+
+def dump_dates(people):
+    """Turn dump index claims into rows like parse_sparql_dates returns
+
+    Args:
+        people (dict): Q number to (birth_time, birth_precision, death_time,
+            death_precision), from WikidataDumpIndex.get_people
+
+    Returns:
+        Dataframe: WIKI_ID, BIRTH_DATE, BIRTH_PRECISION, DEATH_DATE, DEATH_PRECISION
+    """
+    rows = [
+        {
+            "WIKI_ID": wiki_id,
+            "BIRTH_DATE": parse_wikidata_time(birth_time) if birth_time else None,
+            "BIRTH_PRECISION": birth_precision,
+            "DEATH_DATE": parse_wikidata_time(death_time) if death_time else None,
+            "DEATH_PRECISION": death_precision,
+        }
+        for wiki_id, (birth_time, birth_precision, death_time, death_precision)
+        in people.items()
+    ]
+    return pd.DataFrame(
+        rows,
+        columns=[
+            "WIKI_ID",
+            "BIRTH_DATE",
+            "BIRTH_PRECISION",
+            "DEATH_DATE",
+            "DEATH_PRECISION",
+        ],
+        dtype=object,
+    )
+
+
+def query_birth_death_dates(entity_ids, chunk_size=SPARQL_CHUNK_SIZE):
+    """Fetch birth and death dates for many entities, one request per chunk
+
+    Malformed ids are left out of the queries, one would fail the whole
+    request, and come back without dates like any other unknown entity.
+    People who are dead in the local dump index (WIKIDATA_DUMP_INDEX) are
+    answered from it, everyone else may have died since and is queried.
+
+    Args:
+        entity_ids (list): Wikidata entity IDs
+        chunk_size (int, optional): Entities per SPARQL request. Defaults to 200.
+
+    Returns:
+        Dataframe: One row per requested entity, dates are None when unknown
+    """
+    entity_ids = list(dict.fromkeys(entity_ids))
+    valid_ids = [entity_id for entity_id in entity_ids if is_wiki_id(entity_id)]
+    if len(valid_ids) < len(entity_ids):
+        get_run_logger().warning(
+            "Skipping malformed Wiki IDs: %s",
+            [entity_id for entity_id in entity_ids if not is_wiki_id(entity_id)],
+        )
+    frames = []
+
+    dump_index = get_dump_index()
+    if dump_index:
+        dead = {
+            wiki_id: claims
+            for wiki_id, claims in dump_index.get_people(valid_ids).items()
+            if claims[2]
+        }
+        if dead:
+            frames.append(dump_dates(dead))
+        valid_ids = [entity_id for entity_id in valid_ids if entity_id not in dead]
+
+    for chunk in chunked(valid_ids, chunk_size):
+        results = request_json(
+            WIKIDATA_SPARQL_URL,
+            method="POST",
+            timeout=60,
+            data={"query": build_sparql_dates_query(chunk)},
+            headers={
+                "Accept": "application/sparql-results+json",
+                "User-Agent": "prefect-dka",
+            },
+        )
+        frames.append(parse_sparql_dates(results))
+
+    if not frames:
+        frames.append(parse_sparql_dates({"results": {"bindings": []}}))
+
+    # Make sure every requested entity has a row even without any dates
+    requested = pd.DataFrame({"WIKI_ID": entity_ids}, dtype=object)
+    dates = requested.merge(pd.concat(frames), on="WIKI_ID", how="left")
+    return dates.astype(object).where(dates.notna(), None)
+
+
+@task(name="Get Birth and Death Dates via SPARQL", cache_policy=NONE)
+def get_birth_death_dates_sparql(entity_ids, chunk_size=SPARQL_CHUNK_SIZE):
+    """Fetches the birth and death dates and their precision for many
+    entities from Wikidata using batched SPARQL queries.
+
+    Args:
+        entity_ids (list): Wikidata entity IDs.
+        chunk_size (int, optional): Entities per request. Defaults to 200.
+
+    Returns:
+        Dataframe: WIKI_ID, BIRTH_DATE, BIRTH_PRECISION, DEATH_DATE, DEATH_PRECISION
+    """
+    logger = get_run_logger()
+    dates = query_birth_death_dates(entity_ids, chunk_size)
+    logger.info("Fetched dates for %s entities", len(dates))
+    return dates
+
+
 @task(name="Get Birth and Death Date via SQARQL")
 def get_birth_death_date_sparql(entity_id):
     """Fetches the birth and/or death dates of a given entity
@@ -181,7 +537,9 @@ def get_birth_death_date_sparql(entity_id):
         tuple: A tuple containing the birth date and death date as
         datetime objects or None.
     """
-    sparql = SPARQLWrapper("https://query.wikidata.org/sparql")
+    from SPARQLWrapper import SPARQLWrapper, JSON
+
+    sparql = SPARQLWrapper(WIKIDATA_SPARQL_URL)
 
     # Updated query to optionally match birth and death dates
     query = f"""
@@ -202,9 +560,9 @@ def get_birth_death_date_sparql(entity_id):
     for result in results["results"]["bindings"]:
         if "birthDate" in result:
             birth_date_str = result["birthDate"]["value"]
-            birth_date = datetime.strptime(birth_date_str, "%Y-%m-%dT%H:%M:%SZ")  # noqa: E501
+            birth_date = parse_wikidata_time(birth_date_str)
         if "deathDate" in result:
             death_date_str = result["deathDate"]["value"]
-            death_date = datetime.strptime(death_date_str, "%Y-%m-%dT%H:%M:%SZ")  # noqa: E501
+            death_date = parse_wikidata_time(death_date_str)
 
     return birth_date, death_date
@@ -0,0 +1,276 @@
+"""
+Local Wikidata dump index for offline id and date lookups
+
+Streams a (possibly filtered) Wikidata JSON dump one entity per line and
+keeps only humans with their enwiki title and birth/death claims in a
+small SQLite file. Point WIKIDATA_DUMP_INDEX at the file and the lookups
+in util_wiki check it before going to the network. A death in the index
+is final, but anyone alive in it may have died since the dump was taken,
+so their dates are still looked up online.
+
+    python -m utilities.util_wikidump latest-all.json.gz wikidata_people.sqlite
+"""
+
+import bz2
+import gzip
+import json
+import os
+import re
+import sqlite3
+import sys
+import threading
+
+HUMAN = "Q5"
+
+# Claim ranks in order of preference, deprecated ones are never indexed
+RANKS = {"preferred": 2, "normal": 1}
+
+# +1939-11-26T00:00:00Z, 1950-00-00T00:00:00Z, -0043-03-15T00:00:00Z
+TIME = re.compile(r"^([+-]?)(\d+)-(\d{2})-(\d{2})T")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS people (
+    wiki_id TEXT PRIMARY KEY,
+    enwiki_title TEXT,
+    birth_time TEXT,
+    birth_precision INTEGER,
+    death_time TEXT,
+    death_precision INTEGER
+);
+CREATE INDEX IF NOT EXISTS people_enwiki_title ON people (enwiki_title);
+"""
+
+
+def open_dump(dump_path):
+    """Open a plain, gzip or bz2 dump file for reading text"""
+    if dump_path.endswith(".gz"):
+        return gzip.open(dump_path, "rt", encoding="utf-8")
+    if dump_path.endswith(".bz2"):
+        return bz2.open(dump_path, "rt", encoding="utf-8")
+    return open(dump_path, "rt", encoding="utf-8")
+
+
+def iter_dump_entities(dump_path):
+    """Yield entities from a dump one at a time
+
+    Dumps are a JSON array with one entity per line, so only one line is
+    ever held in memory.
+
+    Args:
+        dump_path (str): Path to the dump
+
+    Yields:
+        dict: Wikidata entity
+    """
+    with open_dump(dump_path) as dump:
+        for line in dump:
+            line = line.strip().rstrip(",")
+            if line in ("", "[", "]"):
+                continue
+            yield json.loads(line)
+
+
+def normalize_title(title):
+    """Match MediaWiki title normalization, e.g. tina_turner -> Tina turner"""
+    title = title.replace("_", " ").strip()
+    return title[:1].upper() + title[1:]
+
+
+def _best_time(claims, prop_id):
+    """Return the time and precision of the best dated claim for a property
+
+    Deprecated claims (e.g. a retracted death) are skipped, preferred rank
+    beats normal rank, then the more precise date, then the earlier one,
+    the same choice util_wiki.parse_sparql_dates makes.
+    """
+    best = None
+    for claim in claims.get(prop_id, []):
+        try:
+            value = claim["mainsnak"]["datavalue"]["value"]
+            time = value["time"]
+        except (KeyError, TypeError):
+            continue
+        rank = RANKS.get(claim.get("rank", "normal"))
+        match = TIME.match(time)
+        if rank is None or not match:
+            continue
+
+        sign, year, month, day = match.groups()
+        year = -int(year) if sign == "-" else int(year)
+        key = (rank, value.get("precision") or 0, (-year, -int(month), -int(day)))
+        if best is None or key > best[0]:
+            best = (key, time, value.get("precision"))
+
+    return best[1:] if best else (None, None)
+
+
+def extract_person(entity):
+    """Pull the indexed fields out of an entity, None if it isn't a human
+
+    Args:
+        entity (dict): Wikidata entity
+
+    Returns:
+        tuple: wiki_id, enwiki_title, birth_time, birth_precision,
+        death_time, death_precision
+    """
+    claims = entity.get("claims", {})
+
+    instance_of = [
+        claim.get("mainsnak", {}).get("datavalue", {}).get("value", {}).get("id")
+        for claim in claims.get("P31", [])
+    ]
+    if HUMAN not in instance_of:
+        return None
+
+    enwiki = entity.get("sitelinks", {}).get("enwiki", {}).get("title")
+    birth_time, birth_precision = _best_time(claims, "P569")
+    death_time, death_precision = _best_time(claims, "P570")
+
+    return (
+        entity["id"],
+        normalize_title(enwiki) if enwiki else None,
+        birth_time,
+        birth_precision,
+        death_time,
+        death_precision,
+    )
+
+
+def build_dump_index(dump_path, index_path, batch_size=10000):
+    """Stream a dump into a SQLite index of humans
+
+    Args:
+        dump_path (str): Path to the JSON dump (.json, .json.gz or .json.bz2)
+        index_path (str): SQLite file to create or update
+        batch_size (int, optional): Rows per insert batch. Defaults to 10000.
+
+    Returns:
+        int: Number of people written
+    """
+    connection = sqlite3.connect(index_path)
+    connection.executescript(SCHEMA)
+
+    statement = "INSERT OR REPLACE INTO people VALUES (?, ?, ?, ?, ?, ?)"
+    batch = []
+    written = 0
+
+    for entity in iter_dump_entities(dump_path):
+        person = extract_person(entity)
+        if person is None:
+            continue
+
+        batch.append(person)
+        if len(batch) >= batch_size:
+            connection.executemany(statement, batch)
+            connection.commit()
+            written += len(batch)
+            batch = []
+
+    connection.executemany(statement, batch)
+    connection.commit()
+    written += len(batch)
+    connection.close()
+
+    return written
+
+
+class WikidataDumpIndex:
+    """Read side of the dump index, safe to share across threads"""
+
+    def __init__(self, index_path):
+        self.connection = sqlite3.connect(index_path, check_same_thread=False)
+        self.lock = threading.Lock()
+
+    def _query(self, statement, params):
+        with self.lock:
+            return self.connection.execute(statement, params).fetchall()
+
+    def get_wiki_ids(self, page_titles):
+        """Look up Q numbers for page titles
+
+        Args:
+            page_titles (list): Page URL titles (end of URL)
+
+        Returns:
+            dict: Page title to Q number, only for titles found in the index
+        """
+        normalized = {normalize_title(title): title for title in page_titles}
+        wiki_ids = {}
+
+        names = list(normalized)
+        for i in range(0, len(names), 500):
+            chunk = names[i:i + 500]
+            placeholders = ", ".join("?" * len(chunk))
+            rows = self._query(
+                f"SELECT enwiki_title, wiki_id FROM people "
+                f"WHERE enwiki_title IN ({placeholders})",
+                chunk,
+            )
+            for enwiki_title, wiki_id in rows:
+                wiki_ids[normalized[enwiki_title]] = wiki_id
+
+        return wiki_ids
+
+    def get_claim(self, wikidata_prop_id, wikidata_q_number):
+        """Look up a birth (P569) or death (P570) time and precision
+
+        Args:
+            wikidata_prop_id (str): P569 or P570
+            wikidata_q_number (str): Wiki Data ID (Q Number)
+
+        Returns:
+            tuple: (time, precision), (None, None) when the person is indexed
+            without the claim, or None when the person isn't in the index
+        """
+        column = {"P569": "birth", "P570": "death"}[wikidata_prop_id]
+        rows = self._query(
+            f"SELECT {column}_time, {column}_precision FROM people WHERE wiki_id = ?",
+            (wikidata_q_number,),
+        )
+        return rows[0] if rows else None
+
+    def get_people(self, wiki_ids):
+        """Look up the birth and death claims of many people at once
+
+        Args:
+            wiki_ids (list): Wiki Data IDs (Q Numbers)
+
+        Returns:
+            dict: Q number to (birth_time, birth_precision, death_time,
+            death_precision), only for people found in the index
+        """
+        people = {}
+        for i in range(0, len(wiki_ids), 500):
+            chunk = wiki_ids[i:i + 500]
+            placeholders = ", ".join("?" * len(chunk))
+            rows = self._query(
+                f"SELECT wiki_id, birth_time, birth_precision, death_time, "
+                f"death_precision FROM people WHERE wiki_id IN ({placeholders})",
+                chunk,
+            )
+            for wiki_id, *claims in rows:
+                people[wiki_id] = tuple(claims)
+
+        return people
+
+
+_dump_index = None
+
+
+def get_dump_index():
+    """Return the index named by WIKIDATA_DUMP_INDEX, or None if there isn't one"""
+    global _dump_index
+
+    index_path = os.getenv("WIKIDATA_DUMP_INDEX")
+    if not index_path or not os.path.exists(index_path):
+        return None
+
+    if _dump_index is None:
+        _dump_index = WikidataDumpIndex(index_path)
+    return _dump_index
+
+
+if __name__ == "__main__":
+    count = build_dump_index(sys.argv[1], sys.argv[2])
+    print(f"Indexed {count} people into {sys.argv[2]}")